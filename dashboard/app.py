@@ -1,64 +1,257 @@
 import streamlit as st
+import streamlit.components.v1 as components
 from PIL import Image
+import hashlib
 import os
-import tempfile
-from ultralytics import YOLO
+import sys
+import threading
+import time
 import numpy as np
 
+# Make the `src` package importable when launched with `streamlit run dashboard/app.py`
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.inference.backends import load_detector, prepare_image
+from src.inference.boxes import concat_detections
+from src.inference.cache import CachedDetector, ResultCache
+from src.inference.catalog import pixel_boxes_to_lunar
+from src.inference.jobs import JobQueue
+from src.inference.predict import draw_detections, iter_batches
+from src.inference.raster import SceneReader, decode_image_bytes
+from src.inference.sliced import sliced_detect
+from src.inference.tiles import TiledScene, create_tile_server, load_scene_detections, viewer_html
+
 # --- Configuration ---
-# This path points to the actual output of the YOLOv8 training script
+# This path points to the actual output of the YOLOv8 training script.
+# An exported .onnx model (see src/inference/export.py) is served with ONNX Runtime.
 MODEL_PATH = "runs/train/yolo_lunar_detector/weights/best.pt"
+INFERENCE_BACKEND = "auto"
+NUM_THREADS = None
+SLICE_SIZE = 640
+BATCH_SIZE = 8
+PREVIEW_SIZE = 1024
+CACHE_DIR = "runs/cache"
+# Analysis jobs run on this many background threads, shared by all sessions.
+JOB_WORKERS = 1
+POLL_SECONDS = 0.5
+# Tiles for the deep-zoom viewer are served next to the dashboard. The viewer fetches them
+# from the analyst's browser, so when the dashboard is shared set TILE_HOST to 0.0.0.0 and
+# TILE_URL to the address browsers reach the tile server at (e.g. http://moonlab:8766).
+TILE_HOST = os.environ.get("CHANDRA_TILE_HOST", "127.0.0.1")
+TILE_PORT = int(os.environ.get("CHANDRA_TILE_PORT", "8766"))
+TILE_URL = os.environ.get("CHANDRA_TILE_URL", f"http://localhost:{TILE_PORT}")
+VIEWER_HEIGHT = 720
 
-def run_detection(image_path, model):
+@st.cache_resource(show_spinner="Loading model...")
+def get_detector(model_path, backend=INFERENCE_BACKEND, num_threads=NUM_THREADS):
     """
-    Runs YOLOv8 detection on an image and returns the annotated image.
+    Loads the detector once per server process; every session and job shares it.
     """
-    results = model(image_path)
-    annotated_image_array = results[0].plot()
-    annotated_image_rgb = Image.fromarray(annotated_image_array[..., ::-1])
-    return annotated_image_rgb
+    model = load_detector(model_path, backend=backend, num_threads=num_threads)
+    return CachedDetector(model, ResultCache(CACHE_DIR), model_path)
 
-def main():
+@st.cache_resource
+def get_job_queue():
+    """The background analysis queue shared by every session."""
+    return JobQueue(num_workers=JOB_WORKERS)
+
+@st.cache_resource
+def get_tile_scenes():
     """
-    Main function for the Streamlit dashboard.
+    Starts the tile server once per process; returns its (mutable) scene registry.
     """
-    st.set_page_config(page_title="ChandraSlide Detector", layout="wide")
+    scenes = {}
+    server = create_tile_server(scenes, TILE_HOST, TILE_PORT)
+    threading.Thread(target=server.serve_forever, name='tile-server', daemon=True).start()
+    return scenes
 
-    st.title("🌑 ChandraSlide: Lunar Rockfall Detection")
-    st.markdown("Upload a lunar image to detect potential rockfalls using our trained YOLOv8 model.")
+@st.cache_resource(show_spinner="Opening scene...")
+def get_tiled_scene(scene_path, mask_path=None, detections_path=None):
+    """Opens a scene for tiling once; its tile cache is shared by every session."""
+    detections = load_scene_detections(detections_path, scene_path) if detections_path else None
+    return TiledScene(scene_path, mask=mask_path, detections=detections)
 
-    st.sidebar.header("Controls")
-    uploaded_image = st.sidebar.file_uploader("Upload Lunar Image", type=["tif", "png", "jpg", "jpeg"])
+def decode_upload(uploaded_file):
+    """
+    Decodes an upload once, in memory, keeping its bit depth and georeferencing.
+    """
+    buffer = uploaded_file.getbuffer()
+    array, transform, crs = decode_image_bytes(buffer, uploaded_file.name)
+    return {'name': uploaded_file.name, 'hash': hashlib.sha256(buffer).hexdigest(),
+            'image': array, 'transform': transform, 'crs': crs}
+
+def decode_uploads(uploaded_files):
+    """
+    Decodes new uploads once per session; reruns (e.g. while polling a job) reuse them.
+    """
+    decoded = st.session_state.setdefault('decoded_uploads', {})
+    keys = [getattr(uploaded_file, 'file_id', None) or (uploaded_file.name, uploaded_file.size)
+            for uploaded_file in uploaded_files]
+    for key, uploaded_file in zip(keys, uploaded_files):
+        if key not in decoded:
+            decoded[key] = decode_upload(uploaded_file)
+    # Forget files that were removed from the uploader.
+    for key in set(decoded) - set(keys):
+        del decoded[key]
+    return [decoded[key] for key in keys]
+
+def preview_image(image, max_size=PREVIEW_SIZE):
+    """An 8-bit RGB preview of an image array, downsampled to at most `max_size` pixels."""
+    height, width = image.shape[:2]
+    factor = max(1.0, max(height, width) / max_size)
+    small = SceneReader(image).read_resampled(0, 0, height, width, max(1, round(height / factor)),
+                                              max(1, round(width / factor)))
+    return prepare_image(small)
+
+def _file_result(upload, detections):
+    result = {'name': upload['name'], 'detections': detections,
+              'annotated': Image.fromarray(draw_detections(upload['image'], detections))}
+    if upload['transform'] is not None and len(detections['boxes']):
+        # Georeferenced uploads also get lunar coordinates for every box.
+        result['lunar_boxes'] = pixel_boxes_to_lunar(detections['boxes'], upload['transform'], upload['crs'])
+    return result
+
+def run_batch_detection(uploads, model, sliced=False, progress=None):
+    """
+    Runs YOLOv8 detection on decoded uploads and publishes each file's result as it finishes.
+
+    Images are passed to the model as decoded (any bit depth); whole images go
+    through the model `BATCH_SIZE` at a time, while `sliced=True` processes
+    each image at full resolution in overlapping slices.
+    `progress`, if given, is called with the fraction done and each file's result.
+    """
+    results = []
+
+    def publish(result):
+        results.append(result)
+        if progress is not None:
+            progress(len(results) / len(uploads), f"Processed {len(results)}/{len(uploads)} files", item=result)
+
+    if sliced:
+        for upload in uploads:
+            def slice_progress(fraction):
+                if progress is not None:
+                    progress((len(results) + fraction) / len(uploads), f"Slicing {upload['name']}")
 
-    if uploaded_image is not None:
-        original_image = Image.open(uploaded_image).convert("RGB")
-        st.sidebar.image(original_image, caption="Uploaded Image", use_column_width='always')
+            detections = concat_detections(list(sliced_detect(model, upload['image'], slice_size=SLICE_SIZE,
+                                                              progress=slice_progress)))
+            publish(_file_result(upload, detections))
+    else:
+        for batch in iter_batches(uploads, BATCH_SIZE):
+            for upload, detections in zip(batch, model.predict([upload['image'] for upload in batch])):
+                publish(_file_result(upload, detections))
+    return results
+
+def show_result(result):
+    """Shows one file's annotated image and detections."""
+    st.subheader(result['name'])
+    st.image(result['annotated'], caption=f"{len(result['detections']['boxes'])} detections",
+             use_column_width='always')
+    if 'lunar_boxes' in result:
+        lunar = result['lunar_boxes']
+        st.dataframe({'lon': (lunar[:, 0] + lunar[:, 2]) / 2, 'lat': (lunar[:, 1] + lunar[:, 3]) / 2,
+                      'score': result['detections']['scores']})
+
+def show_job(job):
+    """
+    Shows a job's progress and the files finished so far, re-running the page until it finishes.
+    """
+    if job.status == 'failed':
+        st.error(f"Detection failed: {job.error}")
+    elif job.status == 'done':
+        st.success(f"Detection Complete! ({job.finished - job.started:.1f}s)")
+    else:
+        st.progress(job.progress, text=job.message)
+    for result in list(job.partial):
+        show_result(result)
+    if not job.done:
+        # Inference runs on the queue's worker; this session only polls its status.
+        time.sleep(POLL_SECONDS)
+        st.rerun()
+
+def detection_page():
+    """
+    Upload one or many images and detect rockfalls on them.
+    """
+    st.markdown("Upload lunar images to detect potential rockfalls using our trained YOLOv8 model.")
+    uploaded_files = st.sidebar.file_uploader("Upload Lunar Images", type=["tif", "tiff", "png", "jpg", "jpeg"],
+                                              accept_multiple_files=True)
+
+    if uploaded_files:
+        try:
+            uploads = decode_uploads(uploaded_files)
+        except Exception as e:
+            st.error(f"Could not decode the upload: {e}")
+            return
+        if len(uploads) == 1:
+            image = uploads[0]['image']
+            st.sidebar.image(preview_image(image), caption=f"Uploaded Image ({image.dtype}, {image.shape[1]}x{image.shape[0]})",
+                             use_column_width='always')
+        else:
+            st.sidebar.write(f"{len(uploads)} images uploaded.")
+        largest = max(max(upload['image'].shape[:2]) for upload in uploads)
+        sliced = st.sidebar.checkbox("Sliced inference (large scenes)",
+                                     value=largest > 2 * SLICE_SIZE,
+                                     help="Detect on overlapping full-resolution slices instead of downsampling the whole image.")
+        # Results are keyed by the uploads' content, so re-running analysed images is instant.
+        job_key = (tuple(upload['hash'] for upload in uploads), MODEL_PATH, sliced)
+        queue = get_job_queue()
 
         if st.sidebar.button("Detect Rockfalls"):
             if not os.path.exists(MODEL_PATH):
                 st.error(f"Model not found at {MODEL_PATH}. Please ensure the training process has completed successfully.")
                 return
 
-            with st.spinner('Model is running...'):
-                try:
-                    model = YOLO(MODEL_PATH)
-                except Exception as e:
-                    st.error(f"Error loading the model: {e}")
-                    return
+            try:
+                model = get_detector(MODEL_PATH)
+            except Exception as e:
+                st.error(f"Error loading the model: {e}")
+                return
+            queue.submit(job_key, run_batch_detection, uploads, model, sliced=sliced)
+
+        job = queue.get(job_key)
+        if job is not None:
+            show_job(job)
 
-                with tempfile.NamedTemporaryFile(delete=False, suffix=".jpg") as tfile:
-                    # Open the uploaded image with PIL
-                    img = Image.open(uploaded_image).convert("RGB")
-                    # Save the converted 3-channel image as a JPEG to the temp file
-                    img.save(tfile, 'jpeg')
-                    temp_image_path = tfile.name
+def viewer_page():
+    """
+    Browse a converted full-size scene as deep-zoom tiles, with mask and detection overlays.
+    """
+    st.markdown("Browse a full OHRC/NAC strip or DTM on the server. Tiles are rendered on demand, "
+                "so add overviews to large GeoTIFFs first (`python -m src.inference.tiles scene.tif --build-overviews`).")
+    scene_path = st.sidebar.text_input("Scene (GeoTIFF or .npy)", "data/converted/ohrc_scene.tif")
+    mask_path = st.sidebar.text_input("Landslide mask (optional)", "")
+    detections_path = st.sidebar.text_input("Detections Parquet (optional)", "")
+
+    if not os.path.exists(scene_path):
+        st.info("Enter the path of a scene on the server.")
+        return
+    for path in (mask_path, detections_path):
+        if path and not os.path.exists(path):
+            st.error(f"File not found: {path}")
+            return
 
-                annotated_image = run_detection(temp_image_path, model)
+    scene = get_tiled_scene(scene_path, mask_path or None, detections_path or None)
+    name = hashlib.sha256(f"{scene_path}|{mask_path}|{detections_path}".encode()).hexdigest()[:16]
+    get_tile_scenes()[name] = scene
+    info = scene.info()
+    st.caption(f"{info['width']} x {info['height']} px, {info['max_zoom'] + 1} zoom levels, "
+               f"{info['detections']} detections")
+    components.html(viewer_html(TILE_URL, name, info, VIEWER_HEIGHT), height=VIEWER_HEIGHT + 20)
 
-                st.success("Detection Complete!")
-                st.image(annotated_image, caption="Detection Results", use_column_width='always')
+def main():
+    """
+    Main function for the Streamlit dashboard.
+    """
+    st.set_page_config(page_title="ChandraSlide Detector", layout="wide")
 
-                os.remove(temp_image_path)
+    st.title("🌑 ChandraSlide: Lunar Rockfall Detection")
+    st.sidebar.header("Controls")
+    mode = st.sidebar.radio("Mode", ["Detect", "Scene viewer"])
+    if mode == "Detect":
+        detection_page()
+    else:
+        viewer_page()
 
 if __name__ == '__main__':
     main()
@@ -0,0 +1,258 @@
+import argparse
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from src.inference.catalog import LUNAR_CRS, MOON_RADIUS_M, pixel_points_to_lunar, pixel_size_m, read_georeference
+
+# --- Configuration ---
+DEFAULT_MIN_DIAMETER_M = 0.25
+DEFAULT_MAX_DIAMETER_M = 250.0
+DEFAULT_BINS_PER_DECADE = 10
+DEFAULT_CELL_DEG = 0.1
+GLOBAL_BOUNDS = (-180.0, -90.0, 180.0, 90.0)
+DEFAULT_BATCH_ROWS = 262144
+
+class SizeFrequencyAccumulator:
+    """
+    Log-binned boulder size histogram with a fixed memory footprint.
+
+    Diameters below or above the binned range are counted separately, so no
+    detection is lost. Accumulators with the same bins can be merged, which
+    makes per-process partial results combinable.
+    """
+    def __init__(self, min_diameter=DEFAULT_MIN_DIAMETER_M, max_diameter=DEFAULT_MAX_DIAMETER_M,
+                 bins_per_decade=DEFAULT_BINS_PER_DECADE):
+        num_bins = int(np.ceil(np.log10(max_diameter / min_diameter) * bins_per_decade))
+        self.edges = min_diameter * 10.0 ** (np.arange(num_bins + 1) / bins_per_decade)
+        self.counts = np.zeros(num_bins, dtype=np.int64)
+        self.underflow = 0
+        self.overflow = 0
+
+    def update(self, diameters):
+        """Adds a batch of diameters, in meters."""
+        diameters = np.asarray(diameters, dtype=np.float64)
+        index = np.searchsorted(self.edges, diameters, side='right') - 1
+        self.underflow += int(np.count_nonzero(index < 0))
+        self.overflow += int(np.count_nonzero(index >= len(self.counts)))
+        inside = index[(index >= 0) & (index < len(self.counts))]
+        self.counts += np.bincount(inside, minlength=len(self.counts))
+
+    def merge(self, other):
+        """Adds the counts of another accumulator with the same bins."""
+        if not np.array_equal(self.edges, other.edges):
+            raise ValueError("Cannot merge size-frequency accumulators with different bins.")
+        self.counts += other.counts
+        self.underflow += other.underflow
+        self.overflow += other.overflow
+        return self
+
+    @property
+    def total(self):
+        return int(self.counts.sum()) + self.underflow + self.overflow
+
+    def cumulative(self):
+        """
+        Cumulative size-frequency distribution.
+
+        Returns:
+            tuple: (diameters, counts), the number of boulders at least as large
+                   as each lower bin edge (boulders above the range included).
+        """
+        return self.edges[:-1], np.cumsum(self.counts[::-1])[::-1] + self.overflow
+
+class DensityGrid:
+    """
+    Boulder counts on a regular longitude/latitude grid, with a fixed memory footprint.
+
+    Points outside `bounds` are counted in `outside`. Grids with the same
+    bounds and cell size can be merged.
+    """
+    def __init__(self, bounds=GLOBAL_BOUNDS, cell_deg=DEFAULT_CELL_DEG):
+        self.bounds = tuple(float(b) for b in bounds)
+        self.cell_deg = cell_deg
+        lon_min, lat_min, lon_max, lat_max = self.bounds
+        self.width = int(np.ceil((lon_max - lon_min) / cell_deg))
+        self.height = int(np.ceil((lat_max - lat_min) / cell_deg))
+        # Row 0 is the northern edge, as in a north-up raster.
+        self.counts = np.zeros((self.height, self.width), dtype=np.int64)
+        self.outside = 0
+
+    def update(self, lon, lat):
+        """Adds a batch of boulder positions, in degrees."""
+        lon_min, _, _, lat_max = self.bounds
+        col = np.floor((np.asarray(lon) - lon_min) / self.cell_deg).astype(np.int64)
+        row = np.floor((lat_max - np.asarray(lat)) / self.cell_deg).astype(np.int64)
+        inside = (col >= 0) & (col < self.width) & (row >= 0) & (row < self.height)
+        self.outside += int(np.count_nonzero(~inside))
+        # Only the touched cells are updated, so a batch costs nothing per empty cell.
+        cells, counts = np.unique(row[inside] * self.width + col[inside], return_counts=True)
+        self.counts.ravel()[cells] += counts
+
+    def merge(self, other):
+        """Adds the counts of another grid with the same bounds and cell size."""
+        if (self.bounds, self.cell_deg) != (other.bounds, other.cell_deg):
+            raise ValueError("Cannot merge density grids with different extents.")
+        self.counts += other.counts
+        self.outside += other.outside
+        return self
+
+    def cell_areas_km2(self):
+        """Area of each grid row's cells on the lunar sphere, in km^2 (shape (height, 1))."""
+        lat_top = self.bounds[3] - np.arange(self.height) * self.cell_deg
+        lat_bottom = np.maximum(lat_top - self.cell_deg, self.bounds[1])
+        band = np.sin(np.radians(lat_top)) - np.sin(np.radians(lat_bottom))
+        return ((MOON_RADIUS_M / 1000.0) ** 2 * np.radians(self.cell_deg) * band)[:, None]
+
+    def density_per_km2(self):
+        """Boulders per km^2 in each cell."""
+        return self.counts / self.cell_areas_km2()
+
+    def save_geotiff(self, path):
+        """Writes the density (boulders per km^2) as a float32 GeoTIFF in Moon 2015 coordinates."""
+        import rasterio
+        from rasterio.transform import from_origin
+
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        profile = {'driver': 'GTiff', 'height': self.height, 'width': self.width, 'count': 1, 'dtype': 'float32',
+                   'crs': LUNAR_CRS, 'transform': from_origin(self.bounds[0], self.bounds[3], self.cell_deg, self.cell_deg),
+                   'compress': 'deflate', 'tiled': True}
+        with rasterio.open(path, 'w', **profile) as dst:
+            dst.write(self.density_per_km2().astype(np.float32), 1)
+
+def boulder_diameters(boxes, pixel_scale):
+    """
+    Boulder diameters in meters: the mean of the box width and height, scaled by the pixel size.
+
+    `pixel_scale` is one size for square pixels, or an (x size, y size) pair
+    whose entries may be per-box arrays (see `pixel_size_m`).
+    """
+    boxes = np.asarray(boxes, dtype=np.float64)
+    x_scale, y_scale = pixel_scale if isinstance(pixel_scale, tuple) else (pixel_scale, pixel_scale)
+    return ((boxes[:, 2] - boxes[:, 0]) * x_scale + (boxes[:, 3] - boxes[:, 1]) * y_scale) / 2
+
+def _new_accumulators(size_kwargs, grid_kwargs):
+    return SizeFrequencyAccumulator(**size_kwargs), DensityGrid(**grid_kwargs)
+
+def _accumulate_file(detections_path, size_kwargs, grid_kwargs, class_id, min_score, batch_rows):
+    """Streams one results file into a fresh pair of accumulators."""
+    import pyarrow.parquet as pq
+
+    sizes, density = _new_accumulators(size_kwargs, grid_kwargs)
+    georeferences = {}
+    skipped = 0
+    # Dictionary-encoded paths group the rows by image without comparing strings.
+    results = pq.ParquetFile(detections_path, read_dictionary=['image_path'])
+    for batch in results.iter_batches(batch_size=batch_rows,
+                                      columns=['image_path', 'xmin', 'ymin', 'xmax', 'ymax', 'score', 'class_id']):
+        keep = batch.column('score').to_numpy() >= min_score
+        if class_id is not None:
+            keep &= batch.column('class_id').to_numpy() == class_id
+        paths = batch.column('image_path')
+        image_ids = paths.indices.to_numpy()[keep]
+        boxes = np.stack([batch.column(name).to_numpy() for name in ('xmin', 'ymin', 'xmax', 'ymax')], axis=1)[keep]
+        rows_by_image = np.split(np.argsort(image_ids, kind='stable'),
+                                 np.cumsum(np.bincount(image_ids, minlength=len(paths.dictionary)))[:-1])
+        for image_path, rows in zip(paths.dictionary.to_pylist(), rows_by_image):
+            if len(rows) == 0:
+                continue
+            if image_path not in georeferences:
+                georeferences[image_path] = read_georeference(image_path)
+            if georeferences[image_path] is None:
+                skipped += len(rows)
+                continue
+            transform, crs = georeferences[image_path]
+            image_boxes = boxes[rows]
+            # Only box centers are located: the density grid is far coarser than a boulder.
+            lon, lat = pixel_points_to_lunar((image_boxes[:, 0] + image_boxes[:, 2]) / 2,
+                                             (image_boxes[:, 1] + image_boxes[:, 3]) / 2, transform, crs)
+            sizes.update(boulder_diameters(image_boxes, pixel_size_m(transform, crs, lat)))
+            density.update(lon, lat)
+    return sizes, density, skipped
+
+def accumulate_boulder_statistics(detections_paths, bounds=GLOBAL_BOUNDS, cell_deg=DEFAULT_CELL_DEG,
+                                  min_diameter=DEFAULT_MIN_DIAMETER_M, max_diameter=DEFAULT_MAX_DIAMETER_M,
+                                  bins_per_decade=DEFAULT_BINS_PER_DECADE, class_id=None, min_score=0.0,
+                                  num_workers=None, batch_rows=DEFAULT_BATCH_ROWS):
+    """
+    Computes boulder size-frequency and density statistics in one streaming pass.
+
+    Each results file is read in record batches and folded into fixed-size
+    accumulators, so memory does not grow with the number of detections.
+    Files are processed in parallel and their accumulators merged. Diameters
+    use the ground pixel size of each scene (see `pixel_size_m`), so scenes
+    in geographic CRSs are converted from degrees; images without
+    georeferencing are skipped.
+
+    Args:
+        detections_paths (list): Parquet results files from `predict.py` or `sliced.py`.
+        bounds (tuple): (lon_min, lat_min, lon_max, lat_max) of the density grid.
+        cell_deg (float): Density grid cell size in degrees.
+        min_diameter (float): Lower edge of the size histogram, in meters.
+        max_diameter (float): Upper edge of the size histogram, in meters.
+        bins_per_decade (int): Logarithmic histogram bins per factor of ten.
+        class_id (int, optional): Only count this class.
+        min_score (float): Only count detections at least this confident.
+        num_workers (int, optional): Worker processes; defaults to the CPU count.
+        batch_rows (int): Detections read at a time.
+
+    Returns:
+        tuple: (SizeFrequencyAccumulator, DensityGrid).
+    """
+    print("--- Accumulating Boulder Statistics ---")
+    size_kwargs = {'min_diameter': min_diameter, 'max_diameter': max_diameter, 'bins_per_decade': bins_per_decade}
+    grid_kwargs = {'bounds': bounds, 'cell_deg': cell_deg}
+    sizes, density = _new_accumulators(size_kwargs, grid_kwargs)
+    skipped = 0
+
+    if len(detections_paths) == 1 or num_workers == 1:
+        partials = (_accumulate_file(path, size_kwargs, grid_kwargs, class_id, min_score, batch_rows)
+                    for path in detections_paths)
+        for part_sizes, part_density, part_skipped in partials:
+            sizes.merge(part_sizes)
+            density.merge(part_density)
+            skipped += part_skipped
+    else:
+        with ProcessPoolExecutor(max_workers=num_workers) as pool:
+            futures = [pool.submit(_accumulate_file, path, size_kwargs, grid_kwargs, class_id, min_score, batch_rows)
+                       for path in detections_paths]
+            for future in futures:
+                part_sizes, part_density, part_skipped = future.result()
+                sizes.merge(part_sizes)
+                density.merge(part_density)
+                skipped += part_skipped
+
+    if skipped:
+        print(f"Skipped {skipped} detections from images without georeferencing.")
+    print(f"Accumulated {sizes.total} boulders from {len(detections_paths)} results files.")
+    return sizes, density
+
+def save_size_frequency(sizes, path):
+    """Writes the binned and cumulative size-frequency distribution to CSV."""
+    import pandas as pd
+
+    diameters, cumulative = sizes.cumulative()
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    pd.DataFrame({
+        'diameter_min_m': sizes.edges[:-1], 'diameter_max_m': sizes.edges[1:],
+        'count': sizes.counts, 'cumulative_count': cumulative,
+    }).to_csv(path, index=False)
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Boulder size-frequency and density statistics from detection results.")
+    parser.add_argument("detections", nargs='+', help="Parquet results files from predict.py or sliced.py.")
+    parser.add_argument("--output-dir", default='runs/statistics', help="Where the CSV and density GeoTIFF are written.")
+    parser.add_argument("--cell-deg", type=float, default=DEFAULT_CELL_DEG, help="Density grid cell size in degrees.")
+    parser.add_argument("--bounds", type=float, nargs=4, default=GLOBAL_BOUNDS,
+                        metavar=('LON_MIN', 'LAT_MIN', 'LON_MAX', 'LAT_MAX'), help="Density grid extent.")
+    parser.add_argument("--min-score", type=float, default=0.0, help="Only count detections at least this confident.")
+    parser.add_argument("--workers", type=int, default=None, help="Worker processes.")
+    args = parser.parse_args()
+
+    size_frequency, density_grid = accumulate_boulder_statistics(args.detections, bounds=args.bounds,
+                                                                 cell_deg=args.cell_deg, min_score=args.min_score,
+                                                                 num_workers=args.workers)
+    save_size_frequency(size_frequency, os.path.join(args.output_dir, 'size_frequency.csv'))
+    density_grid.save_geotiff(os.path.join(args.output_dir, 'boulder_density.tif'))
+    print(f"Statistics saved to: {args.output_dir}")
@@ -0,0 +1,251 @@
+import argparse
+import os
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import numpy as np
+
+from src.analysis.regions import measure_regions
+from src.analysis.temporal_analysis import align_before_image, compute_change_mask, estimate_data_range
+from src.inference.raster import SceneReader
+
+# --- Configuration ---
+SCENE_CACHE_SIZE = 4
+MIN_REGION_PX = 25
+CHANGE_CATALOG_COLUMNS = ('before_path', 'after_path', 'before_time', 'after_time', 'region_id',
+                          'xmin', 'ymin', 'xmax', 'ymax', 'area_px', 'area_m2', 'pair_mean_ssim')
+
+# Scenes opened by this worker process, most recently used last.
+_scene_cache = OrderedDict()
+
+def _parse_tiff_datetime(value):
+    """Parses a TIFFTAG_DATETIME value ('YYYY:MM:DD HH:MM:SS')."""
+    import pandas as pd
+
+    date, _, clock = value.partition(' ')
+    return pd.Timestamp(f"{date.replace(':', '-')} {clock}".strip())
+
+def load_scene_footprints(scene_paths, acquisition_times=None):
+    """
+    Reads the footprint and acquisition time of each georeferenced scene.
+
+    Args:
+        scene_paths (list): GeoTIFF (or other rasterio-readable) scene paths.
+        acquisition_times (dict, optional): Path -> acquisition time. Scenes not
+            listed fall back to their TIFFTAG_DATETIME tag.
+
+    Returns:
+        list: One dict per scene with 'path', 'acquired' (pandas Timestamp),
+              'bounds' (left, bottom, right, top) and 'crs'.
+    """
+    import pandas as pd
+    import rasterio
+
+    scenes = []
+    for path in scene_paths:
+        with rasterio.open(path) as dataset:
+            if acquisition_times and path in acquisition_times:
+                acquired = pd.Timestamp(acquisition_times[path])
+            elif 'TIFFTAG_DATETIME' in dataset.tags():
+                acquired = _parse_tiff_datetime(dataset.tags()['TIFFTAG_DATETIME'])
+            else:
+                raise ValueError(f"No acquisition time for {path}; pass it in `acquisition_times`.")
+            scenes.append({'path': path, 'acquired': acquired, 'bounds': tuple(dataset.bounds), 'crs': dataset.crs})
+    return scenes
+
+def find_overlapping_pairs(scenes, min_overlap_area=0.0):
+    """
+    Enumerates every pair of scenes whose footprints overlap.
+
+    Footprints are indexed in an STR-tree, so each scene is only tested
+    against the scenes near it. Each pair is ordered (before, after) by
+    acquisition time, and pairs are sorted by the after time, then the before time.
+
+    Args:
+        scenes (list): Output of `load_scene_footprints`.
+        min_overlap_area (float): Smallest overlap, in squared CRS units, worth comparing.
+
+    Returns:
+        list: Dicts with 'before' and 'after' (scene dicts) and 'overlap' bounds.
+    """
+    import shapely
+
+    footprints = [shapely.box(*scene['bounds']) for scene in scenes]
+    tree = shapely.STRtree(footprints)
+    pairs = []
+    for i, footprint in enumerate(footprints):
+        for j in tree.query(footprint, predicate='intersects'):
+            if j <= i or scenes[i]['crs'] != scenes[j]['crs']:
+                continue
+            overlap = footprint.intersection(footprints[j])
+            if overlap.area <= min_overlap_area:
+                continue
+            before, after = sorted((scenes[i], scenes[j]), key=lambda scene: (scene['acquired'], scene['path']))
+            if before['acquired'] == after['acquired']:
+                continue
+            pairs.append({'before': before, 'after': after, 'overlap': overlap.bounds})
+    pairs.sort(key=lambda pair: (pair['after']['acquired'], pair['before']['acquired'], pair['before']['path']))
+    return pairs
+
+def _open_scene(path):
+    """Returns an open `SceneReader`, reusing the ones this process opened recently."""
+    if path in _scene_cache:
+        _scene_cache.move_to_end(path)
+        return _scene_cache[path]
+    reader = SceneReader(path)
+    _scene_cache[path] = reader
+    if len(_scene_cache) > SCENE_CACHE_SIZE:
+        _scene_cache.popitem(last=False)[1].close()
+    return reader
+
+def _read_overlap(reader, bounds):
+    """
+    Reads the first band of a scene inside `bounds`, with the window's transform.
+
+    The rounded window is clipped to the scene first, so the transform
+    describes exactly the pixels that were read.
+    """
+    from rasterio.windows import Window, from_bounds, transform as window_transform
+
+    window = from_bounds(*bounds, transform=reader.transform).round_offsets().round_lengths()
+    window = window.intersection(Window(0, 0, reader.width, reader.height))
+    pixels = reader.read(int(window.row_off), int(window.col_off), int(window.height), int(window.width))
+    pixels = pixels[..., 0] if pixels.ndim == 3 else pixels
+    return np.ascontiguousarray(pixels), window_transform(window, reader.transform)
+
+def compare_pair(pair, min_region_px=MIN_REGION_PX, coregistration_cache_dir=None):
+    """
+    Detects changes inside the overlap of one before/after pair.
+
+    Returns:
+        list: One catalog row (dict) per change region, with bounds in the after scene's CRS.
+    """
+    before, after = pair['before'], pair['after']
+    before_pixels, before_transform = _read_overlap(_open_scene(before['path']), pair['overlap'])
+    after_pixels, after_transform = _read_overlap(_open_scene(after['path']), pair['overlap'])
+
+    # On a shared pixel grid, window rounding can only differ by a pixel; trim instead of resampling.
+    if (before_transform.a, before_transform.e) == (after_transform.a, after_transform.e):
+        height = min(before_pixels.shape[0], after_pixels.shape[0])
+        width = min(before_pixels.shape[1], after_pixels.shape[1])
+        before_pixels, after_pixels = before_pixels[:height, :width], after_pixels[:height, :width]
+
+    coverage = None
+    if before_pixels.shape != after_pixels.shape:
+        aligned, coverage, _ = align_before_image(before_pixels.astype(np.float32), after_pixels.astype(np.float32),
+                                                  coregistration_cache_dir)
+        if np.issubdtype(after_pixels.dtype, np.integer):
+            aligned = np.rint(aligned)
+        before_pixels = aligned.astype(after_pixels.dtype)
+    reader_before, reader_after = SceneReader(before_pixels), SceneReader(after_pixels)
+    data_range = None
+    if not np.issubdtype(after_pixels.dtype, np.integer):
+        data_range = estimate_data_range(reader_before, reader_after)
+    # Pairs already run in parallel across processes.
+    change_mask, mean_ssim = compute_change_mask(reader_before, reader_after, data_range=data_range, num_threads=1)
+    if coverage is not None:
+        change_mask[~coverage] = 0
+
+    regions = measure_regions(change_mask)
+    keep = np.flatnonzero(regions['area_px'] >= min_region_px)
+    x0, y0 = after_transform * (regions['bbox_min_col'][keep], regions['bbox_min_row'][keep])
+    x1, y1 = after_transform * (regions['bbox_max_col'][keep] + 1, regions['bbox_max_row'][keep] + 1)
+    pixel_area = abs(after_transform.a * after_transform.e)
+    return [{
+        'before_path': before['path'], 'after_path': after['path'],
+        'before_time': before['acquired'], 'after_time': after['acquired'], 'region_id': region_id,
+        'xmin': min(x0[region_id], x1[region_id]), 'ymin': min(y0[region_id], y1[region_id]),
+        'xmax': max(x0[region_id], x1[region_id]), 'ymax': max(y0[region_id], y1[region_id]),
+        'area_px': int(regions['area_px'][k]), 'area_m2': regions['area_px'][k] * pixel_area,
+        'pair_mean_ssim': mean_ssim,
+    } for region_id, k in enumerate(keep)]
+
+def _compare_group(pairs, min_region_px, coregistration_cache_dir):
+    """
+    Runs the pairs that share an after scene in one worker, so it is opened once.
+
+    A pair that fails is reported and skipped, so the rest of the group still runs.
+    """
+    rows = []
+    for pair in pairs:
+        try:
+            rows.extend(compare_pair(pair, min_region_px, coregistration_cache_dir))
+        except Exception as e:
+            print(f"Warning: Could not compare {pair['before']['path']} with {pair['after']['path']}, skipping: {e}")
+    return rows
+
+def run_change_detection(scene_paths, output_path='runs/changes/change_catalog.parquet', acquisition_times=None,
+                         num_workers=None, min_overlap_area=0.0, min_region_px=MIN_REGION_PX,
+                         coregistration_cache_dir=None):
+    """
+    Runs change detection over every overlapping before/after pair of a scene collection.
+
+    Pairs are grouped by their after scene and the groups are spread over a
+    process pool. Each worker keeps its most recently opened scenes, so a
+    scene shared by consecutive pairs is not reopened. A before scene that
+    pairs with several after scenes may still be opened once per group, in
+    different workers; grouping by connected scene sets would avoid that,
+    but a chain of overlapping scenes would then run as one serial group.
+
+    Args:
+        scene_paths (list): Georeferenced scene paths.
+        output_path (str): Change catalog (.parquet or .csv), one row per change region.
+        acquisition_times (dict, optional): Path -> acquisition time.
+        num_workers (int, optional): Worker processes; defaults to the CPU count.
+        min_overlap_area (float): Smallest footprint overlap worth comparing, in squared CRS units.
+        min_region_px (int): Smallest change region kept in the catalog.
+        coregistration_cache_dir (str, optional): Where pair transforms are cached.
+
+    Returns:
+        pandas.DataFrame: The change catalog.
+    """
+    import pandas as pd
+
+    print("--- Running Multi-Epoch Change Detection ---")
+    scenes = load_scene_footprints(scene_paths, acquisition_times)
+    pairs = find_overlapping_pairs(scenes, min_overlap_area)
+    groups = OrderedDict()
+    for pair in pairs:
+        groups.setdefault(pair['after']['path'], []).append(pair)
+    print(f"{len(scenes)} scenes, {len(pairs)} overlapping pairs in {len(groups)} groups.")
+
+    results = []
+    with ProcessPoolExecutor(max_workers=num_workers) as pool:
+        futures = [pool.submit(_compare_group, group, min_region_px, coregistration_cache_dir)
+                   for group in groups.values()]
+        for done, future in enumerate(as_completed(futures), start=1):
+            results.extend(future.result())
+            print(f"  Finished group {done}/{len(futures)}")
+
+    catalog = pd.DataFrame(results, columns=list(CHANGE_CATALOG_COLUMNS))
+    catalog = catalog.sort_values(['after_time', 'before_time', 'before_path', 'region_id'], ignore_index=True)
+    os.makedirs(os.path.dirname(output_path) or '.', exist_ok=True)
+    if output_path.lower().endswith('.csv'):
+        catalog.to_csv(output_path, index=False)
+    else:
+        catalog.to_parquet(output_path, index=False)
+    print(f"{len(catalog)} change regions written to: {output_path}")
+    return catalog
+
+if __name__ == '__main__':
+    import glob
+
+    import pandas as pd
+
+    parser = argparse.ArgumentParser(description="Detect changes between every overlapping pair of scenes.")
+    parser.add_argument("scenes", nargs='+', help="Scene GeoTIFFs, or directories of them.")
+    parser.add_argument("--times", default=None, help="CSV with 'path' and 'acquired' columns; defaults to TIFFTAG_DATETIME.")
+    parser.add_argument("--output", default='runs/changes/change_catalog.parquet', help="Change catalog (.parquet or .csv).")
+    parser.add_argument("--workers", type=int, default=None, help="Worker processes.")
+    parser.add_argument("--min-region-px", type=int, default=MIN_REGION_PX, help="Smallest change region kept.")
+    args = parser.parse_args()
+
+    paths = []
+    for entry in args.scenes:
+        paths.extend(sorted(glob.glob(os.path.join(entry, '*.tif'))) if os.path.isdir(entry) else [entry])
+    times = None
+    if args.times:
+        times_df = pd.read_csv(args.times)
+        times = dict(zip(times_df['path'], times_df['acquired']))
+    run_change_detection(paths, args.output, acquisition_times=times, num_workers=args.workers,
+                         min_region_px=args.min_region_px)
@@ -0,0 +1,245 @@
+import argparse
+import hashlib
+import json
+import os
+
+import cv2
+import numpy as np
+
+from src.utils.hashing import hash_array
+
+# --- Configuration ---
+COARSE_SIZE = 512
+REFINE_WINDOW = 1024
+MIN_RESPONSE = 0.05
+DEFAULT_CACHE_DIR = 'runs/cache/coregistration'
+
+def build_pyramid(image, coarse_size=COARSE_SIZE):
+    """
+    Halves an image with `cv2.pyrDown` until its longer side fits `coarse_size`.
+
+    Returns:
+        list: float32 levels, full resolution first.
+    """
+    levels = [np.asarray(image, dtype=np.float32)]
+    while max(levels[-1].shape[:2]) > coarse_size:
+        levels.append(cv2.pyrDown(levels[-1]))
+    return levels
+
+def _pad_to(image, shape):
+    padded = np.zeros(shape, dtype=np.float32)
+    padded[:image.shape[0], :image.shape[1]] = image
+    return padded
+
+def _log_polar_spectrum(image):
+    """High-passed FFT magnitude of a windowed image, resampled onto a log-polar grid."""
+    height, width = image.shape
+    window = cv2.createHanningWindow((width, height), cv2.CV_32F)
+    spectrum = np.abs(np.fft.fftshift(np.fft.fft2(image * window))).astype(np.float32)
+    # Emphasize the mid frequencies that carry the texture orientation.
+    fy = np.cos(np.pi * (np.arange(height) / height - 0.5))[:, None]
+    fx = np.cos(np.pi * (np.arange(width) / width - 0.5))[None, :]
+    spectrum *= (1 - fy * fx) * (2 - fy * fx)
+    max_radius = min(height, width) / 2
+    log_polar = cv2.warpPolar(spectrum, (width, height), (width / 2, height / 2), max_radius,
+                              cv2.WARP_POLAR_LOG | cv2.INTER_LINEAR)
+    return log_polar, max_radius
+
+def estimate_rotation_scale(reference, moving):
+    """
+    Estimates the rotation and scale that map `moving` onto `reference` (Fourier-Mellin).
+
+    Translation does not affect the FFT magnitude, and rotation and scale
+    become shifts on its log-polar grid, found with one phase correlation.
+
+    Returns:
+        tuple: (rotation_deg, scale, response).
+    """
+    shape = (max(reference.shape[0], moving.shape[0]), max(reference.shape[1], moving.shape[1]))
+    ref_polar, max_radius = _log_polar_spectrum(_pad_to(reference, shape))
+    mov_polar, _ = _log_polar_spectrum(_pad_to(moving, shape))
+    (shift_radius, shift_angle), response = cv2.phaseCorrelate(mov_polar, ref_polar)
+    rotation_deg = -360.0 * shift_angle / shape[0]
+    scale = np.exp(-shift_radius * np.log(max_radius) / shape[1])
+    return rotation_deg, float(scale), response
+
+def _similarity(rotation_deg, scale, center):
+    """2x3 matrix rotating and scaling about `center`."""
+    return cv2.getRotationMatrix2D(center, rotation_deg, scale)
+
+def _window_shift(reference, moving, matrix, center, size):
+    """
+    Measures the residual shift of `moving` warped by `matrix` in one window of `reference`.
+
+    Only the window is warped, so the cost does not grow with the scene size.
+    """
+    height, width = reference.shape
+    h, w = min(height, size), min(width, size)
+    y0 = int(np.clip(center[1] - h // 2, 0, height - h))
+    x0 = int(np.clip(center[0] - w // 2, 0, width - w))
+    shifted = matrix.copy()
+    shifted[:, 2] -= (x0, y0)
+    warped = cv2.warpAffine(moving, shifted, (w, h), flags=cv2.INTER_LINEAR)
+    target = reference[y0:y0 + h, x0:x0 + w]
+    hann = cv2.createHanningWindow((w, h), cv2.CV_32F)
+    (dx, dy), response = cv2.phaseCorrelate(np.ascontiguousarray(warped), np.ascontiguousarray(target), hann)
+    return (x0 + w / 2, y0 + h / 2), (dx, dy), response
+
+def _refine_locally(reference, moving, matrix, window):
+    """
+    Corrects `matrix` from the residual shifts of a few windows spread over the overlap.
+
+    The central window corrects the translation. When the outer windows also
+    correlate reliably, a residual rotation and scale is fitted to all shifts.
+
+    Returns:
+        tuple: (refined matrix, response of the central window).
+    """
+    height, width = reference.shape
+    size = min(window, max(height, width))
+    centers = [(width / 2, height / 2)]
+    if min(height, width) >= 2 * (size // 2):
+        size //= 2
+        centers += [(width * fx, height * fy) for fx in (0.25, 0.75) for fy in (0.25, 0.75)]
+    shifts = [_window_shift(reference, moving, matrix, center, size) for center in centers]
+
+    reliable = [(c, d) for c, d, response in shifts if response >= MIN_RESPONSE]
+    refined = matrix.copy()
+    if len(reliable) >= 3:
+        src = np.array([c for c, _ in reliable], dtype=np.float32)
+        dst = src + np.array([d for _, d in reliable], dtype=np.float32)
+        residual, _ = cv2.estimateAffinePartial2D(src, dst, method=cv2.LMEDS)
+        if residual is not None:
+            refined = residual @ np.vstack([matrix, [0, 0, 1]])
+            return refined, shifts[0][2]
+    refined[:, 2] += shifts[0][1]
+    return refined, shifts[0][2]
+
+def estimate_transform(reference, moving, coarse_size=COARSE_SIZE, window=REFINE_WINDOW, estimate_rotation=True,
+                       reference_levels=None):
+    """
+    Estimates the similarity transform from `moving` pixel coordinates to `reference` ones.
+
+    Rotation, scale and a first translation are estimated on the coarsest
+    pyramid level. Each finer level is then corrected from the residual shifts
+    of a few windows of at most `window` pixels, so full-resolution scenes
+    take seconds.
+
+    Args:
+        reference (np.ndarray): The image to align to (e.g. the newer scene), grayscale.
+        moving (np.ndarray): The image to align (e.g. the older scene), grayscale.
+        coarse_size (int): Longer side of the coarsest pyramid level.
+        window (int): Side of the window used to refine finer levels.
+        estimate_rotation (bool): Set False for pairs known to differ only by translation.
+        reference_levels (list, optional): Precomputed `build_pyramid(reference, coarse_size)`.
+
+    Returns:
+        dict: 'matrix' (2x3, for `cv2.warpAffine(moving, matrix, reference_size)`),
+              'rotation_deg', 'scale', and 'response', the phase correlation peak
+              at full resolution (low values mean an unreliable match).
+    """
+    ref_levels = build_pyramid(reference, coarse_size) if reference_levels is None else list(reference_levels)
+    mov_levels = build_pyramid(moving, coarse_size)
+    # Both pyramids must have the same number of levels for the factors of two to line up.
+    num_levels = min(len(ref_levels), len(mov_levels))
+    ref_levels, mov_levels = ref_levels[:num_levels], mov_levels[:num_levels]
+
+    ref_coarse, mov_coarse = ref_levels[-1], mov_levels[-1]
+    rotation_deg, scale = 0.0, 1.0
+    if estimate_rotation:
+        rotation_deg, scale, _ = estimate_rotation_scale(ref_coarse, mov_coarse)
+    center = (mov_coarse.shape[1] / 2, mov_coarse.shape[0] / 2)
+
+    # The FFT magnitude is symmetric, so the rotation is only known up to 180
+    # degrees; keep whichever candidate correlates better at the coarse level.
+    best = None
+    for candidate in ([rotation_deg, rotation_deg + 180.0] if estimate_rotation else [rotation_deg]):
+        matrix = _similarity(candidate, scale, center)
+        # Start from aligned centers so scenes of different sizes overlap.
+        matrix[:, 2] += (ref_coarse.shape[1] / 2 - center[0], ref_coarse.shape[0] / 2 - center[1])
+        _, (dx, dy), response = _window_shift(ref_coarse, mov_coarse, matrix, (ref_coarse.shape[1] / 2,
+                                              ref_coarse.shape[0] / 2), max(window, coarse_size))
+        matrix[:, 2] += (dx, dy)
+        if best is None or response > best[2]:
+            best = (candidate, matrix, response)
+    matrix, response = best[1], best[2]
+
+    for level in range(num_levels - 2, -1, -1):
+        matrix[:, 2] *= 2
+        matrix, response = _refine_locally(ref_levels[level], mov_levels[level], matrix, window)
+
+    # Report the rotation and scale of the refined matrix, not the coarse estimate.
+    rotation_deg = np.degrees(np.arctan2(matrix[0, 1], matrix[0, 0]))
+    scale = np.hypot(matrix[0, 0], matrix[0, 1])
+    return {'matrix': matrix, 'rotation_deg': float(rotation_deg), 'scale': float(scale), 'response': float(response)}
+
+def _pair_key(reference_hash, moving_hash, params):
+    payload = json.dumps({'reference': reference_hash, 'moving': moving_hash, 'params': params}, sort_keys=True)
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+def coregister(reference, moving, cache_dir=DEFAULT_CACHE_DIR, reference_levels=None, reference_hash=None, **kwargs):
+    """
+    Estimates the transform between an image pair, reusing it if the pair was seen before.
+
+    Transforms are cached as small JSON files keyed by the content of both
+    images and the estimation parameters.
+
+    Args:
+        reference (np.ndarray): The image to align to, grayscale.
+        moving (np.ndarray): The image to align, grayscale.
+        cache_dir (str, optional): Cache directory; None disables caching.
+        reference_levels (list, optional): Precomputed pyramid of `reference`.
+        reference_hash (str, optional): Precomputed content hash of `reference`.
+        **kwargs: Passed to `estimate_transform`.
+
+    Returns:
+        dict: As returned by `estimate_transform`.
+    """
+    if cache_dir is None:
+        return estimate_transform(reference, moving, reference_levels=reference_levels, **kwargs)
+
+    key = _pair_key(reference_hash or hash_array(reference), hash_array(moving), kwargs)
+    path = os.path.join(cache_dir, f"{key}.json")
+    if os.path.exists(path):
+        with open(path) as f:
+            result = json.load(f)
+        result['matrix'] = np.array(result['matrix'])
+        return result
+
+    result = estimate_transform(reference, moving, reference_levels=reference_levels, **kwargs)
+    os.makedirs(cache_dir, exist_ok=True)
+    with open(path, 'w') as f:
+        json.dump({**result, 'matrix': result['matrix'].tolist()}, f)
+    return result
+
+def warp_to_reference(moving, reference_shape, matrix):
+    """
+    Resamples `moving` onto the reference pixel grid.
+
+    Returns:
+        tuple: (warped image, boolean mask of reference pixels covered by `moving`).
+    """
+    height, width = reference_shape[:2]
+    warped = cv2.warpAffine(moving, matrix, (width, height), flags=cv2.INTER_LINEAR)
+    coverage = cv2.warpAffine(np.ones(moving.shape[:2], dtype=np.uint8), matrix, (width, height),
+                              flags=cv2.INTER_NEAREST)
+    return warped, coverage.astype(bool)
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Co-register an image pair with FFT phase correlation.")
+    parser.add_argument("reference", help="Image to align to (e.g. the newer scene).")
+    parser.add_argument("moving", help="Image to align (e.g. the older scene).")
+    parser.add_argument("--output", default=None, help="Where to save the aligned moving image.")
+    parser.add_argument("--cache-dir", default=DEFAULT_CACHE_DIR, help="Where transforms are cached.")
+    args = parser.parse_args()
+
+    reference_image = cv2.imread(args.reference, cv2.IMREAD_GRAYSCALE)
+    moving_image = cv2.imread(args.moving, cv2.IMREAD_GRAYSCALE)
+    transform = coregister(reference_image, moving_image, cache_dir=args.cache_dir)
+    print(f"Rotation: {transform['rotation_deg']:.3f} deg | scale: {transform['scale']:.4f} | "
+          f"shift: ({transform['matrix'][0, 2]:.2f}, {transform['matrix'][1, 2]:.2f}) px | "
+          f"response: {transform['response']:.3f}")
+    if args.output:
+        aligned, _ = warp_to_reference(moving_image, reference_image.shape, transform['matrix'])
+        cv2.imwrite(args.output, aligned)
+        print(f"Aligned image saved to: {args.output}")
@@ -0,0 +1,260 @@
+import json
+import os
+
+import numpy as np
+
+from src.utils.hashing import hash_array
+
+# D8 neighbour offsets, clockwise from east. Direction grids store an index
+# into these arrays, or NO_FLOW where no neighbour is strictly lower/higher.
+D8_ROW_OFFSETS = np.array([0, 1, 1, 1, 0, -1, -1, -1], dtype=np.int64)
+D8_COL_OFFSETS = np.array([1, 1, 0, -1, -1, -1, 0, 1], dtype=np.int64)
+D8_DISTANCES = np.hypot(D8_ROW_OFFSETS, D8_COL_OFFSETS)
+NO_FLOW = -1
+
+# --- Configuration ---
+DEFAULT_CHUNK_ROWS = 1024
+DEFAULT_CACHE_DIR = 'runs/cache/flow'
+
+def _direction_block(dtm, r0, r1):
+    """
+    Computes descent and ascent directions for rows [r0, r1) of a DTM.
+
+    Only rows r0-1 to r1 are read, so the DTM can be a memory map.
+    """
+    height, width = dtm.shape
+    top, bottom = max(r0 - 1, 0), min(r1 + 1, height)
+    block = np.full((r1 - r0 + 2, width + 2), np.nan)
+    offset = top - (r0 - 1)
+    block[offset:offset + bottom - top, 1:-1] = dtm[top:bottom]
+    center = block[1:-1, 1:-1]
+
+    # Elevation gradient towards each of the 8 neighbours: (z_neighbour - z) / distance.
+    gradients = np.empty((8,) + center.shape)
+    for d in range(8):
+        dr, dc = D8_ROW_OFFSETS[d], D8_COL_OFFSETS[d]
+        neighbour = block[1 + dr:block.shape[0] - 1 + dr, 1 + dc:block.shape[1] - 1 + dc]
+        gradients[d] = (neighbour - center) / D8_DISTANCES[d]
+
+    # Neighbours outside the DTM or with missing data never receive flow.
+    with np.errstate(invalid='ignore'):
+        descent_gradients = np.where(np.isnan(gradients), np.inf, gradients)
+        ascent_gradients = np.where(np.isnan(gradients), -np.inf, gradients)
+        descent = np.argmin(descent_gradients, axis=0).astype(np.int8)
+        ascent = np.argmax(ascent_gradients, axis=0).astype(np.int8)
+        descent[~(np.min(descent_gradients, axis=0) < 0)] = NO_FLOW
+        ascent[~(np.max(ascent_gradients, axis=0) > 0)] = NO_FLOW
+    return descent, ascent
+
+def compute_flow_directions(dtm, chunk_rows=DEFAULT_CHUNK_ROWS, out_descent=None, out_ascent=None):
+    """
+    Computes D8 steepest-descent and steepest-ascent direction grids.
+
+    The DTM is processed in row chunks with a one-row halo, so it can be a
+    memory-mapped array larger than RAM; the outputs can be memory maps too.
+
+    Args:
+        dtm (np.ndarray): Elevation grid. NaN marks missing data.
+        chunk_rows (int): Rows processed per chunk.
+        out_descent (np.ndarray, optional): int8 array to write descent directions into.
+        out_ascent (np.ndarray, optional): int8 array to write ascent directions into.
+
+    Returns:
+        tuple: (descent, ascent) int8 grids of indices into the D8 offset arrays,
+               NO_FLOW at pits (descent) and peaks or flats (ascent).
+    """
+    height, width = dtm.shape
+    descent = np.empty((height, width), dtype=np.int8) if out_descent is None else out_descent
+    ascent = np.empty((height, width), dtype=np.int8) if out_ascent is None else out_ascent
+    for r0 in range(0, height, chunk_rows):
+        r1 = min(r0 + chunk_rows, height)
+        descent[r0:r1], ascent[r0:r1] = _direction_block(dtm, r0, r1)
+    return descent, ascent
+
+def _donor_block(descent, r0, r1):
+    """Counts, for rows [r0, r1), the neighbours whose descent direction points at each cell."""
+    height, width = descent.shape
+    top, bottom = max(r0 - 1, 0), min(r1 + 1, height)
+    block = np.full((r1 - r0 + 2, width + 2), NO_FLOW, dtype=np.int8)
+    offset = top - (r0 - 1)
+    block[offset:offset + bottom - top, 1:-1] = descent[top:bottom]
+    counts = np.zeros((r1 - r0, width), dtype=np.uint8)
+    for d in range(8):
+        dr, dc = D8_ROW_OFFSETS[d], D8_COL_OFFSETS[d]
+        # The neighbour at (-dr, -dc) drains into the cell when its direction is d.
+        counts += block[1 - dr:block.shape[0] - 1 - dr, 1 - dc:block.shape[1] - 1 - dc] == d
+    return counts
+
+def compute_flow_accumulation(descent, chunk_rows=DEFAULT_CHUNK_ROWS, out=None, out_donors=None):
+    """
+    Counts, for every cell, how many cells drain through it (itself included).
+
+    Cells are processed in topological waves: each wave holds every cell whose
+    upslope donors are all done, and is pushed downslope with one vectorized
+    `np.add.at`. Source cells (without donors) are found one row chunk at a
+    time, and the waves they release are drained before the next chunk, so
+    the frontier stays small. Receivers are derived from the directions on the
+    fly; the only state is a uint8 donor count and the accumulation (uint32,
+    or int64 for grids of 2**32 cells or more), both of which may be memory
+    maps for DTMs larger than RAM.
+
+    Args:
+        descent (np.ndarray): Steepest-descent direction grid (may be a memory map).
+        chunk_rows (int): Rows scanned per chunk.
+        out (np.ndarray, optional): Array to write the accumulation into.
+        out_donors (np.ndarray, optional): uint8 scratch array for the donor counts.
+
+    Returns:
+        np.ndarray: Upslope cell counts with the grid's shape.
+    """
+    height, width = descent.shape
+    dtype = np.uint32 if descent.size < 2**32 else np.int64
+    accumulation = np.empty((height, width), dtype=dtype) if out is None else out
+    donors = np.empty((height, width), dtype=np.uint8) if out_donors is None else out_donors
+    for r0 in range(0, height, chunk_rows):
+        r1 = min(r0 + chunk_rows, height)
+        donors[r0:r1] = _donor_block(descent, r0, r1)
+        accumulation[r0:r1] = 1
+
+    directions = descent.reshape(-1)
+    flat_accumulation = accumulation.reshape(-1)
+    flat_donors = donors.reshape(-1)
+    for r0 in range(0, height, chunk_rows):
+        r1 = min(r0 + chunk_rows, height)
+        # Sources are recomputed from the directions: cells released by earlier
+        # chunks had donors, so they are never taken as sources twice.
+        wave = r0 * width + np.flatnonzero(_donor_block(descent, r0, r1) == 0)
+        while len(wave):
+            d = directions[wave].astype(np.int64)
+            wave, d = wave[d != NO_FLOW], d[d != NO_FLOW]
+            rows, cols = np.divmod(wave, width)
+            targets = (rows + D8_ROW_OFFSETS[d]) * width + cols + D8_COL_OFFSETS[d]
+            np.add.at(flat_accumulation, targets, flat_accumulation[wave])
+            np.subtract.at(flat_donors, targets, 1)
+            targets = np.unique(targets)
+            wave = targets[flat_donors[targets] == 0]
+    return accumulation
+
+def trace_paths(directions, start_rows, start_cols, max_steps=10000, stop_mask=None, return_paths=False):
+    """
+    Follows a direction grid from many start points at once.
+
+    Every active point takes one step per iteration in a single vectorized
+    gather, until it reaches a cell with NO_FLOW, would leave `stop_mask`,
+    or has taken `max_steps` steps. Strict ascent/descent cannot loop.
+
+    Args:
+        directions (np.ndarray): A descent or ascent grid from `compute_flow_directions`.
+        start_rows (np.ndarray): Start rows.
+        start_cols (np.ndarray): Start columns.
+        max_steps (int): Longest path to follow.
+        stop_mask (np.ndarray, optional): Boolean grid; paths stop before leaving it.
+        return_paths (bool): Also return every visited cell.
+
+    Returns:
+        dict: 'end_rows', 'end_cols', 'steps' and 'length' (in pixels, with diagonal
+              steps counted as sqrt(2)). With `return_paths`, 'path_rows' and
+              'path_cols' hold (steps + 1, N) arrays padded with each path's end point.
+    """
+    rows = np.array(start_rows, dtype=np.int64)
+    cols = np.array(start_cols, dtype=np.int64)
+    steps = np.zeros(len(rows), dtype=np.int64)
+    length = np.zeros(len(rows), dtype=np.float64)
+    active = np.ones(len(rows), dtype=bool)
+    path_rows, path_cols = [rows.copy()], [cols.copy()]
+
+    for _ in range(max_steps):
+        index = np.flatnonzero(active)
+        if not len(index):
+            break
+        d = directions[rows[index], cols[index]].astype(np.int64)
+        moving = d != NO_FLOW
+        if stop_mask is not None:
+            next_rows = rows[index] + np.where(moving, D8_ROW_OFFSETS[d], 0)
+            next_cols = cols[index] + np.where(moving, D8_COL_OFFSETS[d], 0)
+            moving &= stop_mask[next_rows, next_cols].astype(bool)
+        active[index[~moving]] = False
+        index, d = index[moving], d[moving]
+        rows[index] += D8_ROW_OFFSETS[d]
+        cols[index] += D8_COL_OFFSETS[d]
+        steps[index] += 1
+        length[index] += D8_DISTANCES[d]
+        if return_paths:
+            path_rows.append(rows.copy())
+            path_cols.append(cols.copy())
+
+    result = {'end_rows': rows, 'end_cols': cols, 'steps': steps, 'length': length}
+    if return_paths:
+        result['path_rows'] = np.stack(path_rows)
+        result['path_cols'] = np.stack(path_cols)
+    return result
+
+class FlowIndex:
+    """
+    Precomputed flow directions and upslope accumulation for one DTM.
+
+    Build it once per DTM with `FlowIndex.build`; it is cached on disk, keyed
+    by the DTM's content hash, and memory-mapped on later loads so many
+    landslides can be traced against one index.
+    """
+    def __init__(self, descent, ascent, accumulation, pixel_scale=1.0):
+        self.descent = descent
+        self.ascent = ascent
+        self.accumulation = accumulation
+        self.pixel_scale = pixel_scale
+
+    @classmethod
+    def build(cls, dtm, pixel_scale=1.0, cache_dir=DEFAULT_CACHE_DIR, chunk_rows=DEFAULT_CHUNK_ROWS):
+        """
+        Loads the index for a DTM from the cache, or computes and caches it.
+
+        Args:
+            dtm (np.ndarray): Elevation grid (may be a memory map).
+            pixel_scale (float): Pixel size in meters.
+            cache_dir (str, optional): Cache directory; None disables caching.
+            chunk_rows (int): Rows per chunk when computing directions.
+        """
+        if cache_dir is None:
+            descent, ascent = compute_flow_directions(dtm, chunk_rows)
+            return cls(descent, ascent, compute_flow_accumulation(descent, chunk_rows), pixel_scale)
+
+        entry_dir = os.path.join(cache_dir, hash_array(dtm))
+        if os.path.exists(os.path.join(entry_dir, 'meta.json')):
+            return cls.load(entry_dir, pixel_scale)
+
+        os.makedirs(entry_dir, exist_ok=True)
+        descent = np.lib.format.open_memmap(os.path.join(entry_dir, 'descent.npy'), 'w+', np.int8, dtm.shape)
+        ascent = np.lib.format.open_memmap(os.path.join(entry_dir, 'ascent.npy'), 'w+', np.int8, dtm.shape)
+        compute_flow_directions(dtm, chunk_rows, descent, ascent)
+        # Every grid is written to disk as it is computed, so no full-size array is held in memory.
+        dtype = np.uint32 if descent.size < 2**32 else np.int64
+        accumulation = np.lib.format.open_memmap(os.path.join(entry_dir, 'accumulation.npy'), 'w+', dtype, dtm.shape)
+        donors_path = os.path.join(entry_dir, 'donors.tmp.npy')
+        donors = np.lib.format.open_memmap(donors_path, 'w+', np.uint8, dtm.shape)
+        compute_flow_accumulation(descent, chunk_rows, accumulation, donors)
+        del donors
+        os.remove(donors_path)
+        for grid in (descent, ascent, accumulation):
+            grid.flush()
+        with open(os.path.join(entry_dir, 'meta.json'), 'w') as f:
+            json.dump({'shape': list(dtm.shape)}, f)
+        return cls.load(entry_dir, pixel_scale)
+
+    @classmethod
+    def load(cls, entry_dir, pixel_scale=1.0):
+        """Memory-maps a cached index."""
+        arrays = [np.load(os.path.join(entry_dir, f"{name}.npy"), mmap_mode='r')
+                  for name in ('descent', 'ascent', 'accumulation')]
+        return cls(*arrays, pixel_scale=pixel_scale)
+
+    def trace_ascent(self, rows, cols, max_steps=10000, stop_mask=None, return_paths=False):
+        """Traces steepest-ascent paths from many points; lengths are in meters."""
+        result = trace_paths(self.ascent, rows, cols, max_steps, stop_mask, return_paths)
+        result['length'] = result['length'] * self.pixel_scale
+        return result
+
+    def trace_descent(self, rows, cols, max_steps=10000, stop_mask=None, return_paths=False):
+        """Traces steepest-descent paths from many points; lengths are in meters."""
+        result = trace_paths(self.descent, rows, cols, max_steps, stop_mask, return_paths)
+        result['length'] = result['length'] * self.pixel_scale
+        return result
@@ -1,5 +1,22 @@
 import numpy as np
-import cv2
+from scipy import ndimage
+
+from src.analysis.flow_direction import trace_paths
+
+LANDSLIDE_PROPERTIES = ('label', 'area_px', 'area_m2', 'source_row', 'source_col', 'source_elevation',
+                        'toe_row', 'toe_col', 'toe_elevation', 'elevation_drop', 'runout_length',
+                        'bbox_min_row', 'bbox_min_col', 'bbox_max_row', 'bbox_max_col')
+FLOW_PROPERTIES = ('scarp_row', 'scarp_col', 'scarp_elevation', 'flow_path_length')
+
+# --- Configuration ---
+# Normalized intensity below which a pixel counts as shadow.
+DEFAULT_SHADOW_LEVEL = 0.08
+# Percentiles of the image mapped to 0 and 1 before comparing with the shadow level.
+INTENSITY_PERCENTILES = (0.5, 99.5)
+INTENSITY_SAMPLE_PIXELS = 1 << 20
+MAX_SHADOW_PX = 64
+SHADOW_START_GAP_PX = 2
+SHADOW_CHUNK_SIZE = 65536
 
 def calculate_boulder_height_from_shadow(boulder_bbox, shadow_length, sun_angle_deg):
     """
@@ -26,6 +43,118 @@ def calculate_boulder_height_from_shadow(boulder_bbox, shadow_length, sun_angle_
     
     return height
 
+def shadow_direction(sun_azimuth_deg):
+    """
+    Returns the unit (dx, dy) image direction in which shadows are cast.
+
+    The azimuth is measured clockwise from north, with north at the top of the image.
+    """
+    azimuth = np.deg2rad(sun_azimuth_deg)
+    return -np.sin(azimuth), np.cos(azimuth)
+
+def intensity_range(image, percentiles=INTENSITY_PERCENTILES, sample_pixels=INTENSITY_SAMPLE_PIXELS):
+    """
+    Returns the (low, high) intensities of an image that map to 0 and 1.
+
+    8-bit images use their full range. Other images (10/12/16-bit or float)
+    use percentiles of a strided sample of their pixels, so a memory-mapped
+    scene is not read in full.
+    """
+    image = np.asarray(image)
+    if image.dtype == np.uint8:
+        return 0.0, 255.0
+    step = max(1, int(np.sqrt(image.shape[0] * image.shape[1] / sample_pixels)))
+    sample = np.asarray(image[::step, ::step], dtype=np.float32)
+    low, high = np.percentile(sample, percentiles)
+    return float(low), float(high)
+
+def measure_shadow_lengths(boxes, image, sun_azimuth_deg, shadow_level=DEFAULT_SHADOW_LEVEL,
+                           max_shadow_px=MAX_SHADOW_PX, chunk_size=SHADOW_CHUNK_SIZE, input_range=None):
+    """
+    Measures the shadow of every detected boulder by sampling away from the sun.
+
+    For each box, the image is sampled at one-pixel steps along the shadow
+    direction, starting where that ray leaves the box. The shadow is the run
+    of dark samples that starts within `SHADOW_START_GAP_PX` of the box edge.
+    All boxes of a chunk are sampled with one vectorized gather.
+
+    Args:
+        boxes (np.ndarray): (N, 4) boxes as [xmin, ymin, xmax, ymax] in image pixels.
+        image (np.ndarray): The OHRC image (HxW or HxWxC); may be a memory map.
+        sun_azimuth_deg (float): Sun azimuth, clockwise from north.
+        shadow_level (float): Normalized intensity below which a pixel counts as shadow.
+        max_shadow_px (int): Longest shadow measured, in pixels.
+        chunk_size (int): Boxes sampled per gather, to bound memory.
+        input_range (tuple, optional): (low, high) intensities mapped to 0 and 1;
+                                       estimated with `intensity_range` by default.
+
+    Returns:
+        np.ndarray: (N,) shadow lengths in pixels; 0 where no shadow was found.
+    """
+    boxes = np.asarray(boxes, dtype=np.float64).reshape(-1, 4)
+    image = np.asarray(image)
+    height, width = image.shape[:2]
+    low, high = intensity_range(image) if input_range is None else input_range
+    scale = 1.0 / max(high - low, 1e-6)
+    dx, dy = shadow_direction(sun_azimuth_deg)
+    steps = np.arange(max_shadow_px + 1, dtype=np.float64)
+    lengths = np.zeros(len(boxes))
+
+    for start in range(0, len(boxes), chunk_size):
+        chunk = boxes[start:start + chunk_size]
+        cx, cy = (chunk[:, 0] + chunk[:, 2]) / 2, (chunk[:, 1] + chunk[:, 3]) / 2
+        half_w, half_h = (chunk[:, 2] - chunk[:, 0]) / 2, (chunk[:, 3] - chunk[:, 1]) / 2
+        # Distance from the box center to its edge along the shadow direction.
+        with np.errstate(divide='ignore'):
+            edge = np.minimum(half_w / abs(dx), half_h / abs(dy))
+
+        t = edge[:, None] + steps[None, :]
+        xs = np.rint(cx[:, None] + t * dx).astype(np.int64)
+        ys = np.rint(cy[:, None] + t * dy).astype(np.int64)
+        inside = (xs >= 0) & (xs < width) & (ys >= 0) & (ys < height)
+        samples = image[np.clip(ys, 0, height - 1), np.clip(xs, 0, width - 1)]
+        if samples.ndim == 3:
+            samples = samples.mean(axis=2)
+        dark = inside & ((samples - low) * scale < shadow_level)
+
+        # The shadow starts at the first dark sample and ends at the next bright one.
+        first = np.argmax(dark, axis=1)
+        found = dark.any(axis=1) & (first <= SHADOW_START_GAP_PX)
+        after = ~dark & (np.arange(dark.shape[1])[None, :] > first[:, None])
+        end = np.where(after.any(axis=1), np.argmax(after, axis=1), dark.shape[1])
+        lengths[start:start + len(chunk)] = np.where(found, end, 0)
+    return lengths
+
+def estimate_boulder_heights(boxes, image, sun_azimuth_deg, sun_elevation_deg, pixel_scale=1.0,
+                             shadow_level=DEFAULT_SHADOW_LEVEL, max_shadow_px=MAX_SHADOW_PX, input_range=None):
+    """
+    Estimates the height of every detected boulder in a scene from its shadow.
+
+    Vectorized counterpart of `calculate_boulder_height_from_shadow` that
+    measures the shadows itself (see `measure_shadow_lengths`).
+
+    Args:
+        boxes (np.ndarray): (N, 4) detector boxes as [xmin, ymin, xmax, ymax] in image pixels.
+        image (np.ndarray): The OHRC image the boxes were detected in.
+        sun_azimuth_deg (float): Sun azimuth, clockwise from north, from the image metadata.
+        sun_elevation_deg (float): Sun elevation above the horizon, from the image metadata.
+        pixel_scale (float): Pixel size in meters.
+        shadow_level (float): Normalized intensity below which a pixel counts as shadow.
+        max_shadow_px (int): Longest shadow measured, in pixels.
+        input_range (tuple, optional): (low, high) intensities mapped to 0 and 1.
+
+    Returns:
+        dict: 'shadow_length_px' and 'height_m' arrays, one entry per box.
+    """
+    shadow_px = measure_shadow_lengths(boxes, image, sun_azimuth_deg, shadow_level, max_shadow_px,
+                                       input_range=input_range)
+    if sun_elevation_deg <= 0:
+        return {'shadow_length_px': shadow_px, 'height_m': np.zeros_like(shadow_px)}
+    return {
+        'shadow_length_px': shadow_px,
+        'height_m': shadow_px * pixel_scale * np.tan(np.deg2rad(sun_elevation_deg)),
+    }
+
 def find_landslide_source(landslide_mask, dtm_array):
     """
     Traces a landslide mask uphill on a DTM to find its likely source region.
@@ -37,8 +166,6 @@ def find_landslide_source(landslide_mask, dtm_array):
     Returns:
         tuple: The (row, col) coordinates of the estimated source point.
     """
-    print("Analyzing landslide mask to find source...")
-    
     # Ensure the mask and DTM have the same shape
     if landslide_mask.shape != dtm_array.shape:
         raise ValueError("Mask and DTM must have the same dimensions.")
@@ -54,12 +181,100 @@ def find_landslide_source(landslide_mask, dtm_array):
     highest_point_idx = np.argmax(dtm_array[landslide_points[:, 0], landslide_points[:, 1]])
     source_point = landslide_points[highest_point_idx]
     
-    print(f"Estimated landslide source found at coordinates: {source_point}")
-    # A more advanced method would trace the path of steepest ascent from
-    # multiple points within the mask.
-    
+    # For tracing beyond the mask along the steepest-ascent path, see
+    # `analyze_landslides` with a `FlowIndex`.
+
     return tuple(source_point)
 
+def analyze_landslides(landslide_mask, dtm_array, pixel_scale=1.0, connectivity=2, flow_index=None, max_steps=10000):
+    """
+    Measures every landslide in a scene mask in one vectorized pass.
+
+    Connected components are labelled once. Each landslide's source is its
+    highest pixel and its toe its lowest, found with a single sort of all mask
+    pixels by (label, elevation) instead of a Python loop per object. The
+    remaining properties are labelled reductions over the same sort order.
+
+    Args:
+        landslide_mask (np.ndarray): A binary mask of landslide pixels.
+        dtm_array (np.ndarray): The corresponding Digital Terrain Model data.
+        pixel_scale (float): Pixel size in meters, for areas and runout lengths.
+        connectivity (int): 1 for 4-connected components, 2 for 8-connected.
+        flow_index (FlowIndex, optional): Precomputed flow directions for this DTM
+                                          (see `src.analysis.flow_direction`).
+        max_steps (int): Longest flow path traced when `flow_index` is given.
+
+    Returns:
+        dict: One array per name in `LANDSLIDE_PROPERTIES`, with one entry per
+              landslide (ready for `pandas.DataFrame`). The runout length is the
+              straight-line distance from source to toe, in meters. With a
+              `flow_index`, the `FLOW_PROPERTIES` are added as well: the scarp is
+              where the steepest-ascent path from the source ends, and the flow
+              path length follows steepest descent from the source while it stays
+              inside the landslide, in meters.
+    """
+    if landslide_mask.shape != dtm_array.shape:
+        raise ValueError("Mask and DTM must have the same dimensions.")
+
+    structure = ndimage.generate_binary_structure(2, connectivity)
+    labels, num_landslides = ndimage.label(landslide_mask > 0, structure=structure)
+    if num_landslides == 0:
+        return {name: np.zeros(0) for name in LANDSLIDE_PROPERTIES}
+
+    width = labels.shape[1]
+    pixel_index = np.flatnonzero(labels)
+    pixel_labels = labels.ravel()[pixel_index]
+    # Float, so unsigned DTMs can be negated and differenced.
+    elevations = np.asarray(dtm_array).ravel()[pixel_index].astype(np.float64)
+
+    # Sort by label, then by descending elevation with no-data (NaN) pixels
+    # last: each label's first pixel is its highest point and its last valid
+    # pixel its lowest.
+    order = np.lexsort((-elevations, pixel_labels))
+    area = np.bincount(pixel_labels, minlength=num_landslides + 1)[1:]
+    valid = np.bincount(pixel_labels, weights=~np.isnan(elevations), minlength=num_landslides + 1)[1:]
+    first = np.concatenate([[0], np.cumsum(area)[:-1]])
+    last = first + np.maximum(valid.astype(np.int64), 1) - 1
+
+    source_row, source_col = np.divmod(pixel_index[order[first]], width)
+    toe_row, toe_col = np.divmod(pixel_index[order[last]], width)
+    source_elevation = elevations[order[first]]
+    toe_elevation = elevations[order[last]]
+
+    rows, cols = np.divmod(pixel_index[order], width)
+    runout_px = np.hypot(source_row - toe_row, source_col - toe_col)
+
+    flow_properties = {}
+    if flow_index is not None:
+        # All sources are traced together against the shared index.
+        ascent = trace_paths(flow_index.ascent, source_row, source_col, max_steps)
+        descent = trace_paths(flow_index.descent, source_row, source_col, max_steps, stop_mask=labels > 0)
+        flow_properties = {
+            'scarp_row': ascent['end_rows'],
+            'scarp_col': ascent['end_cols'],
+            'scarp_elevation': np.asarray(dtm_array)[ascent['end_rows'], ascent['end_cols']],
+            'flow_path_length': descent['length'] * pixel_scale,
+        }
+
+    return {
+        'label': np.arange(1, num_landslides + 1),
+        'area_px': area,
+        'area_m2': area * pixel_scale ** 2,
+        'source_row': source_row,
+        'source_col': source_col,
+        'source_elevation': source_elevation,
+        'toe_row': toe_row,
+        'toe_col': toe_col,
+        'toe_elevation': toe_elevation,
+        'elevation_drop': source_elevation - toe_elevation,
+        'runout_length': runout_px * pixel_scale,
+        'bbox_min_row': np.minimum.reduceat(rows, first),
+        'bbox_min_col': np.minimum.reduceat(cols, first),
+        'bbox_max_row': np.maximum.reduceat(rows, first),
+        'bbox_max_col': np.maximum.reduceat(cols, first),
+        **flow_properties,
+    }
+
 if __name__ == '__main__':
     print("Running post-processing analysis demonstration...")
     
@@ -80,6 +295,14 @@ if __name__ == '__main__':
     # To get meters, we would need pixel_scale (meters/pixel) from the image metadata.
     # e.g., height_meters = estimated_height_px * pixel_scale
 
+    # Whole scenes: measure every detected boulder's shadow at once.
+    dummy_image = np.full((400, 400), 200, dtype=np.uint8)
+    dummy_image[125:175, 150:166] = 5  # A 16 px shadow cast east of the first boulder
+    dummy_boxes = np.array([[100, 125, 150, 175], [300, 300, 320, 320]], dtype=np.float32)
+    heights = estimate_boulder_heights(dummy_boxes, dummy_image, sun_azimuth_deg=270, sun_elevation_deg=30,
+                                       pixel_scale=0.25)
+    print(f"Batch shadow lengths: {heights['shadow_length_px']} px, heights: {np.round(heights['height_m'], 2)} m")
+
     # --- 2. Demonstrate Landslide Source Detection ---
     print("\n--- Landslide Source Detection ---")
     # Create a dummy DTM with a clear slope
@@ -99,6 +322,18 @@ if __name__ == '__main__':
     if source_coords:
         assert source_coords[0] == 199, "Source row detection failed."
 
+    # --- 3. Demonstrate Multi-Landslide Analysis ---
+    print("\n--- Multi-Landslide Analysis ---")
+    # Add a second, separate landslide to the mask
+    dummy_mask[20:60, 10:20] = 1
+    landslides = analyze_landslides(dummy_mask, dummy_dtm, pixel_scale=0.5)
+    print(f"Found {len(landslides['label'])} landslides.")
+    for i in range(len(landslides['label'])):
+        print(f"  Landslide {landslides['label'][i]}: area {landslides['area_m2'][i]:.0f} m^2, "
+              f"source ({landslides['source_row'][i]}, {landslides['source_col'][i]}), "
+              f"drop {landslides['elevation_drop'][i]:.0f}, runout {landslides['runout_length'][i]:.1f} m")
+    assert len(landslides['label']) == 2
+
     print("\nPost-processing analysis demonstration finished.")
 
 
@@ -0,0 +1,212 @@
+import argparse
+import hashlib
+import json
+import os
+from fractions import Fraction
+
+import numpy as np
+
+from src.analysis.postprocessing import shadow_direction
+from src.utils.hashing import hash_array
+
+# --- Configuration ---
+DEFAULT_CHUNK_ROWS = 1024
+DEFAULT_CACHE_DIR = 'runs/cache/shadows'
+# Rays are stepped with the slope rounded to a fraction with at most this denominator.
+MAX_RAY_PERIOD = 16
+# Stands in for "no terrain upsun" (and for NaN cells), so comparisons never involve NaNs.
+_NO_HORIZON = -1e30
+
+def compute_hillshade(dtm, sun_azimuth_deg, sun_elevation_deg, pixel_scale=1.0, chunk_rows=DEFAULT_CHUNK_ROWS, out=None):
+    """
+    Computes the direct illumination of each DTM cell, ignoring cast shadows.
+
+    The value is the cosine of the angle between the surface normal and the
+    sun direction, clipped at 0 for slopes facing away from the sun. Rows are
+    processed in chunks with a one-row halo.
+
+    Args:
+        dtm (np.ndarray): Elevation grid in meters, north up; may be a memory map.
+        sun_azimuth_deg (float): Sun azimuth, clockwise from north.
+        sun_elevation_deg (float): Sun elevation above the horizon.
+        pixel_scale (float): DTM pixel size in meters.
+        chunk_rows (int): Rows processed per chunk.
+        out (np.ndarray, optional): float32 array to write into.
+
+    Returns:
+        np.ndarray: float32 hillshade in [0, 1].
+    """
+    height, width = dtm.shape
+    out = np.empty((height, width), dtype=np.float32) if out is None else out
+    azimuth, elevation = np.deg2rad(sun_azimuth_deg), np.deg2rad(sun_elevation_deg)
+    sun_east = np.sin(azimuth) * np.cos(elevation)
+    sun_north = np.cos(azimuth) * np.cos(elevation)
+    sun_up = np.sin(elevation)
+
+    for r0 in range(0, height, chunk_rows):
+        r1 = min(r0 + chunk_rows, height)
+        top, bottom = max(r0 - 1, 0), min(r1 + 1, height)
+        block = np.asarray(dtm[top:bottom], dtype=np.float32)
+        if block.shape[0] > 1:
+            dz_drow, dz_dcol = np.gradient(block, pixel_scale)
+        else:
+            dz_drow, dz_dcol = np.zeros_like(block), np.gradient(block, pixel_scale, axis=1)
+        # Rows run southwards, so the northward slope is -dz/drow.
+        normal_dot_sun = -dz_dcol * sun_east + dz_drow * sun_north + sun_up
+        shade = normal_dot_sun / np.sqrt(dz_dcol ** 2 + dz_drow ** 2 + 1)
+        out[r0:r1] = np.clip(shade[r0 - top:r0 - top + (r1 - r0)], 0, 1)
+    return out
+
+def _sweep_view(array, dx, dy):
+    """
+    Returns a view of `array` in which shadows fall towards increasing rows,
+    and the sideways shift of the shadow per row in that view.
+    """
+    if abs(dx) > abs(dy):
+        array, dx, dy = array.T, dy, dx
+    if dy < 0:
+        array = array[::-1]
+    return array, dx / abs(dy)
+
+def compute_cast_shadows(dtm, sun_azimuth_deg, sun_elevation_deg, pixel_scale=1.0, chunk_rows=DEFAULT_CHUNK_ROWS, out=None):
+    """
+    Marks the DTM cells that lie in the shadow of upsun terrain.
+
+    A sweep line moves across the DTM in the direction shadows are cast,
+    one row (or column) at a time. The ray from each cell towards the sun
+    steps to the nearest cell of every row behind it (Bresenham-style), and a
+    cell is in shadow when any cell on its ray rises above the sun's line of
+    sight. With the ray slope rounded to a fraction a/q, these nearest-cell
+    offsets repeat every q rows, so the horizon of a cell is the higher of
+    the terrain on its next q ray cells and the horizon of the cell q rows
+    back, lowered by the distance between them. The sweep keeps the last q
+    rows of terrain and horizons, so it reads one chunk of rows at a time and
+    costs O(q) per cell.
+
+    Args:
+        dtm (np.ndarray): Elevation grid in meters, north up; may be a memory map.
+            NaN cells cast no shadow.
+        sun_azimuth_deg (float): Sun azimuth, clockwise from north.
+        sun_elevation_deg (float): Sun elevation above the horizon.
+        pixel_scale (float): DTM pixel size in meters.
+        chunk_rows (int): Sweep steps read from the DTM at a time.
+        out (np.ndarray, optional): Boolean array to write into.
+
+    Returns:
+        np.ndarray: Boolean cast-shadow mask.
+    """
+    out = np.empty(dtm.shape, dtype=bool) if out is None else out
+    if sun_elevation_deg <= 0:
+        out[:] = True
+        return out
+    if sun_elevation_deg >= 90:
+        out[:] = False
+        return out
+
+    view, shift = _sweep_view(dtm, *shadow_direction(sun_azimuth_deg))
+    out_view, _ = _sweep_view(out, *shadow_direction(sun_azimuth_deg))
+    steps, width = view.shape
+    drop = pixel_scale * np.hypot(1.0, shift) * np.tan(np.deg2rad(sun_elevation_deg))
+    # k rows towards the sun, the ray is at column offset sunward[k] = round(k * a / q),
+    # and sunward[k + q] = sunward[k] + a.
+    slope = Fraction(-shift).limit_denominator(MAX_RAY_PERIOD)
+    a, q = slope.numerator, slope.denominator
+    sunward = [(2 * k * a + q) // (2 * q) for k in range(q + 1)]
+    terrain = np.full((q, width), _NO_HORIZON)
+    horizons = np.full((q, width), _NO_HORIZON)
+
+    for s0 in range(0, steps, chunk_rows):
+        block = np.asarray(view[s0:s0 + chunk_rows], dtype=np.float64)
+        block = np.where(np.isnan(block), _NO_HORIZON, block)
+        shadow = np.empty(block.shape, dtype=bool)
+        for i, row in enumerate(block, start=s0):
+            horizon = np.full(width, _NO_HORIZON)
+            _maximum_shifted(horizon, horizons[i % q], a, q * drop)
+            for k in range(1, q + 1):
+                _maximum_shifted(horizon, terrain[(i - k) % q], sunward[k], k * drop)
+            shadow[i - s0] = row < horizon
+            terrain[i % q], horizons[i % q] = row, horizon
+        out_view[s0:s0 + len(block)] = shadow
+    return out
+
+def _maximum_shifted(target, source, offset, drop):
+    """target[c] = max(target[c], source[c + offset] - drop) where c + offset is inside the row."""
+    width = len(target)
+    if offset >= width or -offset >= width:
+        return
+    if offset >= 0:
+        np.maximum(target[:width - offset], source[offset:] - drop, out=target[:width - offset])
+    else:
+        np.maximum(target[-offset:], source[:width + offset] - drop, out=target[-offset:])
+
+def _illumination_key(dtm, sun_azimuth_deg, sun_elevation_deg, pixel_scale):
+    payload = json.dumps({'dtm': hash_array(dtm), 'azimuth': float(sun_azimuth_deg),
+                          'elevation': float(sun_elevation_deg), 'pixel_scale': float(pixel_scale)}, sort_keys=True)
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+def simulate_illumination(dtm, sun_azimuth_deg, sun_elevation_deg, pixel_scale=1.0, cache_dir=DEFAULT_CACHE_DIR,
+                          chunk_rows=DEFAULT_CHUNK_ROWS):
+    """
+    Computes the hillshade and cast-shadow mask of a DTM for one sun position.
+
+    Results are cached on disk per (DTM contents, sun geometry, pixel scale)
+    and memory-mapped when loaded again.
+
+    Args:
+        dtm (np.ndarray): Elevation grid in meters, north up.
+        sun_azimuth_deg (float): Sun azimuth, clockwise from north.
+        sun_elevation_deg (float): Sun elevation above the horizon.
+        pixel_scale (float): DTM pixel size in meters.
+        cache_dir (str, optional): Cache directory; None disables caching.
+        chunk_rows (int): Rows processed per chunk.
+
+    Returns:
+        dict: 'hillshade' (float32, 0 where the terrain faces away from the sun),
+              'cast_shadow' (bool), and 'illumination', the hillshade with cast
+              shadows set to 0.
+    """
+    if cache_dir is None:
+        hillshade = compute_hillshade(dtm, sun_azimuth_deg, sun_elevation_deg, pixel_scale, chunk_rows)
+        cast_shadow = compute_cast_shadows(dtm, sun_azimuth_deg, sun_elevation_deg, pixel_scale, chunk_rows)
+        return {'hillshade': hillshade, 'cast_shadow': cast_shadow, 'illumination': np.where(cast_shadow, np.float32(0), hillshade)}
+
+    entry_dir = os.path.join(cache_dir, _illumination_key(dtm, sun_azimuth_deg, sun_elevation_deg, pixel_scale))
+    names = ('hillshade', 'cast_shadow', 'illumination')
+    if not os.path.exists(os.path.join(entry_dir, 'meta.json')):
+        os.makedirs(entry_dir, exist_ok=True)
+        hillshade = np.lib.format.open_memmap(os.path.join(entry_dir, 'hillshade.npy'), 'w+', np.float32, dtm.shape)
+        cast_shadow = np.lib.format.open_memmap(os.path.join(entry_dir, 'cast_shadow.npy'), 'w+', bool, dtm.shape)
+        illumination = np.lib.format.open_memmap(os.path.join(entry_dir, 'illumination.npy'), 'w+', np.float32, dtm.shape)
+        compute_hillshade(dtm, sun_azimuth_deg, sun_elevation_deg, pixel_scale, chunk_rows, out=hillshade)
+        compute_cast_shadows(dtm, sun_azimuth_deg, sun_elevation_deg, pixel_scale, chunk_rows, out=cast_shadow)
+        for r0 in range(0, dtm.shape[0], chunk_rows):
+            illumination[r0:r0 + chunk_rows] = np.where(cast_shadow[r0:r0 + chunk_rows], 0, hillshade[r0:r0 + chunk_rows])
+        for array in (hillshade, cast_shadow, illumination):
+            array.flush()
+        with open(os.path.join(entry_dir, 'meta.json'), 'w') as f:
+            json.dump({'shape': list(dtm.shape), 'sun_azimuth_deg': sun_azimuth_deg,
+                       'sun_elevation_deg': sun_elevation_deg, 'pixel_scale': pixel_scale}, f)
+    return {name: np.load(os.path.join(entry_dir, f"{name}.npy"), mmap_mode='r') for name in names}
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Simulate hillshade and cast shadows of a DTM for a sun position.")
+    parser.add_argument("dtm", help="DTM as a .npy array or a single-band GeoTIFF.")
+    parser.add_argument("--azimuth", type=float, required=True, help="Sun azimuth in degrees, clockwise from north.")
+    parser.add_argument("--elevation", type=float, required=True, help="Sun elevation in degrees.")
+    parser.add_argument("--pixel-scale", type=float, default=1.0, help="DTM pixel size in meters.")
+    parser.add_argument("--cache-dir", default=DEFAULT_CACHE_DIR, help="Where results are cached.")
+    args = parser.parse_args()
+
+    if args.dtm.endswith('.npy'):
+        dtm_array = np.load(args.dtm, mmap_mode='r')
+    else:
+        import rasterio
+
+        with rasterio.open(args.dtm) as src:
+            dtm_array = src.read(1)
+
+    print("--- Simulating Illumination ---")
+    result = simulate_illumination(dtm_array, args.azimuth, args.elevation, args.pixel_scale, args.cache_dir)
+    print(f"Cast shadow covers {np.mean(result['cast_shadow']):.1%} of the DTM; "
+          f"mean hillshade {np.mean(result['hillshade']):.3f}.")
+    print(f"Results cached in: {args.cache_dir}")
@@ -1,49 +1,358 @@
+import hashlib
+import json
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
 import cv2
 import numpy as np
-from skimage.metrics import structural_similarity as ssim
+from scipy import ndimage
+
+from src.analysis.coregistration import COARSE_SIZE, build_pyramid, coregister, warp_to_reference
+from src.analysis.coregistration import DEFAULT_CACHE_DIR as COREGISTRATION_CACHE_DIR
+from src.inference.raster import SceneReader
+from src.utils.hashing import hash_array
+
+# --- Configuration ---
+BAND_ROWS = 512
+SSIM_WIN_SIZE = 7
+SSIM_K1 = 0.01
+SSIM_K2 = 0.03
+GAUSSIAN_SIGMA = 1.5
+OPEN_KERNEL_SIZE = 5
+REFERENCE_CACHE_DIR = 'runs/cache/reference'
+
+def _open_gray(path):
+    """Opens a scene for windowed reads; plain images are decoded to grayscale once."""
+    if str(path).lower().endswith(('.npy', '.tif', '.tiff', '.img', '.vrt')):
+        return SceneReader(path)
+    image = cv2.imread(path, cv2.IMREAD_GRAYSCALE)
+    if image is None:
+        raise FileNotFoundError(f"Could not load image: {path}")
+    return SceneReader(image)
+
+def _read_rows(reader, r0, r1):
+    """Reads rows [r0, r1) of the first band as float32."""
+    rows = reader.read(r0, 0, r1 - r0, reader.width)
+    return np.asarray(rows[..., 0] if rows.ndim == 3 else rows, dtype=np.float32)
+
+def _local_mean_filter(gaussian):
+    """Returns the SSIM window filter, its covariance normalization and its halo in rows."""
+    if gaussian:
+        def local_mean(a):
+            return ndimage.gaussian_filter(a, GAUSSIAN_SIGMA, truncate=3.5)
+        return local_mean, 1.0, 11 // 2
+
+    def local_mean(a):
+        return ndimage.uniform_filter(a, SSIM_WIN_SIZE)
+    n = SSIM_WIN_SIZE ** 2
+    return local_mean, n / (n - 1.0), SSIM_WIN_SIZE // 2
+
+def _ssim_band(reader_before, reader_after, r0, r1, data_range, gaussian, read_lock):
+    """
+    Computes the SSIM map for rows [r0, r1), reading just enough halo rows for the filter.
+
+    Matches `skimage.metrics.structural_similarity(full=True)` with its default
+    7x7 uniform window (or its 11x11 Gaussian window), computed in float32.
+    When `reader_before` is a `ReferenceFeatures`, its cached local statistics
+    are used and only the new image's statistics and the cross term are filtered.
+    Reads happen under `read_lock`, since rasterio datasets must not be read
+    from several threads at once; the filtering runs outside it.
+    """
+    height = reader_before.height
+    local_mean, cov_norm, halo = _local_mean_filter(gaussian)
+    top, bottom = max(r0 - halo, 0), min(r1 + halo, height)
+    band = slice(r0 - top, r0 - top + (r1 - r0))
+    with read_lock:
+        x = _read_rows(reader_before, top, bottom)
+        y = _read_rows(reader_after, top, bottom)
+        if isinstance(reader_before, ReferenceFeatures):
+            ux, xx = np.asarray(reader_before.mean[r0:r1]), np.asarray(reader_before.sq_mean[r0:r1])
+
+    if not isinstance(reader_before, ReferenceFeatures):
+        ux, xx = local_mean(x)[band], local_mean(x * x)[band]
+    uy, yy, xy = local_mean(y)[band], local_mean(y * y)[band], local_mean(x * y)[band]
+    vx = cov_norm * (xx - ux * ux)
+    vy = cov_norm * (yy - uy * uy)
+    vxy = cov_norm * (xy - ux * uy)
+
+    c1, c2 = (SSIM_K1 * data_range) ** 2, (SSIM_K2 * data_range) ** 2
+    return ((2 * ux * uy + c1) * (2 * vxy + c2)) / ((ux ** 2 + uy ** 2 + c1) * (vx + vy + c2))
+
+class ReferenceFeatures:
+    """
+    Cached SSIM statistics and pyramid levels of a baseline scene.
+
+    In monitoring mode many new acquisitions are compared against one
+    reference. Its float32 pixels, local means and local second moments,
+    and the pyramid used for co-registration are computed once, stored on
+    disk keyed by the image's content hash, and memory-mapped afterwards.
+    Pass it to `compute_change_mask` in place of the before scene.
+
+    Attributes:
+        key (str): Content hash of the reference and the SSIM window settings.
+        image, mean, sq_mean (np.ndarray): Float32 HxW arrays.
+        levels (list): Pyramid levels from `build_pyramid`, full resolution first.
+        value_range (tuple): (min, max) pixel value of the reference.
+    """
+    def __init__(self, key, image, mean, sq_mean, levels, dtype, gaussian=False, value_range=None):
+        self.key = key
+        self.image = image
+        self.mean = mean
+        self.sq_mean = sq_mean
+        self.levels = levels
+        self.dtype = np.dtype(dtype)
+        self.gaussian = gaussian
+        self.height, self.width = image.shape
+        if value_range is None:
+            value_range = (float(np.nanmin(image)), float(np.nanmax(image)))
+        self.value_range = tuple(value_range)
+
+    def read(self, row, col, height, width):
+        """Reads a window of the reference pixels, like `SceneReader.read`."""
+        return self.image[row:row + height, col:col + width]
+
+    @classmethod
+    def build(cls, image, cache_dir=REFERENCE_CACHE_DIR, gaussian=False, coarse_size=COARSE_SIZE,
+              band_rows=BAND_ROWS):
+        """
+        Loads the features of a reference image from the cache, or computes and caches them.
+
+        Args:
+            image (np.ndarray): The grayscale reference scene.
+            cache_dir (str): Cache directory.
+            gaussian (bool): SSIM window the statistics are computed for.
+            coarse_size (int): Coarsest pyramid level size, as in `estimate_transform`.
+            band_rows (int): Rows per band when filtering.
+        """
+        image = np.asarray(image)
+        params = {'gaussian': gaussian, 'win_size': SSIM_WIN_SIZE, 'coarse_size': coarse_size}
+        key = hashlib.sha256(f"{hash_array(image)}|{json.dumps(params, sort_keys=True)}".encode()).hexdigest()
+        entry_dir = os.path.join(cache_dir, key)
+        meta_path = os.path.join(entry_dir, 'meta.json')
+        if os.path.exists(meta_path):
+            return cls.load(entry_dir)
+
+        os.makedirs(entry_dir, exist_ok=True)
+        pixels = np.lib.format.open_memmap(os.path.join(entry_dir, 'image.npy'), 'w+', np.float32, image.shape)
+        mean = np.lib.format.open_memmap(os.path.join(entry_dir, 'mean.npy'), 'w+', np.float32, image.shape)
+        sq_mean = np.lib.format.open_memmap(os.path.join(entry_dir, 'sq_mean.npy'), 'w+', np.float32, image.shape)
+        pixels[:] = image
+        local_mean, _, halo = _local_mean_filter(gaussian)
+        height = image.shape[0]
+        low, high = np.inf, -np.inf
+        for r0 in range(0, height, band_rows):
+            r1 = min(r0 + band_rows, height)
+            top, bottom = max(r0 - halo, 0), min(r1 + halo, height)
+            x = np.asarray(pixels[top:bottom])
+            low, high = min(low, float(np.nanmin(x))), max(high, float(np.nanmax(x)))
+            mean[r0:r1] = local_mean(x)[r0 - top:r0 - top + (r1 - r0)]
+            sq_mean[r0:r1] = local_mean(x * x)[r0 - top:r0 - top + (r1 - r0)]
+        levels = build_pyramid(pixels, coarse_size)
+        for i, level in enumerate(levels[1:], start=1):
+            np.save(os.path.join(entry_dir, f"level_{i}.npy"), level)
+        for array in (pixels, mean, sq_mean):
+            array.flush()
+        with open(meta_path, 'w') as f:
+            json.dump({'key': key, 'dtype': image.dtype.str, 'levels': len(levels), 'value_range': [low, high],
+                       **params}, f)
+        return cls.load(entry_dir)
 
-def detect_temporal_changes(image_before_path, image_after_path, threshold=0.9):
+    @classmethod
+    def load(cls, entry_dir):
+        """Memory-maps a cached entry."""
+        with open(os.path.join(entry_dir, 'meta.json')) as f:
+            meta = json.load(f)
+        image = np.load(os.path.join(entry_dir, 'image.npy'), mmap_mode='r')
+        levels = [image] + [np.load(os.path.join(entry_dir, f"level_{i}.npy"), mmap_mode='r')
+                            for i in range(1, meta['levels'])]
+        return cls(meta['key'], image, np.load(os.path.join(entry_dir, 'mean.npy'), mmap_mode='r'),
+                   np.load(os.path.join(entry_dir, 'sq_mean.npy'), mmap_mode='r'), levels, meta['dtype'],
+                   meta['gaussian'], meta.get('value_range'))
+
+def estimate_data_range(*readers):
+    """
+    SSIM intensity range for floating point scenes: the value range of all of them.
+
+    `SceneReader`s are sampled from a downsampled view of the whole scene;
+    `ReferenceFeatures` use the range recorded when they were built.
+    """
+    ranges = [reader.value_range if isinstance(reader, ReferenceFeatures)
+              else reader.percentile_stretch(percentiles=(0, 100)) for reader in readers]
+    return max(high for _, high in ranges) - min(low for low, _ in ranges)
+
+def otsu_threshold_from_histogram(histogram):
+    """
+    Returns the Otsu threshold of a 256-bin histogram.
+
+    Equivalent to OpenCV's THRESH_OTSU on the image the histogram was counted
+    from, so the histogram can be accumulated band by band.
+    """
+    p = np.asarray(histogram, dtype=np.float64)
+    p = p / p.sum()
+    levels = np.arange(len(p))
+    q1 = np.cumsum(p)
+    mu1_sum = np.cumsum(p * levels)
+    mu = mu1_sum[-1]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        mu1 = mu1_sum / q1
+        mu2 = (mu - mu1_sum) / (1 - q1)
+        sigma = q1 * (1 - q1) * (mu1 - mu2) ** 2
+    valid = (q1 >= 1e-7) & (1 - q1 >= 1e-7)
+    sigma = np.where(valid, sigma, -1)
+    return int(np.argmax(sigma))
+
+def compute_change_mask(reader_before, reader_after, data_range=None, gaussian=False, band_rows=BAND_ROWS,
+                        num_threads=None, out=None):
+    """
+    Computes an SSIM change mask between two aligned scenes, band by band.
+
+    The SSIM map is computed in float32 over overlapping row bands on a
+    thread pool and written, as uint8, straight into the output array. Its
+    histogram is accumulated as bands finish, giving the Otsu threshold
+    without a second full-size pass. The output is then thresholded and
+    opened band by band in place, so no full-size intermediate is held in
+    memory when `out` is a memory map.
+
+    Args:
+        reader_before (SceneReader or ReferenceFeatures): The older scene.
+        reader_after (SceneReader): The newer scene, with the same size.
+        data_range (float, optional): Intensity range; defaults to the dtype's maximum.
+                                      Required for floating point scenes.
+        gaussian (bool): Use an 11x11 Gaussian window instead of a 7x7 uniform one.
+                         Ignored for `ReferenceFeatures`, which fix the window.
+        band_rows (int): Rows per band.
+        num_threads (int, optional): Worker threads; defaults to the CPU count.
+        out (np.ndarray, optional): uint8 array (e.g. a memory map) to write the mask into.
+
+    Returns:
+        tuple: (change_mask, mean_ssim). The mask holds 255 where the scenes differ.
+    """
+    height, width = reader_before.height, reader_before.width
+    if (reader_after.height, reader_after.width) != (height, width):
+        raise ValueError("Both scenes must have the same size.")
+    if isinstance(reader_before, ReferenceFeatures):
+        gaussian = reader_before.gaussian
+    if data_range is None:
+        if not np.issubdtype(reader_before.dtype, np.integer):
+            raise ValueError("data_range is required for floating point scenes.")
+        data_range = float(np.iinfo(reader_before.dtype).max)
+
+    # Holds the uint8 SSIM map until it is thresholded in place.
+    diff = np.empty((height, width), dtype=np.uint8) if out is None else out
+    read_lock = threading.Lock()
+    histogram = np.zeros(256, dtype=np.int64)
+    # The mean SSIM skips the filter's border, like skimage does.
+    pad = (SSIM_WIN_SIZE - 1) // 2
+    ssim_sum = 0.0
+
+    def process(r0):
+        r1 = min(r0 + band_rows, height)
+        band = _ssim_band(reader_before, reader_after, r0, r1, data_range, gaussian, read_lock)
+        diff[r0:r1] = np.clip(band * 255, 0, 255).astype(np.uint8)
+        inner = band[max(pad - r0, 0):max(min(height - pad, r1) - r0, 0), pad:width - pad]
+        return np.bincount(diff[r0:r1].ravel(), minlength=256), float(inner.sum(dtype=np.float64))
+
+    with ThreadPoolExecutor(max_workers=num_threads or os.cpu_count()) as pool:
+        for band_histogram, band_sum in pool.map(process, range(0, height, band_rows)):
+            histogram += band_histogram
+            ssim_sum += band_sum
+    threshold = otsu_threshold_from_histogram(histogram)
+
+    # Opening needs OPEN_KERNEL_SIZE - 1 halo rows on each side of a band. The rows above
+    # a band are already overwritten with the mask, so their SSIM values are carried over.
+    mask = diff
+    kernel = np.ones((OPEN_KERNEL_SIZE, OPEN_KERNEL_SIZE), np.uint8)
+    halo = OPEN_KERNEL_SIZE - 1
+    above = diff[:0].copy()
+    for r0 in range(0, height, band_rows):
+        r1 = min(r0 + band_rows, height)
+        bottom = min(r1 + halo, height)
+        rows = np.concatenate([above, diff[r0:bottom]])
+        changed = np.where(rows > threshold, 0, 255).astype(np.uint8)
+        start = len(above)
+        above = rows[:start + r1 - r0][-halo:]
+        mask[r0:r1] = cv2.morphologyEx(changed, cv2.MORPH_OPEN, kernel)[start:start + r1 - r0]
+
+    mean_ssim = ssim_sum / max((height - 2 * pad) * (width - 2 * pad), 1)
+    return mask, mean_ssim
+
+def align_before_image(before, after, cache_dir=COREGISTRATION_CACHE_DIR):
+    """
+    Co-registers the older image onto the newer one's pixel grid.
+
+    Pixels of `after` that `before` does not cover are filled from `after`
+    itself, so they never show up as changes.
+
+    Returns:
+        tuple: (aligned before image, coverage mask, transform dict).
+    """
+    transform = coregister(after, before, cache_dir=cache_dir)
+    aligned, coverage = warp_to_reference(before, after.shape, transform['matrix'])
+    aligned[~coverage] = after[~coverage]
+    return aligned, coverage, transform
+
+def detect_temporal_changes(image_before_path, image_after_path, threshold=0.9, output_path=None,
+                            band_rows=BAND_ROWS, num_threads=None, align=False,
+                            coregistration_cache_dir=COREGISTRATION_CACHE_DIR, data_range=None):
     """
     Detects significant changes between two registered images of the same location.
 
     This function uses the Structural Similarity Index (SSIM) to compare the two
     images, which is more robust to minor lighting changes than simple subtraction.
+    Scenes are processed in row bands (see `compute_change_mask`), so full-resolution
+    GeoTIFF or .npy scenes are read window by window.
 
     Args:
         image_before_path (str): File path to the older image (e.g., from Chandrayaan-1).
         image_after_path (str): File path to the newer image (e.g., from Chandrayaan-2).
         threshold (float): The SSIM threshold. Lower values detect more (and potentially
                            less significant) changes. Defaults to 0.9.
+        output_path (str, optional): A .npy file the mask is written into band by band,
+                                     instead of being held in memory.
+        band_rows (int): Rows per processing band.
+        num_threads (int, optional): Worker threads for the SSIM bands.
+        align (bool): Co-register the images even if they have the same size.
+                      Pairs of different sizes are always co-registered.
+        coregistration_cache_dir (str, optional): Where pair transforms are cached.
+        data_range (float, optional): SSIM intensity range. Defaults to the dtype's maximum
+                                      for integer scenes, and to the value range of a
+                                      downsampled view of both scenes for floating point ones.
 
     Returns:
         np.ndarray: A binary mask where '1' represents areas of significant change.
                     Returns None on failure.
     """
     try:
-        # Load images in grayscale
-        img_before = cv2.imread(image_before_path, cv2.IMREAD_GRAYSCALE)
-        img_after = cv2.imread(image_after_path, cv2.IMREAD_GRAYSCALE)
-
-        if img_before is None or img_after is None:
-            raise FileNotFoundError("One or both images could not be loaded.")
-
-        # Ensure images are the same size (a prerequisite for this simple method)
-        if img_before.shape != img_after.shape:
-            # In a real pipeline, we would use `align_and_fuse_data` to handle this.
-            # Here, we'll resize for demonstration purposes.
-            h, w = img_after.shape
-            img_before = cv2.resize(img_before, (w, h))
-        
-        # Compute the Structural Similarity Index (SSIM) between the two images
-        (score, diff) = ssim(img_before, img_after, full=True)
-        diff = (diff * 255).astype("uint8")
+        reader_before = _open_gray(image_before_path)
+        reader_after = _open_gray(image_after_path)
 
-        # Threshold the difference image to get the regions of significant change
-        thresh = cv2.threshold(diff, 0, 255, cv2.THRESH_BINARY_INV | cv2.THRESH_OTSU)[1]
-        
-        # Perform some morphological operations to clean up noise
-        kernel = np.ones((5,5), np.uint8)
-        change_mask = cv2.morphologyEx(thresh, cv2.MORPH_OPEN, kernel)
+        # Resampling one image onto the other would shift every feature, so
+        # pairs of different sizes are co-registered instead.
+        coverage = None
+        if align or (reader_before.height, reader_before.width) != (reader_after.height, reader_after.width):
+            before = _read_rows(reader_before, 0, reader_before.height)
+            after = _read_rows(reader_after, 0, reader_after.height)
+            aligned, coverage, transform = align_before_image(before, after, coregistration_cache_dir)
+            print(f"Co-registered: rotation {transform['rotation_deg']:.3f} deg, scale {transform['scale']:.4f}, "
+                  f"shift ({transform['matrix'][0, 2]:.1f}, {transform['matrix'][1, 2]:.1f}) px")
+            if np.issubdtype(reader_after.dtype, np.integer):
+                aligned = np.rint(aligned)
+            reader_before = SceneReader(aligned.astype(reader_after.dtype))
+
+        if data_range is None and not np.issubdtype(reader_after.dtype, np.integer):
+            data_range = estimate_data_range(reader_before, reader_after)
+
+        out = None
+        if output_path is not None:
+            out = np.lib.format.open_memmap(output_path, 'w+', np.uint8, (reader_after.height, reader_after.width))
+        change_mask, score = compute_change_mask(reader_before, reader_after, data_range, band_rows=band_rows,
+                                                 num_threads=num_threads, out=out)
+        if coverage is not None:
+            change_mask[~coverage] = 0
+        if out is not None:
+            out.flush()
 
         print(f"Temporal analysis complete. SSIM score: {score:.4f}")
         return change_mask
@@ -52,6 +361,52 @@ def detect_temporal_changes(image_before_path, image_after_path, threshold=0.9):
         print(f"An error occurred during temporal analysis: {e}")
         return None
 
+def detect_changes_against_reference(reference, image_after, band_rows=BAND_ROWS, num_threads=None,
+                                     coregistration_cache_dir=COREGISTRATION_CACHE_DIR, data_range=None):
+    """
+    Compares a new acquisition against a cached baseline scene.
+
+    The baseline's statistics and pyramid come from `ReferenceFeatures`, so
+    each comparison only reads the new image and filters its own statistics
+    and the cross term. A new image of a different size is co-registered onto
+    the baseline grid using the cached pyramid.
+
+    Args:
+        reference (ReferenceFeatures): The baseline scene.
+        image_after (str or np.ndarray): The new acquisition (path or grayscale array).
+        band_rows (int): Rows per processing band.
+        num_threads (int, optional): Worker threads for the SSIM bands.
+        coregistration_cache_dir (str, optional): Where pair transforms are cached.
+        data_range (float, optional): SSIM intensity range. Defaults to the dtype's maximum for
+                                      integer baselines, and to the value range of the baseline
+                                      and the new image for floating point ones.
+
+    Returns:
+        tuple: (change_mask on the baseline grid, mean SSIM).
+    """
+    reader_after = _open_gray(image_after) if isinstance(image_after, str) else SceneReader(np.asarray(image_after))
+    coverage = None
+    if (reader_after.height, reader_after.width) != (reference.height, reference.width):
+        after = _read_rows(reader_after, 0, reader_after.height)
+        transform = coregister(reference.image, after, cache_dir=coregistration_cache_dir,
+                               reference_levels=reference.levels, reference_hash=reference.key)
+        aligned, coverage = warp_to_reference(after, (reference.height, reference.width), transform['matrix'])
+        aligned[~coverage] = reference.image[~coverage]
+        if np.issubdtype(reference.dtype, np.integer):
+            aligned = np.rint(aligned)
+        reader_after = SceneReader(aligned.astype(reference.dtype))
+
+    if data_range is None:
+        if np.issubdtype(reference.dtype, np.integer):
+            data_range = float(np.iinfo(reference.dtype).max)
+        else:
+            data_range = estimate_data_range(reference, reader_after)
+    change_mask, score = compute_change_mask(reference, reader_after, data_range=data_range, band_rows=band_rows,
+                                             num_threads=num_threads)
+    if coverage is not None:
+        change_mask[~coverage] = 0
+    return change_mask, score
+
 if __name__ == '__main__':
     print("Running temporal analysis demonstration...")
     
@@ -83,6 +438,29 @@ if __name__ == '__main__':
         cv2.imwrite("dummy_change_mask.png", change_mask)
         print("Change mask saved to 'dummy_change_mask.png'")
 
+    # --- Monitoring Mode: One Reference, Many Acquisitions ---
+    import tempfile
+
+    acquisitions = []
+    for i in range(5):
+        acquisition = before_image.copy()
+        cv2.rectangle(acquisition, (50 * i, 300), (50 * i + 100, 400), 200, -1)
+        acquisitions.append(acquisition)
+
+    start = time.perf_counter()
+    for acquisition in acquisitions:
+        compute_change_mask(SceneReader(before_image), SceneReader(acquisition))
+    uncached_time = time.perf_counter() - start
+
+    with tempfile.TemporaryDirectory() as reference_cache:
+        reference_features = ReferenceFeatures.build(before_image, cache_dir=reference_cache)
+        start = time.perf_counter()
+        for acquisition in acquisitions:
+            detect_changes_against_reference(reference_features, acquisition)
+        cached_time = time.perf_counter() - start
+    print(f"1-vs-{len(acquisitions)} comparisons: {uncached_time:.3f}s without the reference cache, "
+          f"{cached_time:.3f}s with it.")
+
     # --- Cleanup ---
     import os
     os.remove("dummy_before.png")
@@ -1,13 +1,23 @@
 import os
+import hashlib
+import json
 import pandas as pd
-from sklearn.model_selection import train_test_split
+import numpy as np
 import yaml
 from PIL import Image
 import shutil
+from concurrent.futures import ProcessPoolExecutor
+
+# --- Configuration ---
+MANIFEST_NAME = 'manifest.json'
+HASH_CHUNK_BYTES = 1 << 20
 
 
 def convert_bbox_to_yolo_format(box, img_width, img_height):
-    """Converts a bounding box from [xmin, ymin, xmax, ymax] to YOLO format."""
+    """
+    Converts a bounding box from [xmin, ymin, xmax, ymax] to YOLO format.
+    The coordinates may also be arrays, to convert many boxes at once.
+    """
     xmin, ymin, xmax, ymax = box
     x_center = (xmin + xmax) / 2 / img_width
     y_center = (ymin + ymax) / 2 / img_height
@@ -16,15 +26,98 @@ def convert_bbox_to_yolo_format(box, img_width, img_height):
     return x_center, y_center, width, height
 
 
-def create_yolo_dataset(image_dir, label_csv_path, output_dir, train_size=0.8):
+def _file_sha256(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK_BYTES), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _image_fingerprint(path, previous):
+    """
+    Content hash of a source image. The file is only re-hashed when its size or
+    modification time differ from the manifest entry.
+    """
+    stat = os.stat(path)
+    if previous and previous.get('size') == stat.st_size and previous.get('mtime_ns') == stat.st_mtime_ns:
+        return previous['image_sha256'], stat
+    return _file_sha256(path), stat
+
+
+def _convert_image(source_path, dest_path):
+    """Re-encodes one image as a 3-channel JPEG (run in a worker process)."""
+    with Image.open(source_path) as img:
+        img.convert('RGB').save(dest_path, 'jpeg')
+    return dest_path
+
+
+def _link_or_copy(source_path, dest_path):
+    """Hard-links an already compatible image, copying when linking is not possible."""
+    try:
+        os.link(source_path, dest_path)
+    except OSError:
+        shutil.copyfile(source_path, dest_path)
+
+
+def _split_of(filename, train_size):
+    """
+    Assigns an image to 'train' or 'val' from a hash of its file name.
+
+    The split of an image never depends on the other images, so adding or
+    removing images does not move the existing ones between splits.
+    """
+    position = int.from_bytes(hashlib.sha256(filename.encode()).digest()[:8], 'big') / 2 ** 64
+    return 'train' if position < train_size else 'val'
+
+
+def _output_paths(output_dir, split, base_filename):
+    return (os.path.join(output_dir, 'images', split, f"{base_filename}.jpg"),
+            os.path.join(output_dir, 'labels', split, f"{base_filename}.txt"))
+
+
+def _remove_outputs(output_dir, entry, base_filename):
+    for path in _output_paths(output_dir, entry['split'], base_filename):
+        if os.path.exists(path):
+            os.remove(path)
+
+
+def _move_outputs(output_dir, entry, split, base_filename):
+    """Moves an image's outputs to another split without rewriting them."""
+    for source, dest in zip(_output_paths(output_dir, entry['split'], base_filename),
+                            _output_paths(output_dir, split, base_filename)):
+        if os.path.exists(source):
+            os.replace(source, dest)
+
+
+def create_yolo_dataset(image_dir, label_csv_path, output_dir, train_size=0.8, rebuild=False, num_workers=None):
     """
     Converts a dataset with CSV-based bounding box labels into the format
     required by YOLOv8.
+
+    Runs are incremental: a manifest in `output_dir` records the content hash
+    of every source image and of its labels, and only images or labels that
+    changed are rewritten. Each image's split comes from a hash of its file
+    name (see `_split_of`), so it stays put as images are added; when
+    `train_size` changes, outputs are moved between splits rather than
+    rewritten. Labels are grouped in one pass and converted with vectorized
+    arithmetic. Images that are already
+    RGB JPEGs are hard-linked; the others are re-encoded in a process pool.
+
+    Args:
+        image_dir (str): Directory with the source images.
+        label_csv_path (str): Headerless CSV of filename, xmin, ymin, xmax, ymax, class.
+        output_dir (str): The YOLO dataset directory.
+        train_size (float): Fraction of images in the training split.
+        rebuild (bool): Delete `output_dir` and build everything from scratch.
+        num_workers (int, optional): Processes re-encoding images; defaults to the CPU count.
+
+    Returns:
+        dict: Counts of 'converted', 'linked', 'labels_written', 'unchanged', 'moved' and 'removed' images.
     """
     print("--- Creating YOLOv8 Dataset ---")
 
-    # Clean and create directories
-    if os.path.exists(output_dir):
+    if rebuild and os.path.exists(output_dir):
         shutil.rmtree(output_dir)
         print(f"Removed existing directory: {output_dir}")
 
@@ -32,50 +125,110 @@ def create_yolo_dataset(image_dir, label_csv_path, output_dir, train_size=0.8):
     os.makedirs(os.path.join(output_dir, 'images/val'), exist_ok=True)
     os.makedirs(os.path.join(output_dir, 'labels/train'), exist_ok=True)
     os.makedirs(os.path.join(output_dir, 'labels/val'), exist_ok=True)
-    print("Cleaned and recreated dataset directories.")
+
+    manifest_path = os.path.join(output_dir, MANIFEST_NAME)
+    manifest = {}
+    if os.path.exists(manifest_path):
+        with open(manifest_path) as f:
+            manifest = json.load(f)
 
     # Read and process labels
     labels_df = pd.read_csv(label_csv_path, header=None)
     labels_df.columns = ['filename', 'xmin', 'ymin', 'xmax', 'ymax', 'class']
     labels_df.dropna(subset=['class'], inplace=True)
 
-    # Get unique filenames and split them
-    unique_files = labels_df.filename.unique()
-    train_files, val_files = train_test_split(unique_files, train_size=train_size, random_state=42)
-    file_sets = {'train': train_files, 'val': val_files}
-
-    for split, files in file_sets.items():
-        print(f"Processing {split} set...")
-        for filename in files:
-            source_img_path = os.path.join(image_dir, filename)
-            base_filename = os.path.splitext(filename)[0]
-            dest_img_filename = f"{base_filename}.jpg"
-            dest_img_path = os.path.join(output_dir, 'images', split, dest_img_filename)
-            
+    split_of = {filename: _split_of(filename, train_size) for filename in labels_df.filename.unique()}
+
+    counts = {'converted': 0, 'linked': 0, 'labels_written': 0, 'unchanged': 0, 'moved': 0, 'removed': 0}
+    # Images that left the label file lose their old outputs.
+    for filename in list(manifest):
+        if filename not in split_of:
+            _remove_outputs(output_dir, manifest.pop(filename), os.path.splitext(filename)[0])
+            counts['removed'] += 1
+
+    new_manifest = {}
+    to_convert = []
+    label_jobs = []
+    for filename, records in labels_df.groupby('filename', sort=False):
+        split = split_of[filename]
+        source_img_path = os.path.join(image_dir, filename)
+        base_filename = os.path.splitext(filename)[0]
+        dest_img_path = os.path.join(output_dir, 'images', split, f"{base_filename}.jpg")
+        label_path = os.path.join(output_dir, 'labels', split, f"{base_filename}.txt")
+        previous = manifest.get(filename)
+        if previous is not None and previous['split'] != split:
+            _move_outputs(output_dir, previous, split, base_filename)
+            previous = {**previous, 'split': split}
+            counts['moved'] += 1
+
+        try:
+            image_sha256, stat = _image_fingerprint(source_img_path, previous)
+        except FileNotFoundError:
+            print(f"Warning: Image file not found, skipping: {source_img_path}")
+            if previous:
+                _remove_outputs(output_dir, previous, base_filename)
+            continue
+        boxes = records[['xmin', 'ymin', 'xmax', 'ymax']].to_numpy(dtype=np.float64)
+        labels_sha256 = hashlib.sha256(boxes.tobytes()).hexdigest()
+
+        image_unchanged = (previous is not None and previous['image_sha256'] == image_sha256
+                           and os.path.exists(dest_img_path))
+        if image_unchanged:
+            img_width, img_height = previous['width'], previous['height']
+        else:
             try:
-                # Open image, get dimensions, and save as 3-channel JPEG
+                # Only the header is read here; pixels are decoded by the conversion workers.
                 with Image.open(source_img_path) as img:
                     img_width, img_height = img.size
-                    rgb_img = img.convert('RGB')
-                    rgb_img.save(dest_img_path, 'jpeg')
-
-                # Get labels for this image
-                records = labels_df[labels_df.filename == filename]
-                label_filename = f"{base_filename}.txt"
-                label_path = os.path.join(output_dir, 'labels', split, label_filename)
-                
-                # Write YOLO label file
-                with open(label_path, 'w') as f:
-                    for _, row in records.iterrows():
-                        # Convert bbox to YOLO format
-                        box = [row.xmin, row.ymin, row.xmax, row.ymax]
-                        x_center, y_center, width, height = convert_bbox_to_yolo_format(box, img_width, img_height)
-                        class_id = 0  # Assuming 'rockfall' is the only class (class_id 0)
-                        f.write(f"{class_id} {x_center} {y_center} {width} {height}\n")
-            except FileNotFoundError:
-                print(f"Warning: Image file not found, skipping: {source_img_path}")
+                    compatible = img.format == 'JPEG' and img.mode == 'RGB'
             except Exception as e:
                 print(f"Error processing file {filename}: {e}")
+                if previous:
+                    _remove_outputs(output_dir, previous, base_filename)
+                continue
+            if os.path.exists(dest_img_path):
+                os.remove(dest_img_path)
+            if compatible:
+                _link_or_copy(source_img_path, dest_img_path)
+                counts['linked'] += 1
+            else:
+                to_convert.append((filename, source_img_path, dest_img_path))
+
+        labels_unchanged = (image_unchanged and previous['labels_sha256'] == labels_sha256
+                            and os.path.exists(label_path))
+        if labels_unchanged:
+            counts['unchanged'] += 1
+        else:
+            label_jobs.append((label_path, boxes, img_width, img_height))
+
+        new_manifest[filename] = {'split': split, 'image_sha256': image_sha256, 'labels_sha256': labels_sha256,
+                                  'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns,
+                                  'width': img_width, 'height': img_height}
+
+    # Write YOLO label files, converting each image's boxes in one vectorized step
+    class_id = 0  # Assuming 'rockfall' is the only class (class_id 0)
+    for label_path, boxes, img_width, img_height in label_jobs:
+        x_center, y_center, width, height = convert_bbox_to_yolo_format(boxes.T, img_width, img_height)
+        rows = np.stack([x_center, y_center, width, height], axis=1).tolist()
+        with open(label_path, 'w') as f:
+            f.writelines(f"{class_id} {x} {y} {w} {h}\n" for x, y, w, h in rows)
+    counts['labels_written'] = len(label_jobs)
+
+    if to_convert:
+        print(f"Converting {len(to_convert)} images to JPEG...")
+        with ProcessPoolExecutor(max_workers=num_workers) as pool:
+            futures = {pool.submit(_convert_image, source, dest): filename for filename, source, dest in to_convert}
+            for future, filename in futures.items():
+                try:
+                    future.result()
+                    counts['converted'] += 1
+                except Exception as e:
+                    print(f"Error processing file {filename}: {e}")
+                    # Dropped from the manifest so the next run retries it.
+                    new_manifest.pop(filename, None)
+
+    with open(manifest_path, 'w') as f:
+        json.dump(new_manifest, f)
 
     # Create dataset.yaml file
     class_names = ['rockfall']
@@ -90,12 +243,22 @@ def create_yolo_dataset(image_dir, label_csv_path, output_dir, train_size=0.8):
         yaml.dump(yaml_data, f, sort_keys=False)
 
     print(f"Created dataset.yaml at {yaml_path}")
+    print(f"Converted {counts['converted']}, linked {counts['linked']}, wrote {counts['labels_written']} label files, "
+          f"{counts['unchanged']} unchanged, {counts['moved']} moved, {counts['removed']} removed.")
     print("--- YOLOv8 Dataset Creation Complete ---")
+    return counts
 
 if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Build (or incrementally update) the YOLOv8 dataset.")
+    parser.add_argument("--rebuild", action='store_true', help="Delete the output directory and rebuild everything.")
+    parser.add_argument("--workers", type=int, default=None, help="Processes re-encoding images.")
+    args = parser.parse_args()
+
     # These paths are relative to the project root where you run the script
     LUNAR_IMAGE_DIR = 'data/raw/moon/train_images'
     LUNAR_LABEL_CSV = 'data/raw/moon/train_labels/train_labels_m.csv'
     OUTPUT_YOLO_DIR = 'data/yolo_moon_dataset'
 
-    create_yolo_dataset(LUNAR_IMAGE_DIR, LUNAR_LABEL_CSV, OUTPUT_YOLO_DIR) 
\ No newline at end of file
+    create_yolo_dataset(LUNAR_IMAGE_DIR, LUNAR_LABEL_CSV, OUTPUT_YOLO_DIR, rebuild=args.rebuild, num_workers=args.workers)
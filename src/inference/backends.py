@@ -0,0 +1,275 @@
+import os
+
+import cv2
+import numpy as np
+
+from src.inference.boxes import empty_detections, non_max_suppression
+
+# Inference backends share one small interface so that callers do not care
+# whether a model runs in eager PyTorch or in ONNX Runtime:
+#   detector.predict(images, conf, iou) -> list of detections dicts (see boxes.py)
+#   segmenter.predict(batch)            -> (B, n_classes, H, W) float32 logits
+# Images are HxWx3 uint8 RGB arrays; see `prepare_image` for other inputs.
+
+BACKENDS = ('auto', 'torch', 'onnx')
+LETTERBOX_FILL = 114
+
+def prepare_image(image, stretch=None):
+    """
+    Converts a decoded image array to the HxWx3 uint8 RGB layout the detectors expect.
+
+    Grayscale images are replicated to three channels, and two-channel images
+    (grey and alpha, or 2-band scenes) use their first channel. Images with a
+    higher bit depth (e.g. 16-bit GeoTIFFs) are contrast-stretched to 8 bits in memory,
+    by default using their own 0.5-99.5 percentiles. Pass the scene's
+    `stretch` (see `SceneReader.percentile_stretch`) when converting windows of
+    a larger scene, so that every window is stretched alike.
+    """
+    image = np.asarray(image)
+    if image.ndim == 3 and image.shape[2] in (1, 2):
+        image = image[..., 0]
+    if image.dtype != np.uint8:
+        data = image.astype(np.float32)
+        low, high = stretch if stretch is not None else np.percentile(data, (0.5, 99.5))
+        scale = 255.0 / max(high - low, 1e-6)
+        image = np.clip((data - low) * scale, 0, 255).astype(np.uint8)
+    if image.ndim == 2:
+        image = np.repeat(image[..., None], 3, axis=2)
+    elif image.shape[2] == 4:
+        image = image[..., :3]
+    return np.ascontiguousarray(image)
+
+def letterbox(image, size):
+    """
+    Resizes an image to fit in a `size` x `size` square, padding the remainder.
+
+    Returns:
+        tuple: (padded image, scale, (pad_x, pad_y)) so that boxes can be mapped
+               back with `(box - pad) / scale`.
+    """
+    height, width = image.shape[:2]
+    scale = min(size / height, size / width)
+    new_w, new_h = int(round(width * scale)), int(round(height * scale))
+    if (new_w, new_h) != (width, height):
+        image = cv2.resize(image, (new_w, new_h), interpolation=cv2.INTER_LINEAR)
+    pad_x, pad_y = (size - new_w) // 2, (size - new_h) // 2
+    canvas = np.full((size, size, 3), LETTERBOX_FILL, dtype=np.uint8)
+    canvas[pad_y:pad_y + new_h, pad_x:pad_x + new_w] = image
+    return canvas, scale, (pad_x, pad_y)
+
+def decode_yolo_output(output, conf=0.25, iou=0.45, max_det=300):
+    """
+    Decodes raw YOLOv8 head output into detections.
+
+    Args:
+        output (np.ndarray): (4 + n_classes, n_anchors) output for one image,
+                             boxes as center-x, center-y, width, height.
+        conf (float): Minimum class confidence.
+        iou (float): NMS IoU threshold.
+        max_det (int): Maximum number of detections to keep.
+
+    Returns:
+        dict: Detections in network input coordinates.
+    """
+    predictions = output.T
+    class_scores = predictions[:, 4:]
+    class_ids = class_scores.argmax(axis=1)
+    scores = class_scores[np.arange(len(class_scores)), class_ids]
+    keep = scores > conf
+    if not keep.any():
+        return empty_detections()
+
+    xywh, scores, class_ids = predictions[keep, :4], scores[keep], class_ids[keep]
+    boxes = np.concatenate([xywh[:, :2] - xywh[:, 2:] / 2, xywh[:, :2] + xywh[:, 2:] / 2], axis=1)
+    kept = non_max_suppression(boxes, scores, iou, class_ids)[:max_det]
+    return {
+        'boxes': boxes[kept].astype(np.float32),
+        'scores': scores[kept].astype(np.float32),
+        'class_ids': class_ids[kept].astype(np.int32),
+    }
+
+def _resolve_backend(model_path, backend):
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown backend '{backend}'. Choose one of {BACKENDS}.")
+    if backend == 'auto':
+        return 'onnx' if model_path.lower().endswith('.onnx') else 'torch'
+    return backend
+
+def create_onnx_session(onnx_path, num_threads=None):
+    """
+    Creates an ONNX Runtime CPU session.
+
+    Args:
+        onnx_path (str): Path to the .onnx model.
+        num_threads (int, optional): Intra-op thread count. Defaults to ONNX Runtime's choice.
+    """
+    import onnxruntime as ort
+
+    options = ort.SessionOptions()
+    options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+    if num_threads:
+        options.intra_op_num_threads = num_threads
+        options.inter_op_num_threads = 1
+    return ort.InferenceSession(onnx_path, sess_options=options, providers=['CPUExecutionProvider'])
+
+class YoloOnnxDetector:
+    """
+    Runs an exported YOLOv8 detector with ONNX Runtime.
+
+    Preprocessing (letterboxing) and postprocessing (decoding, NMS) are done in
+    numpy, so inference-only hosts need neither PyTorch nor ultralytics.
+    """
+    def __init__(self, onnx_path, num_threads=None, imgsz=640):
+        self.session = create_onnx_session(onnx_path, num_threads)
+        self.input_name = self.session.get_inputs()[0].name
+        self.imgsz = imgsz
+
+    def forward(self, batch):
+        """Runs the raw network on a (B, 3, imgsz, imgsz) float32 batch."""
+        return self.session.run(None, {self.input_name: batch})[0]
+
+    def preprocess(self, images):
+        """Letterboxes images into a normalized NCHW batch."""
+        boxed = [letterbox(prepare_image(image), self.imgsz) for image in images]
+        batch = np.stack([b[0] for b in boxed]).transpose(0, 3, 1, 2).astype(np.float32) / 255.0
+        return np.ascontiguousarray(batch), [(b[1], b[2]) for b in boxed]
+
+    def predict(self, images, conf=0.25, iou=0.45):
+        if not images:
+            return []
+        batch, transforms = self.preprocess(images)
+        outputs = self.forward(batch)
+        detections = []
+        for output, (scale, (pad_x, pad_y)), image in zip(outputs, transforms, images):
+            dets = decode_yolo_output(output, conf, iou)
+            boxes = dets['boxes']
+            boxes[:, [0, 2]] = (boxes[:, [0, 2]] - pad_x) / scale
+            boxes[:, [1, 3]] = (boxes[:, [1, 3]] - pad_y) / scale
+            height, width = image.shape[:2]
+            np.clip(boxes[:, [0, 2]], 0, width, out=boxes[:, [0, 2]])
+            np.clip(boxes[:, [1, 3]], 0, height, out=boxes[:, [1, 3]])
+            detections.append(dets)
+        return detections
+
+class YoloTorchDetector:
+    """Runs a YOLOv8 .pt checkpoint through ultralytics in eager PyTorch."""
+    def __init__(self, model_path, num_threads=None, imgsz=640):
+        import torch
+        from ultralytics import YOLO
+
+        if num_threads:
+            torch.set_num_threads(num_threads)
+        self.model = YOLO(model_path)
+        self.imgsz = imgsz
+
+    def forward(self, batch):
+        """Runs the raw network on a (B, 3, imgsz, imgsz) float32 batch."""
+        import torch
+
+        with torch.no_grad():
+            output = self.model.model.float().eval()(torch.from_numpy(batch))
+        return (output[0] if isinstance(output, (list, tuple)) else output).numpy()
+
+    def predict(self, images, conf=0.25, iou=0.45):
+        if not images:
+            return []
+        # ultralytics expects BGR arrays, as produced by cv2.imread.
+        sources = [np.ascontiguousarray(prepare_image(image)[..., ::-1]) for image in images]
+        results = self.model.predict(sources, conf=conf, iou=iou, imgsz=self.imgsz, verbose=False)
+        return [{
+            'boxes': r.boxes.xyxy.cpu().numpy().astype(np.float32),
+            'scores': r.boxes.conf.cpu().numpy().astype(np.float32),
+            'class_ids': r.boxes.cls.cpu().numpy().astype(np.int32),
+        } for r in results]
+
+class UNetOnnxSegmenter:
+    """Runs an exported UNet with ONNX Runtime."""
+    def __init__(self, onnx_path, num_threads=None):
+        self.session = create_onnx_session(onnx_path, num_threads)
+        self.input_name = self.session.get_inputs()[0].name
+
+    def predict(self, batch):
+        batch = np.ascontiguousarray(batch, dtype=np.float32)
+        return self.session.run(None, {self.input_name: batch})[0]
+
+class UNetTorchSegmenter:
+    """
+    Runs a UNet in PyTorch from a float state_dict (.pth) or a TorchScript
+    artifact such as the int8 model saved by `src.models.quantization`.
+    """
+    def __init__(self, model_path, variant='classic', n_channels=3, n_classes=3, num_threads=None):
+        import torch
+
+        if num_threads:
+            torch.set_num_threads(num_threads)
+        if model_path.endswith('.pt'):
+            self.model = torch.jit.load(model_path, map_location='cpu')
+        else:
+            from src.models.unet import UNet, UNET_VARIANTS
+
+            self.model = UNet(n_channels, n_classes, **UNET_VARIANTS[variant])
+            self.model.load_state_dict(torch.load(model_path, map_location='cpu'))
+        self.model.eval()
+
+    def predict(self, batch):
+        import torch
+
+        with torch.no_grad():
+            return self.model(torch.from_numpy(np.ascontiguousarray(batch, dtype=np.float32))).numpy()
+
+def load_detector(model_path, backend='auto', num_threads=None, imgsz=640):
+    """
+    Loads a YOLOv8 detector for the requested backend.
+
+    Args:
+        model_path (str): A .pt checkpoint or an exported .onnx model.
+        backend (str): 'torch', 'onnx', or 'auto' to choose from the file extension.
+        num_threads (int, optional): CPU threads used by the backend.
+        imgsz (int): Network input size.
+    """
+    if not os.path.exists(model_path):
+        raise FileNotFoundError(f"Model not found at {model_path}")
+    if _resolve_backend(model_path, backend) == 'onnx':
+        return YoloOnnxDetector(model_path, num_threads=num_threads, imgsz=imgsz)
+    return YoloTorchDetector(model_path, num_threads=num_threads, imgsz=imgsz)
+
+def load_segmenter(model_path, backend='auto', variant='classic', num_threads=None):
+    """
+    Loads a UNet segmenter for the requested backend.
+
+    Args:
+        model_path (str): A .pth state_dict, a TorchScript .pt artifact or an .onnx model.
+        backend (str): 'torch', 'onnx', or 'auto' to choose from the file extension.
+        variant (str): UNet preset, needed to rebuild the network from a state_dict.
+        num_threads (int, optional): CPU threads used by the backend.
+    """
+    if not os.path.exists(model_path):
+        raise FileNotFoundError(f"Model not found at {model_path}")
+    if _resolve_backend(model_path, backend) == 'onnx':
+        return UNetOnnxSegmenter(model_path, num_threads=num_threads)
+    return UNetTorchSegmenter(model_path, variant=variant, num_threads=num_threads)
+
+def check_parity(reference_fn, candidate_fn, inputs, rtol=1e-3, atol=1e-4):
+    """
+    Compares two backends' raw outputs on the same input batch.
+
+    Args:
+        reference_fn (callable): Reference forward function (e.g. PyTorch).
+        candidate_fn (callable): Candidate forward function (e.g. ONNX Runtime).
+        inputs (np.ndarray): The float32 input batch fed to both.
+        rtol (float): Relative tolerance.
+        atol (float): Absolute tolerance.
+
+    Returns:
+        dict: 'max_abs_diff', 'mean_abs_diff' and whether the outputs are 'close'.
+    """
+    expected = np.asarray(reference_fn(inputs))
+    actual = np.asarray(candidate_fn(inputs))
+    if expected.shape != actual.shape:
+        raise ValueError(f"Output shapes differ: {expected.shape} vs {actual.shape}")
+    diff = np.abs(expected - actual)
+    return {
+        'max_abs_diff': float(diff.max()),
+        'mean_abs_diff': float(diff.mean()),
+        'close': bool(np.allclose(actual, expected, rtol=rtol, atol=atol)),
+    }
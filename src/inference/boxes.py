@@ -0,0 +1,86 @@
+import numpy as np
+
+# Detections are passed around as plain dicts of numpy arrays:
+#   'boxes'     (N, 4) float32, [xmin, ymin, xmax, ymax] in pixels
+#   'scores'    (N,)   float32 confidences
+#   'class_ids' (N,)   int32 class indices
+
+def empty_detections():
+    """Returns a detections dict with no boxes."""
+    return {
+        'boxes': np.zeros((0, 4), dtype=np.float32),
+        'scores': np.zeros(0, dtype=np.float32),
+        'class_ids': np.zeros(0, dtype=np.int32),
+    }
+
+def concat_detections(detections_list):
+    """Concatenates several detections dicts into one."""
+    detections_list = [d for d in detections_list if len(d['scores'])]
+    if not detections_list:
+        return empty_detections()
+    return {key: np.concatenate([d[key] for d in detections_list]) for key in ('boxes', 'scores', 'class_ids')}
+
+def select_detections(detections, index):
+    """Returns the subset of a detections dict selected by a mask or index array."""
+    return {key: detections[key][index] for key in ('boxes', 'scores', 'class_ids')}
+
+def box_iou(box, boxes, metric='iou'):
+    """
+    Computes the overlap between one box and an array of boxes.
+
+    Args:
+        box (np.ndarray): A single box [xmin, ymin, xmax, ymax].
+        boxes (np.ndarray): An (N, 4) array of boxes.
+        metric (str): 'iou' for intersection over union, or 'ios' for
+                      intersection over the smaller box, which also matches a
+                      box that was cut in half by a tile border with its full copy.
+
+    Returns:
+        np.ndarray: (N,) overlap values.
+    """
+    inter_w = np.clip(np.minimum(box[2], boxes[:, 2]) - np.maximum(box[0], boxes[:, 0]), 0, None)
+    inter_h = np.clip(np.minimum(box[3], boxes[:, 3]) - np.maximum(box[1], boxes[:, 1]), 0, None)
+    intersection = inter_w * inter_h
+    area = (box[2] - box[0]) * (box[3] - box[1])
+    areas = (boxes[:, 2] - boxes[:, 0]) * (boxes[:, 3] - boxes[:, 1])
+    if metric == 'ios':
+        return intersection / np.maximum(np.minimum(area, areas), 1e-9)
+    return intersection / np.maximum(area + areas - intersection, 1e-9)
+
+def non_max_suppression(boxes, scores, iou_threshold=0.45, class_ids=None, metric='iou'):
+    """
+    Greedy non-maximum suppression.
+
+    Each iteration keeps the highest-scoring remaining box and discards, in one
+    vectorized step, every remaining box that overlaps it by more than
+    `iou_threshold`. When `class_ids` is given, boxes of different classes
+    never suppress each other (they are shifted apart by a per-class offset).
+
+    Args:
+        boxes (np.ndarray): (N, 4) boxes as [xmin, ymin, xmax, ymax].
+        scores (np.ndarray): (N,) confidences.
+        iou_threshold (float): Overlap above which the lower-scoring box is removed.
+        class_ids (np.ndarray, optional): (N,) class indices for class-aware NMS.
+        metric (str): Overlap measure, 'iou' or 'ios' (see `box_iou`).
+
+    Returns:
+        np.ndarray: Indices of the kept boxes, sorted by descending score.
+    """
+    if len(boxes) == 0:
+        return np.zeros(0, dtype=np.int64)
+
+    boxes = np.asarray(boxes, dtype=np.float64)
+    if class_ids is not None:
+        offset = boxes.max() + 1.0
+        boxes = boxes + (np.asarray(class_ids, dtype=np.float64) * offset)[:, None]
+
+    order = np.argsort(-np.asarray(scores), kind='stable')
+    keep = []
+    while len(order):
+        best = order[0]
+        keep.append(best)
+        if len(order) == 1:
+            break
+        overlaps = box_iou(boxes[best], boxes[order[1:]], metric)
+        order = order[1:][overlaps <= iou_threshold]
+    return np.asarray(keep, dtype=np.int64)
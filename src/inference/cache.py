@@ -0,0 +1,222 @@
+import hashlib
+import io
+import json
+import os
+import sqlite3
+import threading
+import time
+
+import numpy as np
+
+from src.utils.hashing import hash_array
+
+# --- Configuration ---
+DEFAULT_CACHE_DIR = 'runs/cache'
+DEFAULT_MAX_BYTES = 2 * 1024**3
+HASH_CHUNK_SIZE = 1 << 20
+
+_fingerprint_memo = {}
+
+def model_fingerprint(model_path):
+    """
+    Returns the SHA-256 of a model's weights file.
+
+    The result is memoized per (path, size, modification time), so a
+    retrained checkpoint written to the same path gets a new fingerprint.
+    """
+    stat = os.stat(model_path)
+    memo_key = (os.path.abspath(model_path), stat.st_size, stat.st_mtime_ns)
+    if memo_key not in _fingerprint_memo:
+        digest = hashlib.sha256()
+        with open(model_path, 'rb') as f:
+            for chunk in iter(lambda: f.read(HASH_CHUNK_SIZE), b''):
+                digest.update(chunk)
+        _fingerprint_memo[memo_key] = digest.hexdigest()
+    return _fingerprint_memo[memo_key]
+
+def make_cache_key(input_hash, fingerprint, params=None):
+    """Combines input content, model weights and inference parameters into one key."""
+    payload = json.dumps({'input': input_hash, 'model': fingerprint, 'params': params or {}}, sort_keys=True)
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+class ResultCache:
+    """
+    A persistent, content-addressed store for inference results.
+
+    Each entry is a dict of numpy arrays saved as a compressed .npz file. An
+    SQLite index tracks entry sizes and last access times so the cache can
+    evict least-recently-used entries once it grows past `max_bytes`.
+    Safe to share between threads.
+
+    Args:
+        cache_dir (str): Directory holding the entries and the index.
+        max_bytes (int): Disk budget for all entries.
+    """
+    def __init__(self, cache_dir=DEFAULT_CACHE_DIR, max_bytes=DEFAULT_MAX_BYTES):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        os.makedirs(cache_dir, exist_ok=True)
+        self._db = sqlite3.connect(os.path.join(cache_dir, 'index.sqlite'), check_same_thread=False)
+        self._db.execute("CREATE TABLE IF NOT EXISTS entries ("
+                         "key TEXT PRIMARY KEY, model TEXT, size INTEGER, last_access REAL)")
+        self._db.execute("CREATE INDEX IF NOT EXISTS entries_by_access ON entries (last_access)")
+        self._db.commit()
+
+    def _entry_path(self, key):
+        return os.path.join(self.cache_dir, key[:2], f"{key}.npz")
+
+    def get(self, key):
+        """Returns the cached arrays for a key, or None on a miss."""
+        path = self._entry_path(key)
+        with self._lock:
+            found = self._db.execute("SELECT 1 FROM entries WHERE key = ?", (key,)).fetchone()
+            if found is None or not os.path.exists(path):
+                self.misses += 1
+                return None
+            self._db.execute("UPDATE entries SET last_access = ? WHERE key = ?", (time.time(), key))
+            self._db.commit()
+        try:
+            with np.load(path, allow_pickle=False) as data:
+                arrays = {name: data[name] for name in data.files}
+        except FileNotFoundError:
+            # Evicted by another thread or process after the lookup above.
+            with self._lock:
+                if not os.path.exists(path):
+                    self._db.execute("DELETE FROM entries WHERE key = ?", (key,))
+                    self._db.commit()
+                self.misses += 1
+            return None
+        with self._lock:
+            self.hits += 1
+        return arrays
+
+    def put(self, key, arrays, model=None):
+        """
+        Stores a dict of arrays under a key and evicts old entries if over budget.
+
+        Args:
+            key (str): Cache key from `make_cache_key`.
+            arrays (dict): Named numpy arrays to store.
+            model (str, optional): Model fingerprint, used by `prune_models`.
+        """
+        buffer = io.BytesIO()
+        np.savez_compressed(buffer, **arrays)
+        data = buffer.getvalue()
+        path = self._entry_path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        temp_path = f"{path}.{threading.get_ident()}.tmp"
+        with open(temp_path, 'wb') as f:
+            f.write(data)
+        os.replace(temp_path, path)
+        with self._lock:
+            self._db.execute("INSERT OR REPLACE INTO entries VALUES (?, ?, ?, ?)", (key, model, len(data), time.time()))
+            self._db.commit()
+            self._evict()
+
+    def _evict(self):
+        total = self._db.execute("SELECT COALESCE(SUM(size), 0) FROM entries").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        for key, size in self._db.execute("SELECT key, size FROM entries ORDER BY last_access").fetchall():
+            self._remove(key)
+            total -= size
+            if total <= self.max_bytes:
+                break
+        self._db.commit()
+
+    def _remove(self, key):
+        self._db.execute("DELETE FROM entries WHERE key = ?", (key,))
+        try:
+            os.remove(self._entry_path(key))
+        except FileNotFoundError:
+            pass
+
+    def prune_models(self, keep_fingerprints):
+        """
+        Deletes entries produced by models other than `keep_fingerprints`.
+
+        Entries from an old checkpoint can never be hit again (the weights
+        hash is part of every key); this reclaims their disk space early.
+
+        Returns:
+            int: Number of entries removed.
+        """
+        keep = set(keep_fingerprints)
+        with self._lock:
+            rows = self._db.execute("SELECT key, model FROM entries").fetchall()
+            stale = [key for key, model in rows if model is not None and model not in keep]
+            for key in stale:
+                self._remove(key)
+            self._db.commit()
+        return len(stale)
+
+    def stats(self):
+        """Returns hit/miss counts for this process and the size of the cache on disk."""
+        with self._lock:
+            entries, size = self._db.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM entries").fetchone()
+        lookups = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hits / lookups if lookups else 0.0,
+            'entries': entries,
+            'bytes': size,
+        }
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+class CachedDetector:
+    """
+    Wraps a detector backend so repeated images are answered from a `ResultCache`.
+
+    Cache misses within one `predict` call are still sent to the model as a
+    single batch.
+
+    Args:
+        detector: A detector backend (see `src.inference.backends`).
+        cache (ResultCache): Where results are stored.
+        model_path (str): The detector's weights file; its hash is part of every key.
+    """
+    def __init__(self, detector, cache, model_path):
+        self.detector = detector
+        self.cache = cache
+        self.fingerprint = model_fingerprint(model_path)
+
+    def predict(self, images, conf=0.25, iou=0.45):
+        params = {'task': 'detect', 'conf': conf, 'iou': iou, 'imgsz': getattr(self.detector, 'imgsz', None)}
+        keys = [make_cache_key(hash_array(image), self.fingerprint, params) for image in images]
+        results = [self.cache.get(key) for key in keys]
+        missing = [i for i, result in enumerate(results) if result is None]
+        if missing:
+            computed = self.detector.predict([images[i] for i in missing], conf=conf, iou=iou)
+            for i, detections in zip(missing, computed):
+                self.cache.put(keys[i], detections, model=self.fingerprint)
+                results[i] = detections
+        return results
+
+class CachedSegmenter:
+    """
+    Wraps a segmenter backend so repeated windows are answered from a `ResultCache`.
+
+    Logits are stored as float16 to keep entries small.
+    """
+    def __init__(self, segmenter, cache, model_path):
+        self.segmenter = segmenter
+        self.cache = cache
+        self.fingerprint = model_fingerprint(model_path)
+
+    def predict(self, batch):
+        keys = [make_cache_key(hash_array(window), self.fingerprint, {'task': 'segment'}) for window in batch]
+        results = [self.cache.get(key) for key in keys]
+        missing = [i for i, result in enumerate(results) if result is None]
+        if missing:
+            logits = self.segmenter.predict(np.stack([batch[i] for i in missing]))
+            for i, window_logits in zip(missing, logits):
+                results[i] = {'logits': window_logits.astype(np.float16)}
+                self.cache.put(keys[i], results[i], model=self.fingerprint)
+        return np.stack([result['logits'] for result in results]).astype(np.float32)
@@ -0,0 +1,330 @@
+import argparse
+import json
+import os
+
+import numpy as np
+
+# --- Configuration ---
+# Moon (2015) geographic coordinates, in degrees.
+LUNAR_CRS = 'IAU_2015:30100'
+MOON_RADIUS_M = 1737400.0
+DEFAULT_CELL_DEG = 0.01
+DEFAULT_DEDUPE_IOU = 0.3
+# Boxes queried against the spatial index at a time while deduplicating.
+DEDUPE_QUERY_CHUNK = 16384
+CATALOG_COLUMNS = ('image_path', 'lon_min', 'lat_min', 'lon_max', 'lat_max', 'lon', 'lat',
+                   'score', 'class_id', 'n_views', 'cell')
+# Cell keys pack (column, row) grid indices into one int64.
+_CELL_STRIDE = 1 << 32
+
+def pixel_points_to_lunar(cols, rows, transform, src_crs=None, dst_crs=LUNAR_CRS):
+    """
+    Maps pixel coordinates to `dst_crs` through the raster's affine transform,
+    then through a CRS transform when the raster is projected.
+
+    Returns:
+        tuple: (xs, ys) arrays.
+    """
+    cols, rows = np.asarray(cols, dtype=np.float64), np.asarray(rows, dtype=np.float64)
+    xs = transform.a * cols + transform.b * rows + transform.c
+    ys = transform.d * cols + transform.e * rows + transform.f
+    if src_crs is not None and not src_crs.is_geographic:
+        from rasterio.warp import transform as transform_points
+
+        xs, ys = (np.asarray(v).reshape(cols.shape) for v in transform_points(src_crs, dst_crs, xs.ravel(), ys.ravel()))
+    return xs, ys
+
+def pixel_size_m(transform, crs=None, lat=None):
+    """
+    Ground size of a raster's pixels in meters, as (x size, y size).
+
+    Projected rasters are scaled from their CRS linear units. The geotransform
+    of a geographic raster is in degrees; it is converted on the lunar sphere
+    at latitude `lat`, where a degree of longitude shrinks with cos(lat).
+    Rasters without a CRS are assumed to be in meters.
+
+    Args:
+        transform (affine.Affine): The raster's pixel-to-CRS transform.
+        crs (optional): The raster's CRS.
+        lat (float or np.ndarray, optional): Latitude in degrees; required for geographic CRSs.
+
+    Returns:
+        tuple: (x_size, y_size), floats or arrays shaped like `lat`.
+    """
+    x_size, y_size = np.hypot(transform.a, transform.d), np.hypot(transform.b, transform.e)
+    if crs is None:
+        return x_size, y_size
+    if crs.is_geographic:
+        if lat is None:
+            raise ValueError("A latitude is required for the pixel size of a geographic raster.")
+        meters_per_deg = np.radians(MOON_RADIUS_M)
+        return x_size * meters_per_deg * np.cos(np.radians(lat)), y_size * meters_per_deg
+    factor = crs.linear_units_factor[1]
+    return x_size * factor, y_size * factor
+
+def box_corners_to_lunar(boxes, transform, src_crs=None, dst_crs=LUNAR_CRS):
+    """
+    Maps the four corners of every pixel box to `dst_crs`, in one vectorized pass.
+
+    Args:
+        boxes (np.ndarray): (N, 4) boxes as [xmin, ymin, xmax, ymax] in pixels.
+        transform (affine.Affine): The raster's pixel-to-CRS transform.
+        src_crs (optional): The raster's CRS; None or geographic means no reprojection.
+        dst_crs: Target CRS.
+
+    Returns:
+        tuple: (xs, ys), each (N, 4), corners in the order
+               (xmin, ymin), (xmax, ymin), (xmax, ymax), (xmin, ymax).
+    """
+    boxes = np.asarray(boxes, dtype=np.float64).reshape(-1, 4)
+    return pixel_points_to_lunar(boxes[:, [0, 2, 2, 0]], boxes[:, [1, 1, 3, 3]], transform, src_crs, dst_crs)
+
+def pixel_boxes_to_lunar(boxes, transform, src_crs=None, dst_crs=LUNAR_CRS):
+    """
+    Converts pixel boxes to lunar longitude/latitude boxes.
+
+    Each output box is the lon/lat envelope of the box's transformed corners
+    (see `box_corners_to_lunar`).
+
+    Returns:
+        np.ndarray: (N, 4) boxes as [lon_min, lat_min, lon_max, lat_max].
+    """
+    xs, ys = box_corners_to_lunar(boxes, transform, src_crs, dst_crs)
+    return np.stack([xs.min(axis=1), ys.min(axis=1), xs.max(axis=1), ys.max(axis=1)], axis=1)
+
+def cell_keys(lon, lat, cell_deg=DEFAULT_CELL_DEG):
+    """Grid cell key of each point."""
+    col = np.floor((np.asarray(lon) + 360.0) / cell_deg).astype(np.int64)
+    row = np.floor((np.asarray(lat) + 90.0) / cell_deg).astype(np.int64)
+    return col * _CELL_STRIDE + row
+
+def _intersecting_pairs(lunar_boxes, image_ids, chunk_size=DEDUPE_QUERY_CHUNK):
+    """
+    Yields (first, second) index arrays of boxes from different images that intersect, with first < second.
+
+    Boxes are indexed in an STR-tree and queried `chunk_size` at a time, so
+    memory follows the number of intersecting pairs in a chunk rather than
+    the density of detections.
+    """
+    import shapely
+
+    boxes = shapely.box(lunar_boxes[:, 0], lunar_boxes[:, 1], lunar_boxes[:, 2], lunar_boxes[:, 3])
+    tree = shapely.STRtree(boxes)
+    for c0 in range(0, len(boxes), chunk_size):
+        query, found = tree.query(boxes[c0:c0 + chunk_size], predicate='intersects')
+        first = query + c0
+        candidate = (first < found) & (image_ids[first] != image_ids[found])
+        yield first[candidate], found[candidate]
+
+def _box_iou(a, b):
+    width = np.clip(np.minimum(a[:, 2], b[:, 2]) - np.maximum(a[:, 0], b[:, 0]), 0, None)
+    height = np.clip(np.minimum(a[:, 3], b[:, 3]) - np.maximum(a[:, 1], b[:, 1]), 0, None)
+    inter = width * height
+    area_a = (a[:, 2] - a[:, 0]) * (a[:, 3] - a[:, 1])
+    area_b = (b[:, 2] - b[:, 0]) * (b[:, 3] - b[:, 1])
+    return inter / np.maximum(area_a + area_b - inter, 1e-30)
+
+def deduplicate_detections(lunar_boxes, scores, image_ids, iou_threshold=DEFAULT_DEDUPE_IOU):
+    """
+    Finds the same object seen in several overlapping scenes.
+
+    Candidate pairs are the intersecting boxes from different images, found
+    with an STR-tree (see `_intersecting_pairs`); pairs that overlap by at
+    least `iou_threshold` are duplicates. Detections are then visited by
+    descending score, and each one not yet merged is kept and absorbs at most
+    one remaining duplicate per other image, the one it overlaps most. Two
+    detections from the same image are never merged, so neighbouring objects
+    in one scene survive even when a box from another scene overlaps both.
+
+    Returns:
+        tuple: (indices of the detections to keep, in ascending order, and the
+                number of images each kept detection was seen in).
+    """
+    count = len(scores)
+    n_views = np.ones(count, dtype=np.int64)
+    if count == 0:
+        return np.zeros(0, dtype=np.int64), n_views
+    scores = np.asarray(scores)
+    image_ids = np.asarray(image_ids)
+    links, overlaps = [np.zeros((2, 0), dtype=np.int64)], [np.zeros(0)]
+    for first, second in _intersecting_pairs(lunar_boxes, image_ids):
+        iou = _box_iou(lunar_boxes[first], lunar_boxes[second])
+        duplicate = iou >= iou_threshold
+        links.append(np.stack([first[duplicate], second[duplicate]]))
+        overlaps.append(iou[duplicate])
+    links, overlaps = np.concatenate(links, axis=1), np.concatenate(overlaps)
+
+    # Duplicates of each detection, most overlapping first (ties by index), as CSR rows.
+    source = np.concatenate([links[0], links[1]])
+    target = np.concatenate([links[1], links[0]])
+    order = np.lexsort((target, -np.concatenate([overlaps, overlaps]), source))
+    source, target = source[order], target[order]
+    starts = np.searchsorted(source, np.arange(count + 1))
+
+    # Only detections with duplicates need the greedy pass.
+    linked = np.unique(source)
+    taken = np.zeros(count, dtype=bool)
+    merged = np.zeros(count, dtype=bool)
+    for k in linked[np.argsort(-scores[linked], kind='stable')]:
+        if taken[k]:
+            continue
+        taken[k] = True
+        seen = {image_ids[k]}
+        for j in target[starts[k]:starts[k + 1]]:
+            if not taken[j] and image_ids[j] not in seen:
+                taken[j] = merged[j] = True
+                seen.add(image_ids[j])
+        n_views[k] = len(seen)
+    keep = np.flatnonzero(~merged)
+    return keep, n_views[keep]
+
+def read_georeference(image_path):
+    """Returns (transform, crs) of a georeferenced image, or None."""
+    import rasterio
+
+    try:
+        with rasterio.open(image_path) as dataset:
+            if dataset.crs is None:
+                return None
+            return dataset.transform, dataset.crs
+    except rasterio.errors.RasterioIOError:
+        return None
+
+def build_detection_catalog(detections_path, output_path='runs/catalog/detections.parquet', cell_deg=DEFAULT_CELL_DEG,
+                            dedupe_iou=DEFAULT_DEDUPE_IOU, dst_crs=LUNAR_CRS, row_group_size=65536):
+    """
+    Builds a geospatial catalog from the pixel detections written by `predict.py` or `sliced.py`.
+
+    Boxes are converted to lunar coordinates per image, duplicates from
+    overlapping scenes are merged, and the result is written to Parquet
+    sorted by grid cell, so each row group covers a compact area and its `cell`
+    statistics let Parquet readers skip it. A small JSON sidecar records the
+    grid size and CRS for `DetectionCatalog`.
+
+    Args:
+        detections_path (str): Parquet results file with pixel boxes.
+        output_path (str): Catalog Parquet file.
+        cell_deg (float): Grid cell size in degrees.
+        dedupe_iou (float): Overlap above which detections from different scenes are merged; None disables.
+        dst_crs: Geographic CRS of the catalog.
+        row_group_size (int): Rows per Parquet row group.
+
+    Returns:
+        int: The number of catalogued detections.
+    """
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    print("--- Building Detection Catalog ---")
+    table = pq.read_table(detections_path, columns=['image_path', 'xmin', 'ymin', 'xmax', 'ymax', 'score', 'class_id'])
+    image_paths = table['image_path'].to_numpy(zero_copy_only=False)
+    image_names, image_ids = np.unique(image_paths, return_inverse=True)
+    pixel_boxes = np.stack([table[name].to_numpy() for name in ('xmin', 'ymin', 'xmax', 'ymax')], axis=1)
+
+    lunar_boxes = np.full(pixel_boxes.shape, np.nan)
+    skipped = 0
+    rows_by_image = np.split(np.argsort(image_ids, kind='stable'), np.cumsum(np.bincount(image_ids))[:-1])
+    for image_path, rows in zip(image_names, rows_by_image):
+        georeference = read_georeference(image_path)
+        if georeference is None:
+            skipped += len(rows)
+            continue
+        lunar_boxes[rows] = pixel_boxes_to_lunar(pixel_boxes[rows], *georeference, dst_crs=dst_crs)
+    if skipped:
+        print(f"Skipped {skipped} detections from images without georeferencing.")
+
+    valid = np.flatnonzero(~np.isnan(lunar_boxes[:, 0]))
+    scores = table['score'].to_numpy()[valid]
+    n_views = np.ones(len(valid), dtype=np.int64)
+    if dedupe_iou is not None:
+        keep, n_views = deduplicate_detections(lunar_boxes[valid], scores, image_ids[valid], dedupe_iou)
+        print(f"Merged {len(valid) - len(keep)} duplicate detections from overlapping scenes.")
+        valid = valid[keep]
+
+    boxes = lunar_boxes[valid]
+    lon, lat = (boxes[:, 0] + boxes[:, 2]) / 2, (boxes[:, 1] + boxes[:, 3]) / 2
+    keys = cell_keys(lon, lat, cell_deg)
+    order = np.argsort(keys, kind='stable')
+    columns = {
+        'image_path': image_paths[valid], 'lon_min': boxes[:, 0], 'lat_min': boxes[:, 1],
+        'lon_max': boxes[:, 2], 'lat_max': boxes[:, 3], 'lon': lon, 'lat': lat,
+        'score': table['score'].to_numpy()[valid], 'class_id': table['class_id'].to_numpy()[valid],
+        'n_views': n_views, 'cell': keys,
+    }
+    catalog = pa.table({name: columns[name][order] for name in CATALOG_COLUMNS})
+    os.makedirs(os.path.dirname(output_path) or '.', exist_ok=True)
+    pq.write_table(catalog, output_path, row_group_size=row_group_size, compression='zstd')
+
+    with open(f"{output_path}.index.json", 'w') as f:
+        json.dump({'cell_deg': cell_deg, 'crs': str(dst_crs), 'rows': len(keys)}, f)
+    print(f"{len(keys)} detections catalogued to: {output_path}")
+    return len(keys)
+
+class DetectionCatalog:
+    """
+    Answers bounding-box queries over a catalog written by `build_detection_catalog`.
+
+    The box columns are loaded once and indexed by grid cell (the file is
+    already sorted by cell), so a query touches only the rows of the cells it
+    overlaps plus the boxes reaching in from neighbouring cells.
+    """
+    def __init__(self, path):
+        import pyarrow.parquet as pq
+
+        with open(f"{path}.index.json") as f:
+            self.index = json.load(f)
+        self.path = path
+        self.cell_deg = self.index['cell_deg']
+        table = pq.read_table(path, columns=['lon_min', 'lat_min', 'lon_max', 'lat_max', 'cell'])
+        self.cells = table['cell'].to_numpy()
+        self.boxes = np.stack([table[name].to_numpy() for name in ('lon_min', 'lat_min', 'lon_max', 'lat_max')], axis=1)
+        # Boxes can reach this far outside the cell holding their center.
+        self.margin = float(np.max(self.boxes[:, 2:] - self.boxes[:, :2]) / 2) if len(self.boxes) else 0.0
+        self._table = None
+
+    def __len__(self):
+        return len(self.cells)
+
+    def query_indices(self, lon_min, lat_min, lon_max, lat_max):
+        """Returns the catalog rows whose boxes intersect the query box."""
+        pad = self.margin
+        first_col, first_row = divmod(int(cell_keys(lon_min - pad, lat_min - pad, self.cell_deg)), _CELL_STRIDE)
+        last_col, last_row = divmod(int(cell_keys(lon_max + pad, lat_max + pad, self.cell_deg)), _CELL_STRIDE)
+
+        # Each grid column of the query is one contiguous key range in the sorted file.
+        columns = np.arange(first_col, last_col + 1, dtype=np.int64)
+        lo = np.searchsorted(self.cells, columns * _CELL_STRIDE + first_row, side='left')
+        hi = np.searchsorted(self.cells, columns * _CELL_STRIDE + last_row, side='right')
+        candidates = np.concatenate([np.arange(a, b) for a, b in zip(lo, hi)] + [np.zeros(0, dtype=np.int64)])
+        boxes = self.boxes[candidates]
+        hit = ((boxes[:, 0] <= lon_max) & (boxes[:, 2] >= lon_min) &
+               (boxes[:, 1] <= lat_max) & (boxes[:, 3] >= lat_min))
+        return candidates[hit]
+
+    def query(self, lon_min, lat_min, lon_max, lat_max):
+        """
+        Returns every detection intersecting a lon/lat box.
+
+        Returns:
+            pyarrow.Table: The matching catalog rows.
+        """
+        import pyarrow.parquet as pq
+
+        if self._table is None:
+            self._table = pq.read_table(self.path)
+        return self._table.take(self.query_indices(lon_min, lat_min, lon_max, lat_max))
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Build a lunar-coordinate catalog from pixel detections.")
+    parser.add_argument("detections", help="Parquet results from predict.py or sliced.py.")
+    parser.add_argument("--output", default='runs/catalog/detections.parquet', help="Catalog Parquet file.")
+    parser.add_argument("--cell-deg", type=float, default=DEFAULT_CELL_DEG, help="Grid cell size in degrees.")
+    parser.add_argument("--dedupe-iou", type=float, default=DEFAULT_DEDUPE_IOU, help="Overlap for merging detections across scenes.")
+    parser.add_argument("--query", type=float, nargs=4, metavar=('LON_MIN', 'LAT_MIN', 'LON_MAX', 'LAT_MAX'),
+                        help="Print the detections inside this box after building.")
+    args = parser.parse_args()
+
+    build_detection_catalog(args.detections, args.output, cell_deg=args.cell_deg, dedupe_iou=args.dedupe_iou)
+    if args.query:
+        result = DetectionCatalog(args.output).query(*args.query)
+        print(f"{result.num_rows} detections in the query box.")
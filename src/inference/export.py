@@ -0,0 +1,100 @@
+import argparse
+import os
+
+import numpy as np
+import torch
+
+from src.inference.backends import UNetOnnxSegmenter, YoloOnnxDetector, YoloTorchDetector, check_parity
+from src.models.unet import UNet, UNET_VARIANTS
+
+# --- Configuration ---
+UNET_CHECKPOINT = 'models/unet_landslide_detector_best.pth'
+YOLO_CHECKPOINT = 'models/lunar_rockfall_detector.pt'
+INPUT_CHANNELS = 3
+NUM_CLASSES = 3
+OPSET = 18
+
+def export_unet_onnx(checkpoint_path, output_path, variant='classic', input_size=256, opset=OPSET):
+    """
+    Exports a trained UNet to ONNX with dynamic batch, height and width axes.
+
+    Args:
+        checkpoint_path (str): Float UNet state_dict saved by `train.py`.
+        output_path (str): Destination .onnx file.
+        variant (str): UNet preset the checkpoint was trained with.
+        input_size (int): Size of the example input used for tracing.
+        opset (int): ONNX opset version.
+
+    Returns:
+        tuple: (output_path, model) so callers can run a parity check.
+    """
+    model = UNet(INPUT_CHANNELS, NUM_CLASSES, **UNET_VARIANTS[variant])
+    model.load_state_dict(torch.load(checkpoint_path, map_location='cpu'))
+    model.eval()
+
+    os.makedirs(os.path.dirname(output_path) or '.', exist_ok=True)
+    example = torch.randn(1, INPUT_CHANNELS, input_size, input_size)
+    torch.onnx.export(
+        model, (example,), output_path,
+        input_names=['input'], output_names=['logits'],
+        dynamic_axes={'input': {0: 'batch', 2: 'height', 3: 'width'},
+                      'logits': {0: 'batch', 2: 'height', 3: 'width'}},
+        opset_version=opset, dynamo=False)
+    print(f"UNet exported to: {output_path}")
+    return output_path, model
+
+def export_yolo_onnx(model_path, imgsz=640, opset=OPSET):
+    """
+    Exports a trained YOLOv8 detector to ONNX with dynamic batch and spatial axes.
+
+    The .onnx file is written next to the .pt checkpoint by ultralytics.
+
+    Returns:
+        str: Path of the exported model.
+    """
+    from ultralytics import YOLO
+
+    output_path = YOLO(model_path).export(format='onnx', dynamic=True, imgsz=imgsz, opset=opset, simplify=False)
+    print(f"YOLOv8 detector exported to: {output_path}")
+    return str(output_path)
+
+def check_unet_parity(model, onnx_path, input_size=256, batch_size=2, num_threads=None):
+    """Compares PyTorch and ONNX Runtime UNet logits on a random batch."""
+    inputs = np.random.default_rng(0).random((batch_size, INPUT_CHANNELS, input_size, input_size), dtype=np.float32)
+    segmenter = UNetOnnxSegmenter(onnx_path, num_threads=num_threads)
+
+    def reference(batch):
+        with torch.no_grad():
+            return model(torch.from_numpy(batch)).numpy()
+
+    return check_parity(reference, segmenter.predict, inputs)
+
+def check_yolo_parity(model_path, onnx_path, imgsz=640, batch_size=2, num_threads=None):
+    """Compares PyTorch and ONNX Runtime raw YOLOv8 head outputs on a random batch."""
+    inputs = np.random.default_rng(0).random((batch_size, 3, imgsz, imgsz), dtype=np.float32)
+    reference = YoloTorchDetector(model_path, imgsz=imgsz)
+    candidate = YoloOnnxDetector(onnx_path, num_threads=num_threads, imgsz=imgsz)
+    return check_parity(reference.forward, candidate.forward, inputs, rtol=1e-3, atol=1e-3)
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Export the UNet and YOLOv8 models to ONNX.")
+    parser.add_argument("--unet", default=None, help=f"UNet state_dict to export (e.g. {UNET_CHECKPOINT}).")
+    parser.add_argument("--unet-variant", default='classic', choices=sorted(UNET_VARIANTS), help="UNet preset of the checkpoint.")
+    parser.add_argument("--unet-output", default='models/unet_landslide_detector.onnx', help="Destination for the UNet .onnx file.")
+    parser.add_argument("--yolo", default=None, help=f"YOLOv8 checkpoint to export (e.g. {YOLO_CHECKPOINT}).")
+    parser.add_argument("--imgsz", type=int, default=640, help="YOLOv8 input size used for the parity check.")
+    parser.add_argument("--threads", type=int, default=None, help="ONNX Runtime intra-op threads for the parity check.")
+    args = parser.parse_args()
+
+    if not args.unet and not args.yolo:
+        parser.error("Nothing to export: pass --unet and/or --yolo.")
+
+    if args.unet:
+        print("--- Exporting UNet ---")
+        unet_path, unet_model = export_unet_onnx(args.unet, args.unet_output, variant=args.unet_variant)
+        print(f"Parity (PyTorch vs ONNX Runtime): {check_unet_parity(unet_model, unet_path, num_threads=args.threads)}")
+
+    if args.yolo:
+        print("--- Exporting YOLOv8 ---")
+        yolo_path = export_yolo_onnx(args.yolo, imgsz=args.imgsz)
+        print(f"Parity (PyTorch vs ONNX Runtime): {check_yolo_parity(args.yolo, yolo_path, imgsz=args.imgsz, num_threads=args.threads)}")
@@ -0,0 +1,114 @@
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+# --- Configuration ---
+DEFAULT_NUM_WORKERS = 1
+DEFAULT_MAX_RESULTS = 32
+
+class Job:
+    """
+    One background analysis job and its progress.
+
+    `status` is 'queued', 'running', 'done' or 'failed'. `progress` goes from
+    0 to 1, and `message` describes the current step. Jobs that produce
+    several results (e.g. one per file) can publish them to `partial` as
+    they finish.
+    """
+    def __init__(self, key):
+        self.key = key
+        self.status = 'queued'
+        self.progress = 0.0
+        self.message = 'Queued'
+        self.result = None
+        self.partial = []
+        self.error = None
+        self.submitted = time.time()
+        self.started = None
+        self.finished = None
+        self.future = None
+
+    @property
+    def done(self):
+        return self.status in ('done', 'failed')
+
+    def report(self, fraction, message=None, item=None):
+        """Progress callback passed to the job function; `item` is appended to `partial`."""
+        self.progress = min(max(float(fraction), 0.0), 1.0)
+        if message is not None:
+            self.message = message
+        if item is not None:
+            self.partial.append(item)
+
+class JobQueue:
+    """
+    Runs analysis jobs on background worker threads, shared by every caller.
+
+    Jobs are keyed (e.g. by upload hash and parameters). Submitting a key that
+    is already queued, running or finished returns the existing job, so
+    repeated requests for the same input are computed once. The most recent
+    `max_results` finished jobs are kept; failed jobs can be resubmitted.
+
+    Keeping the models in one process and funnelling work through a small
+    worker pool lets many dashboard sessions share them without blocking the
+    page scripts.
+    """
+    def __init__(self, num_workers=DEFAULT_NUM_WORKERS, max_results=DEFAULT_MAX_RESULTS):
+        self.max_results = max_results
+        self._executor = ThreadPoolExecutor(max_workers=num_workers, thread_name_prefix='analysis')
+        self._jobs = OrderedDict()
+        self._lock = threading.Lock()
+
+    def submit(self, key, fn, *args, **kwargs):
+        """
+        Queues `fn(*args, progress=job.report, **kwargs)` unless a job for `key` already exists.
+
+        Returns:
+            Job: The new or existing job.
+        """
+        with self._lock:
+            job = self._jobs.get(key)
+            if job is not None and job.status != 'failed':
+                self._jobs.move_to_end(key)
+                return job
+            job = Job(key)
+            self._jobs[key] = job
+            job.future = self._executor.submit(self._run, job, fn, args, kwargs)
+            return job
+
+    def get(self, key):
+        """Returns the job for `key`, or None."""
+        with self._lock:
+            return self._jobs.get(key)
+
+    def _run(self, job, fn, args, kwargs):
+        job.status, job.started, job.message = 'running', time.time(), 'Running'
+        try:
+            result, error = fn(*args, progress=job.report, **kwargs), None
+        except Exception as e:
+            result, error = None, e
+        # Finishing and evicting together keeps exactly `max_results` finished jobs.
+        with self._lock:
+            if error is None:
+                job.result, job.status, job.progress, job.message = result, 'done', 1.0, 'Done'
+            else:
+                job.error, job.status, job.message = error, 'failed', f"Failed: {error}"
+            job.finished = time.time()
+            self._evict()
+
+    def _evict(self):
+        finished = [key for key, job in self._jobs.items() if job.done]
+        for key in finished[:max(0, len(finished) - self.max_results)]:
+            del self._jobs[key]
+
+    def stats(self):
+        """Number of jobs per status."""
+        with self._lock:
+            counts = {'queued': 0, 'running': 0, 'done': 0, 'failed': 0}
+            for job in self._jobs.values():
+                counts[job.status] += 1
+            return counts
+
+    def shutdown(self, wait=True):
+        self._executor.shutdown(wait=wait)
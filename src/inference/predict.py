@@ -1,15 +1,258 @@
+import argparse
 import os
-from ultralytics import YOLO
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+import cv2
+import numpy as np
 from PIL import Image
 
-def run_inference(model_path, image_path, output_dir='runs/inference'):
+from src.inference.backends import BACKENDS, load_detector, prepare_image
+from src.inference.cache import CachedDetector, ResultCache
+
+CLASS_NAMES = ['rockfall']
+BOX_COLOR = (255, 255, 0)
+IMAGE_EXTENSIONS = ('.tif', '.tiff', '.png', '.jpg', '.jpeg')
+DETECTION_COLUMNS = ['image_path', 'image_width', 'image_height',
+                     'xmin', 'ymin', 'xmax', 'ymax', 'score', 'class_id']
+
+def draw_detections(image, detections, class_names=CLASS_NAMES):
+    """
+    Draws detection boxes and confidences on a copy of an image.
+
+    Args:
+        image (np.ndarray): HxWx3 uint8 RGB image.
+        detections (dict): Detections dict as returned by a detector backend.
+        class_names (list): Names used to label each class index.
+
+    Returns:
+        np.ndarray: The annotated RGB image.
+    """
+    annotated = prepare_image(image).copy()
+    thickness = max(1, round(sum(annotated.shape[:2]) / 1000))
+    for box, score, class_id in zip(detections['boxes'], detections['scores'], detections['class_ids']):
+        x1, y1, x2, y2 = (int(round(v)) for v in box)
+        name = class_names[class_id] if class_id < len(class_names) else str(class_id)
+        cv2.rectangle(annotated, (x1, y1), (x2, y2), BOX_COLOR, thickness)
+        cv2.putText(annotated, f"{name} {score:.2f}", (x1, max(y1 - 4, 10)),
+                    cv2.FONT_HERSHEY_SIMPLEX, 0.4 * thickness, BOX_COLOR, thickness)
+    return annotated
+
+def save_annotated_image(output_path, image, detections):
+    """Draws detections on an image and saves it."""
+    Image.fromarray(draw_detections(image, detections)).save(output_path)
+
+def load_image(image_path):
+    """Decodes an image file into a numpy array, keeping its native bit depth."""
+    with Image.open(image_path) as img:
+        return np.array(img)
+
+def iter_image_paths(source):
+    """
+    Lists the images to process.
+
+    Args:
+        source (str): A directory of images, or a manifest file (.txt with one
+                      path per line, or .csv with an 'image_path' column).
+
+    Returns:
+        list: Image file paths, sorted for directories, in file order for manifests.
+    """
+    if os.path.isdir(source):
+        return sorted(os.path.join(source, f) for f in os.listdir(source)
+                      if f.lower().endswith(IMAGE_EXTENSIONS))
+    if source.lower().endswith('.csv'):
+        import pandas as pd
+        return pd.read_csv(source)['image_path'].tolist()
+    with open(source) as f:
+        return [line.strip() for line in f if line.strip()]
+
+def prefetch_images(image_paths, num_workers=4, max_pending=None):
+    """
+    Decodes images in a background thread pool while the caller runs the model.
+
+    At most `max_pending` images are decoded ahead of the consumer, so memory
+    stays bounded however many paths there are. Images are yielded in input order.
+
+    Yields:
+        tuple: (image_path, image array or None if decoding failed)
+    """
+    max_pending = max_pending or 4 * num_workers
+    paths = iter(image_paths)
+    pending = deque()
+    with ThreadPoolExecutor(max_workers=num_workers) as pool:
+        for path in paths:
+            pending.append((path, pool.submit(load_image, path)))
+            if len(pending) >= max_pending:
+                break
+        while pending:
+            path, future = pending.popleft()
+            next_path = next(paths, None)
+            if next_path is not None:
+                pending.append((next_path, pool.submit(load_image, next_path)))
+            try:
+                yield path, future.result()
+            except Exception as e:
+                print(f"Warning: Could not decode {path}, skipping: {e}")
+                yield path, None
+
+def iter_batches(items, batch_size):
+    """Groups an iterable into lists of at most `batch_size` items."""
+    batch = []
+    for item in items:
+        batch.append(item)
+        if len(batch) == batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+def detections_to_columns(image_path, image_shape, detections):
+    """Flattens one image's detections into the columns of the results file."""
+    count = len(detections['scores'])
+    boxes = detections['boxes']
+    return {
+        'image_path': [image_path] * count,
+        'image_width': np.full(count, image_shape[1], dtype=np.int32),
+        'image_height': np.full(count, image_shape[0], dtype=np.int32),
+        'xmin': boxes[:, 0], 'ymin': boxes[:, 1], 'xmax': boxes[:, 2], 'ymax': boxes[:, 3],
+        'score': detections['scores'],
+        'class_id': detections['class_ids'],
+    }
+
+class DetectionWriter:
+    """
+    Streams detections to a columnar Parquet file, one row group per batch.
+    A path ending in .csv writes a CSV file instead.
+    """
+    def __init__(self, output_path):
+        os.makedirs(os.path.dirname(output_path) or '.', exist_ok=True)
+        self.output_path = output_path
+        self.rows_written = 0
+        self._writer = None
+        self._is_csv = output_path.lower().endswith('.csv')
+        if self._is_csv:
+            import pandas as pd
+            pd.DataFrame(columns=DETECTION_COLUMNS).to_csv(output_path, index=False)
+
+    def write(self, columns_list):
+        columns = {name: np.concatenate([np.asarray(c[name]) for c in columns_list]) for name in DETECTION_COLUMNS}
+        if len(columns['score']) == 0:
+            return
+        if self._is_csv:
+            import pandas as pd
+            pd.DataFrame(columns).to_csv(self.output_path, mode='a', header=False, index=False)
+        else:
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+
+            table = pa.table(columns)
+            if self._writer is None:
+                self._writer = pq.ParquetWriter(self.output_path, table.schema, compression='zstd')
+            self._writer.write_table(table)
+        self.rows_written += len(columns['score'])
+
+    def close(self):
+        if self._writer is not None:
+            self._writer.close()
+        elif not self._is_csv:
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+
+            # No detections at all: still leave a valid, empty results file.
+            schema = pa.schema([('image_path', pa.string()), ('image_width', pa.int32()), ('image_height', pa.int32()),
+                                ('xmin', pa.float32()), ('ymin', pa.float32()), ('xmax', pa.float32()),
+                                ('ymax', pa.float32()), ('score', pa.float32()), ('class_id', pa.int32())])
+            pq.write_table(schema.empty_table(), self.output_path)
+
+def run_batch_inference(model_path, source, output_path='runs/inference/detections.parquet', batch_size=16,
+                        num_workers=4, annotate_dir=None, backend='auto', num_threads=None, conf=0.25, iou=0.45,
+                        detector=None, cache_dir=None):
+    """
+    Runs YOLOv8 inference over a directory or manifest of images.
+
+    The model is loaded once, images are decoded by a prefetching thread pool
+    and pushed through the model in fixed-size batches, and every detection is
+    appended to a columnar results file.
+
+    Args:
+        model_path (str): Path to the trained .pt model file or its exported .onnx model.
+        source (str): Image directory or manifest file (see `iter_image_paths`).
+        output_path (str): Results file (.parquet, or .csv).
+        batch_size (int): Number of images per forward pass.
+        num_workers (int): Decode threads.
+        annotate_dir (str, optional): If given, annotated images are saved here.
+        backend (str): 'torch', 'onnx', or 'auto' to choose from the model's file extension.
+        num_threads (int, optional): CPU threads used by the inference backend.
+        conf (float): Minimum detection confidence.
+        iou (float): NMS IoU threshold.
+        detector (optional): An already-loaded detector; `model_path` is then ignored.
+        cache_dir (str, optional): Result cache directory; images already analysed with
+                                   the same weights and parameters skip the model.
+                                   Requires `model_path`, whose hash is part of every key.
+
+    Returns:
+        dict: Number of images processed, images that failed to decode, and detections written.
+    """
+    if cache_dir and model_path is None:
+        raise ValueError("cache_dir requires model_path: cached results are keyed by the model's weights.")
+
+    print("--- Running Batch Inference ---")
+    image_paths = iter_image_paths(source)
+    print(f"Found {len(image_paths)} images in {source}")
+
+    if detector is None:
+        detector = load_detector(model_path, backend=backend, num_threads=num_threads)
+    cache = None
+    if cache_dir:
+        cache = ResultCache(cache_dir)
+        detector = CachedDetector(detector, cache, model_path)
+    if annotate_dir:
+        os.makedirs(annotate_dir, exist_ok=True)
+
+    writer = DetectionWriter(output_path)
+    stats = {'images': 0, 'failed': 0, 'detections': 0}
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=num_workers) as save_pool:
+        try:
+            for batch in iter_batches(prefetch_images(image_paths, num_workers), batch_size):
+                loaded = [(path, image) for path, image in batch if image is not None]
+                stats['failed'] += len(batch) - len(loaded)
+                if not loaded:
+                    continue
+                results = detector.predict([image for _, image in loaded], conf=conf, iou=iou)
+                writer.write([detections_to_columns(path, image.shape, dets)
+                              for (path, image), dets in zip(loaded, results)])
+                if annotate_dir:
+                    for (path, image), dets in zip(loaded, results):
+                        output_image = os.path.join(annotate_dir, os.path.splitext(os.path.basename(path))[0] + '.png')
+                        save_pool.submit(save_annotated_image, output_image, image, dets)
+                stats['images'] += len(loaded)
+        finally:
+            writer.close()
+
+    elapsed = time.perf_counter() - start
+    stats['detections'] = writer.rows_written
+    print(f"Processed {stats['images']} images ({stats['failed']} failed) in {elapsed:.1f}s "
+          f"({3600 * stats['images'] / max(elapsed, 1e-9):.0f} images/hour).")
+    print(f"{stats['detections']} detections written to: {output_path}")
+    if cache is not None:
+        print(f"Result cache: {cache.stats()}")
+        cache.close()
+    return stats
+
+def run_inference(model_path, image_path, output_dir='runs/inference', backend='auto', num_threads=None, detector=None):
     """
     Runs YOLOv8 inference on a single image and saves the result.
 
     Args:
-        model_path (str): Path to the trained .pt model file.
+        model_path (str): Path to the trained .pt model file or its exported .onnx model.
         image_path (str): Path to the input image.
         output_dir (str): Directory to save the output image with detections.
+        backend (str): 'torch', 'onnx', or 'auto' to choose from the model's file extension.
+        num_threads (int, optional): CPU threads used by the inference backend.
+        detector (optional): An already-loaded detector; `model_path` is then ignored.
     """
     print(f"--- Running Inference ---")
     print(f"Model: {model_path}")
@@ -19,25 +262,20 @@ def run_inference(model_path, image_path, output_dir='runs/inference'):
     os.makedirs(output_dir, exist_ok=True)
 
     # Load the trained YOLOv8 model
-    try:
-        model = YOLO(model_path)
-    except Exception as e:
-        print(f"Error loading model: {e}")
-        return
+    if detector is None:
+        try:
+            detector = load_detector(model_path, backend=backend, num_threads=num_threads)
+        except Exception as e:
+            print(f"Error loading model: {e}")
+            return
 
     # Run inference on the image
-    results = model(image_path)
+    image = load_image(image_path)
+    detections = detector.predict([image])[0]
+    print(f"Detected {len(detections['scores'])} objects.")
 
-    # The results object contains all information.
-    # We can access bounding boxes, masks, confidences, etc.
-    # For now, we will just save the plotted image.
-    
-    # Plot the results on the image
-    # The plot() method returns a BGR numpy array
-    annotated_image_array = results[0].plot()
-
-    # Convert the BGR numpy array to an RGB image
-    annotated_image = Image.fromarray(annotated_image_array[..., ::-1])  # BGR to RGB
+    # Draw the detections on the image
+    annotated_image = Image.fromarray(draw_detections(image, detections))
 
     # Save the annotated image
     base_filename = os.path.basename(image_path)
@@ -47,10 +285,31 @@ def run_inference(model_path, image_path, output_dir='runs/inference'):
     print(f"\nInference complete. Annotated image saved to: {output_path}")
 
 if __name__ == '__main__':
-    # Define the paths for the model and a sample test image
+    # Define the paths for the model and the test images
     MODEL_PATH = 'models/lunar_rockfall_detector.pt'
-    
-    # TODO: This should be replaced with a proper data loading mechanism
-    TEST_IMAGE = 'data/raw/moon/test_images/neg1.tif' 
+    TEST_IMAGES = 'data/raw/moon/test_images'
+
+    parser = argparse.ArgumentParser(description="Run YOLOv8 detection on a single image or a whole directory.")
+    parser.add_argument("--model", default=MODEL_PATH, help="Trained .pt model or exported .onnx model.")
+    parser.add_argument("--source", default=TEST_IMAGES, help="An image, a directory of images, or a manifest (.txt/.csv).")
+    parser.add_argument("--output", default='runs/inference/detections.parquet', help="Columnar results file (.parquet or .csv).")
+    parser.add_argument("--batch-size", type=int, default=16, help="Images per forward pass.")
+    parser.add_argument("--workers", type=int, default=4, help="Image decoding threads.")
+    parser.add_argument("--annotate-dir", default=None, help="Also save annotated images to this directory.")
+    parser.add_argument("--backend", default='auto', choices=BACKENDS, help="Inference backend.")
+    parser.add_argument("--threads", type=int, default=None, help="CPU threads used by the backend.")
+    parser.add_argument("--conf", type=float, default=0.25, help="Minimum detection confidence.")
+    parser.add_argument("--cache-dir", default=None, help="Reuse cached results for images seen before with the same model.")
+    parser.add_argument("--sliced", action="store_true", help="Treat the source as one large scene and detect on overlapping slices.")
+    args = parser.parse_args()
 
-    run_inference(MODEL_PATH, TEST_IMAGE)
+    if args.sliced:
+        from src.inference.sliced import run_sliced_inference
+        run_sliced_inference(args.model, args.source, output_path=args.output, batch_size=args.batch_size,
+                             backend=args.backend, num_threads=args.threads, conf=args.conf)
+    elif os.path.isfile(args.source) and args.source.lower().endswith(IMAGE_EXTENSIONS):
+        run_inference(args.model, args.source, backend=args.backend, num_threads=args.threads)
+    else:
+        run_batch_inference(args.model, args.source, output_path=args.output, batch_size=args.batch_size,
+                            num_workers=args.workers, annotate_dir=args.annotate_dir, backend=args.backend,
+                            num_threads=args.threads, conf=args.conf, cache_dir=args.cache_dir)
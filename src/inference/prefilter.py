@@ -0,0 +1,233 @@
+import argparse
+import json
+import os
+
+import numpy as np
+
+FEATURE_NAMES = ('variance', 'gradient_energy', 'shadow_fraction', 'max_slope_deg')
+DEFAULT_SHADOW_LEVEL = 0.08
+
+def _to_gray_float(tiles, input_range):
+    """Stacks equally-shaped tiles into (N, H, W) float32 intensities, `input_range` mapped to [0, 1]."""
+    stack = np.stack([np.asarray(t) for t in tiles]).astype(np.float32)
+    if stack.ndim == 4:
+        stack = stack.mean(axis=3)
+    low, high = input_range
+    return (stack - low) / max(high - low, 1e-6)
+
+def compute_tile_statistics(tiles, dtm_tiles=None, shadow_level=DEFAULT_SHADOW_LEVEL, pixel_scale=1.0,
+                            input_range=None):
+    """
+    Computes cheap per-tile statistics for a batch of tiles in one vectorized pass.
+
+    Intensities are normalized with one fixed `input_range`, so that the
+    statistics (and the thresholds calibrated on them) do not depend on the
+    bit depth of the data. 8-bit tiles default to (0, 255); for other data
+    pass the scene's contrast stretch (see `SceneReader.percentile_stretch`).
+
+    Args:
+        tiles (list or np.ndarray): Image tiles (HxW or HxWxC). Tiles of different
+                                    sizes are grouped by shape and processed together.
+        dtm_tiles (list or np.ndarray, optional): Matching DTM tiles in meters.
+        shadow_level (float): Normalized intensity below which a pixel counts as shadow.
+        pixel_scale (float): DTM pixel size in meters, for the slope computation.
+        input_range (tuple, optional): (low, high) intensities mapped to 0 and 1.
+
+    Returns:
+        np.ndarray: (N, 4) features, in the order of `FEATURE_NAMES`. The slope
+                    column is zero when no DTM is given.
+    """
+    if input_range is None:
+        if any(np.asarray(tile).dtype != np.uint8 for tile in tiles):
+            raise ValueError("input_range is required for tiles that are not 8-bit.")
+        input_range = (0.0, 255.0)
+    features = np.zeros((len(tiles), len(FEATURE_NAMES)), dtype=np.float32)
+    groups = {}
+    for index, tile in enumerate(tiles):
+        groups.setdefault(np.shape(tile)[:2], []).append(index)
+
+    for indices in groups.values():
+        stack = _to_gray_float([tiles[i] for i in indices], input_range)
+        gx, gy = np.diff(stack, axis=2), np.diff(stack, axis=1)
+        features[indices, 0] = stack.var(axis=(1, 2))
+        features[indices, 1] = (gx ** 2).mean(axis=(1, 2)) + (gy ** 2).mean(axis=(1, 2))
+        features[indices, 2] = (stack < shadow_level).mean(axis=(1, 2))
+        if dtm_tiles is not None:
+            dtm = np.stack([np.asarray(dtm_tiles[i], dtype=np.float32) for i in indices])
+            dzdx = np.diff(dtm, axis=2)[:, :-1, :] / pixel_scale
+            dzdy = np.diff(dtm, axis=1)[:, :, :-1] / pixel_scale
+            features[indices, 3] = np.degrees(np.arctan(np.sqrt(dzdx ** 2 + dzdy ** 2).max(axis=(1, 2))))
+    return features
+
+def _transform_features(features):
+    """Log-scales the heavy-tailed features so a linear score separates them well."""
+    transformed = np.asarray(features, dtype=np.float64).copy()
+    transformed[:, [0, 1]] = np.log10(transformed[:, [0, 1]] + 1e-8)
+    return transformed
+
+class TilePrefilter:
+    """
+    A cascade stage that rejects tiles unlikely to contain events before the network runs.
+
+    Each tile gets a linear score over its (log-scaled, standardized) statistics.
+    Tiles scoring below `threshold` are skipped. Until `calibrate` is called the
+    filter keeps every tile.
+
+    Attributes:
+        seen (int): Tiles scored so far.
+        kept (int): Tiles passed on to the network so far.
+    """
+    def __init__(self, coef=None, intercept=0.0, mean=None, scale=None, threshold=-np.inf,
+                 shadow_level=DEFAULT_SHADOW_LEVEL, pixel_scale=1.0):
+        n_features = len(FEATURE_NAMES)
+        self.coef = np.zeros(n_features) if coef is None else np.asarray(coef, dtype=np.float64)
+        self.intercept = float(intercept)
+        self.mean = np.zeros(n_features) if mean is None else np.asarray(mean, dtype=np.float64)
+        self.scale = np.ones(n_features) if scale is None else np.asarray(scale, dtype=np.float64)
+        self.threshold = float(threshold)
+        self.shadow_level = shadow_level
+        self.pixel_scale = pixel_scale
+        self.seen = 0
+        self.kept = 0
+
+    def score(self, features):
+        """Returns the linear interest score of each row of tile statistics."""
+        standardized = (_transform_features(features) - self.mean) / self.scale
+        return standardized @ self.coef + self.intercept
+
+    def select(self, tiles, dtm_tiles=None, input_range=None):
+        """
+        Returns a boolean array marking the tiles worth running the network on.
+
+        `input_range` is the scene's contrast stretch, required unless the tiles are 8-bit
+        (see `compute_tile_statistics`).
+        """
+        if not len(tiles):
+            return np.zeros(0, dtype=bool)
+        features = compute_tile_statistics(tiles, dtm_tiles, self.shadow_level, self.pixel_scale, input_range)
+        keep = self.score(features) >= self.threshold
+        self.seen += len(keep)
+        self.kept += int(keep.sum())
+        return keep
+
+    def __call__(self, tiles):
+        return self.select(tiles)
+
+    @property
+    def skip_rate(self):
+        """Fraction of the tiles seen so far that were skipped."""
+        return 1.0 - self.kept / self.seen if self.seen else 0.0
+
+    def calibrate(self, features, labels, target_recall=0.99):
+        """
+        Fits the score on labelled tiles and picks the threshold for a recall target.
+
+        Args:
+            features (np.ndarray): (N, 4) statistics from `compute_tile_statistics`.
+            labels (np.ndarray): (N,) booleans, True for tiles that contain an event.
+            target_recall (float): Fraction of event tiles that must still be kept.
+
+        Returns:
+            TilePrefilter: self, for chaining.
+        """
+        from sklearn.linear_model import LogisticRegression
+
+        labels = np.asarray(labels, dtype=bool)
+        if labels.all() or not labels.any():
+            raise ValueError("Calibration needs both tiles with and without events.")
+        transformed = _transform_features(features)
+        self.mean = transformed.mean(axis=0)
+        self.scale = np.where(transformed.std(axis=0) > 0, transformed.std(axis=0), 1.0)
+        model = LogisticRegression(class_weight='balanced', max_iter=1000)
+        model.fit((transformed - self.mean) / self.scale, labels)
+        self.coef, self.intercept = model.coef_[0], float(model.intercept_[0])
+
+        # The lowest score we must accept to keep `target_recall` of the event tiles.
+        positive_scores = np.sort(self.score(features)[labels])
+        allowed_misses = int(np.floor((1.0 - target_recall) * len(positive_scores)))
+        self.threshold = float(positive_scores[allowed_misses])
+        return self
+
+    def save(self, path):
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        with open(path, 'w') as f:
+            json.dump({
+                'features': FEATURE_NAMES, 'coef': self.coef.tolist(), 'intercept': self.intercept,
+                'mean': self.mean.tolist(), 'scale': self.scale.tolist(), 'threshold': self.threshold,
+                'shadow_level': self.shadow_level, 'pixel_scale': self.pixel_scale,
+            }, f, indent=2)
+
+    @classmethod
+    def load(cls, path):
+        with open(path) as f:
+            params = json.load(f)
+        params.pop('features', None)
+        return cls(**params)
+
+def evaluate_prefilter(prefilter, features, labels):
+    """
+    Measures how much work a prefilter saves and how many events it loses.
+
+    Returns:
+        dict: 'skip_rate' over all tiles, 'recall' of event tiles, and 'recall_loss'.
+    """
+    labels = np.asarray(labels, dtype=bool)
+    keep = prefilter.score(features) >= prefilter.threshold
+    recall = keep[labels].mean() if labels.any() else 1.0
+    return {
+        'tiles': len(labels),
+        'skip_rate': float(1.0 - keep.mean()),
+        'recall': float(recall),
+        'recall_loss': float(1.0 - recall),
+    }
+
+def label_tiles_from_boxes(windows, boxes):
+    """
+    Marks the tiles that contain the center of at least one labelled box.
+
+    Args:
+        windows (np.ndarray): (N, 4) tile windows as (row, col, height, width).
+        boxes (np.ndarray): (M, 4) boxes as [xmin, ymin, xmax, ymax] in scene pixels.
+
+    Returns:
+        np.ndarray: (N,) booleans.
+    """
+    windows = np.asarray(windows, dtype=np.float64).reshape(-1, 4)
+    boxes = np.asarray(boxes, dtype=np.float64).reshape(-1, 4)
+    cx, cy = (boxes[:, 0] + boxes[:, 2]) / 2, (boxes[:, 1] + boxes[:, 3]) / 2
+    inside = ((cy[None, :] >= windows[:, 0:1]) & (cy[None, :] < windows[:, 0:1] + windows[:, 2:3]) &
+              (cx[None, :] >= windows[:, 1:2]) & (cx[None, :] < windows[:, 1:2] + windows[:, 3:4]))
+    return inside.any(axis=1)
+
+if __name__ == '__main__':
+    import pandas as pd
+
+    from src.inference.backends import prepare_image
+    from src.inference.predict import iter_image_paths, prefetch_images
+
+    parser = argparse.ArgumentParser(description="Calibrate the tile prefilter on labelled images.")
+    parser.add_argument("--images", default='data/raw/moon/train_images', help="Directory of labelled image tiles.")
+    parser.add_argument("--labels", default='data/raw/moon/train_labels/train_labels_m.csv', help="Bounding box CSV (filename, xmin, ymin, xmax, ymax, class).")
+    parser.add_argument("--target-recall", type=float, default=0.99, help="Fraction of event tiles that must be kept.")
+    parser.add_argument("--output", default='models/tile_prefilter.json', help="Where to save the calibrated prefilter.")
+    args = parser.parse_args()
+
+    print("--- Calibrating Tile Prefilter ---")
+    labels_df = pd.read_csv(args.labels, header=None, names=['filename', 'xmin', 'ymin', 'xmax', 'ymax', 'class'])
+    positive_files = set(labels_df.dropna(subset=['class']).filename)
+    image_paths = iter_image_paths(args.images)
+    loaded = [(path, image) for path, image in prefetch_images(image_paths) if image is not None]
+    # Higher bit depths are stretched to 8 bits per image, as sliced detection stretches each scene.
+    tile_features = compute_tile_statistics([prepare_image(image) for _, image in loaded])
+    tile_labels = np.array([os.path.basename(path) in positive_files for path, _ in loaded])
+
+    # Calibrate on half of the tiles and report on the other half.
+    order = np.random.default_rng(0).permutation(len(loaded))
+    fit_idx, eval_idx = order[: len(order) // 2], order[len(order) // 2:]
+    tile_prefilter = TilePrefilter().calibrate(tile_features[fit_idx], tile_labels[fit_idx], args.target_recall)
+    report = evaluate_prefilter(tile_prefilter, tile_features[eval_idx], tile_labels[eval_idx])
+    print(f"Held-out tiles: {report['tiles']} | skip rate: {report['skip_rate']:.1%} | "
+          f"recall: {report['recall']:.1%} | recall loss: {report['recall_loss']:.1%}")
+
+    tile_prefilter.calibrate(tile_features, tile_labels, args.target_recall).save(args.output)
+    print(f"Prefilter saved to: {args.output}")
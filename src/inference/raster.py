@@ -0,0 +1,178 @@
+import numpy as np
+
+class SceneReader:
+    """
+    Reads windows from a large scene without loading all of it.
+
+    GeoTIFFs (and anything else rasterio can open) are read window by window
+    from disk. Fused .npy scenes, stored (C, H, W) as produced by
+    `align_and_fuse_data`, are memory-mapped. Other image files are decoded
+    once with PIL, and numpy arrays are sliced directly. Arrays are HxW or HxWxC.
+    """
+    def __init__(self, source):
+        self._dataset = None
+        self._array = None
+        self.transform = None
+        self.crs = None
+        if isinstance(source, np.ndarray):
+            self._array = source
+        elif str(source).lower().endswith('.npy'):
+            fused = np.load(source, mmap_mode='r')
+            self._array = fused.transpose(1, 2, 0) if fused.ndim == 3 else fused
+        elif str(source).lower().endswith(('.tif', '.tiff', '.img', '.vrt')):
+            import rasterio
+
+            self._dataset = rasterio.open(source)
+            self.transform = self._dataset.transform
+            self.crs = self._dataset.crs
+        else:
+            from PIL import Image
+
+            with Image.open(source) as img:
+                self._array = np.array(img)
+
+        if self._dataset is not None:
+            self.height, self.width, self.count = self._dataset.height, self._dataset.width, self._dataset.count
+            self.dtype = np.dtype(self._dataset.dtypes[0])
+        else:
+            self.height, self.width = self._array.shape[:2]
+            self.count = 1 if self._array.ndim == 2 else self._array.shape[2]
+            self.dtype = self._array.dtype
+
+    @property
+    def profile(self):
+        """The rasterio profile of the source, or None for plain images."""
+        return self._dataset.profile.copy() if self._dataset is not None else None
+
+    def read(self, row, col, height, width):
+        """
+        Reads a window, clipped to the scene.
+
+        Returns:
+            np.ndarray: HxW for single-band scenes, HxWxC otherwise.
+        """
+        row_end, col_end = min(row + height, self.height), min(col + width, self.width)
+        if self._array is not None:
+            return self._array[row:row_end, col:col_end]
+
+        from rasterio.windows import Window
+
+        data = self._dataset.read(window=Window(col, row, col_end - col, row_end - row))
+        return data[0] if self.count == 1 else data.transpose(1, 2, 0)
+
+    def read_resampled(self, row, col, height, width, out_height, out_width, resampling='average'):
+        """
+        Reads a window (clipped to the scene) resampled to `out_height` x `out_width`.
+
+        GeoTIFFs are read through rasterio, which uses the file's overviews
+        when they exist, so a zoomed-out view of a huge scene reads little
+        data. Arrays are sampled at the nearest pixels, touching only the
+        sampled rows of a memory map.
+
+        Returns:
+            np.ndarray: out_height x out_width (x C) array.
+        """
+        row_end, col_end = min(row + height, self.height), min(col + width, self.width)
+        if self._array is not None:
+            rows = row + ((np.arange(out_height) + 0.5) * (row_end - row) / out_height).astype(np.int64)
+            cols = col + ((np.arange(out_width) + 0.5) * (col_end - col) / out_width).astype(np.int64)
+            return np.asarray(self._array[rows])[:, cols]
+
+        from rasterio.enums import Resampling
+        from rasterio.windows import Window
+
+        data = self._dataset.read(window=Window(col, row, col_end - col, row_end - row),
+                                  out_shape=(self.count, out_height, out_width), resampling=Resampling[resampling])
+        return data[0] if self.count == 1 else data.transpose(1, 2, 0)
+
+    def percentile_stretch(self, sample_size=1024, percentiles=(0.5, 99.5), band=None):
+        """
+        Scene-wide contrast stretch, estimated from a downsampled view of the whole scene.
+
+        Applying one stretch to every window keeps brightness consistent across
+        window borders, and flat windows are not stretched into noise.
+
+        Args:
+            sample_size (int): Longest side of the downsampled view.
+            percentiles (tuple): Percentiles mapped to the ends of the range.
+            band (int, optional): Estimate the stretch of this (0-based) band only.
+
+        Returns:
+            tuple: (low, high) pixel values mapped to 0 and 255; (0, 255) for 8-bit scenes.
+        """
+        if self.dtype == np.uint8:
+            return 0.0, 255.0
+        factor = max(1.0, max(self.height, self.width) / sample_size)
+        sample = self.read_resampled(0, 0, self.height, self.width, max(1, round(self.height / factor)),
+                                     max(1, round(self.width / factor)))
+        if band is not None and sample.ndim == 3:
+            sample = sample[..., band]
+        return tuple(float(v) for v in np.percentile(np.asarray(sample, dtype=np.float32), percentiles))
+
+    def close(self):
+        if self._dataset is not None:
+            self._dataset.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+# PIL modes whose raw arrays are not pixel intensities (palette indices, CMYK inks, or a
+# second alpha channel), and the mode they are decoded to.
+_PIL_CONVERSIONS = {'P': 'RGB', 'PA': 'RGB', 'LA': 'L', 'CMYK': 'RGB', 'YCbCr': 'RGB', '1': 'L'}
+
+def decode_image_bytes(data, filename=''):
+    """
+    Decodes an in-memory image file (e.g. an upload) without writing it to disk.
+
+    TIFFs are opened through a rasterio MemoryFile, which keeps their bit depth,
+    bands and georeferencing. Other formats are decoded by PIL at their native
+    depth (e.g. 16-bit PNGs stay uint16); only palette, alpha and CMYK modes are
+    converted, to RGB or L (see `_PIL_CONVERSIONS`). `data` may be bytes or a
+    memoryview.
+
+    Returns:
+        tuple: (array, transform, crs); HxW or HxWxC array, and None for the
+               transform and CRS when the file has no georeferencing.
+    """
+    is_tiff = str(filename).lower().endswith(('.tif', '.tiff')) or bytes(data[:4]) in (b'II*\x00', b'MM\x00*')
+    if is_tiff:
+        from rasterio.io import MemoryFile
+
+        with MemoryFile(data) as memfile, memfile.open() as dataset:
+            array = dataset.read()
+            array = array[0] if dataset.count == 1 else array.transpose(1, 2, 0)
+            if dataset.crs is None:
+                return array, None, None
+            return array, dataset.transform, dataset.crs
+
+    import io
+    from PIL import Image
+
+    with Image.open(io.BytesIO(data)) as img:
+        if img.mode in _PIL_CONVERSIONS:
+            img = img.convert(_PIL_CONVERSIONS[img.mode])
+        return np.asarray(img), None, None
+
+def compute_window_origins(length, window_size, overlap):
+    """
+    Returns window start offsets that cover `[0, length)` with the given overlap.
+
+    The last window is aligned to the end of the axis, so every window is
+    full-sized unless the axis itself is shorter than one window.
+
+    Args:
+        length (int): Length of the axis in pixels.
+        window_size (int): Window length in pixels.
+        overlap (int): Minimum overlap between consecutive windows in pixels.
+    """
+    if window_size >= length:
+        return [0]
+    stride = window_size - overlap
+    if stride <= 0:
+        raise ValueError("Overlap must be smaller than the window size.")
+    origins = list(range(0, length - window_size, stride))
+    origins.append(length - window_size)
+    return origins
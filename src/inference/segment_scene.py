@@ -0,0 +1,191 @@
+import argparse
+import os
+
+import numpy as np
+
+from src.inference.backends import BACKENDS, load_segmenter
+from src.inference.predict import iter_batches
+from src.inference.prefilter import TilePrefilter
+from src.inference.raster import SceneReader, compute_window_origins
+from src.models.unet import UNET_VARIANTS
+
+# --- Configuration ---
+MODEL_PATH = 'models/unet_landslide_detector_best.pth'
+NUM_CLASSES = 3
+LANDSLIDE_CLASS = 1
+OUTPUT_BLOCK_SIZE = 256
+# Logit given to the background class of tiles rejected by the prefilter.
+BACKGROUND_LOGIT = 10.0
+
+def blending_window(tile_size):
+    """
+    Returns a (tile_size, tile_size) weight map that peaks at the tile center.
+
+    Overlapping tile predictions are averaged with these weights, so the
+    unreliable borders of each tile contribute little and no seams appear.
+    The weights stay strictly positive, so scene edges covered by one tile
+    are still normalized correctly.
+    """
+    ramp = np.hanning(tile_size + 2)[1:-1].astype(np.float32)
+    return np.outer(ramp, ramp)
+
+def _pad_tile(tile, tile_size):
+    """Reflect-pads a (C, h, w) edge tile up to the full tile size."""
+    pad_h, pad_w = tile_size - tile.shape[1], tile_size - tile.shape[2]
+    if pad_h == 0 and pad_w == 0:
+        return tile
+    mode = 'reflect' if pad_h < tile.shape[1] and pad_w < tile.shape[2] else 'edge'
+    return np.pad(tile, ((0, 0), (0, pad_h), (0, pad_w)), mode=mode)
+
+def _softmax(logits, axis=0):
+    shifted = np.exp(logits - logits.max(axis=axis, keepdims=True))
+    return shifted / shifted.sum(axis=axis, keepdims=True)
+
+def _open_outputs(reader, output_path, probabilities_path, n_classes):
+    import rasterio
+
+    profile = {
+        'driver': 'GTiff', 'height': reader.height, 'width': reader.width,
+        'tiled': True, 'blockxsize': OUTPUT_BLOCK_SIZE, 'blockysize': OUTPUT_BLOCK_SIZE,
+        'compress': 'deflate', 'BIGTIFF': 'IF_SAFER',
+    }
+    if reader.transform is not None:
+        profile.update(transform=reader.transform, crs=reader.crs)
+
+    os.makedirs(os.path.dirname(output_path) or '.', exist_ok=True)
+    outputs = {'classes': rasterio.open(output_path, 'w', count=1, dtype='uint8', **profile)}
+    if probabilities_path:
+        os.makedirs(os.path.dirname(probabilities_path) or '.', exist_ok=True)
+        outputs['probabilities'] = rasterio.open(probabilities_path, 'w', count=n_classes, dtype='uint8', **profile)
+    return outputs
+
+def segment_scene(segmenter, scene, output_path, probabilities_path=None, tile_size=512, overlap=64,
+                  batch_size=4, n_classes=NUM_CLASSES, prefilter=None):
+    """
+    Segments a whole fused scene with a sliding window and writes a class mask GeoTIFF.
+
+    Tiles are read window by window, run through the model in batches, and
+    their logits are blended with a center-weighted window. Rows are written
+    to a tiled GeoTIFF as soon as no later tile overlaps them, so only one
+    row of tiles (tile_size x scene width) is held in memory.
+
+    Args:
+        segmenter: A segmenter backend (see `src.inference.backends.load_segmenter`).
+        scene (str or np.ndarray or SceneReader): Fused (OHRC, DTM, Slope) scene.
+        output_path (str): GeoTIFF for the per-pixel class indices.
+        probabilities_path (str, optional): GeoTIFF for per-class probabilities, scaled to 0-255.
+        tile_size (int): Tile size fed to the model; should be divisible by 2**depth of the UNet.
+        overlap (int): Overlap between neighbouring tiles in pixels.
+        batch_size (int): Tiles per forward pass.
+        n_classes (int): Number of classes predicted by the model.
+        prefilter (TilePrefilter, optional): Cascade stage run on the OHRC and DTM
+                                             channels; rejected tiles are labelled background.
+
+    Returns:
+        np.ndarray: Pixel count per class over the whole scene.
+    """
+    from rasterio.windows import Window
+
+    reader = scene if isinstance(scene, SceneReader) else SceneReader(scene)
+    height, width = reader.height, reader.width
+    weights = blending_window(tile_size)
+    row_origins = compute_window_origins(height, tile_size, overlap)
+    col_origins = compute_window_origins(width, tile_size, overlap)
+    class_counts = np.zeros(n_classes, dtype=np.int64)
+    # The prefilter normalizes the OHRC channel with one stretch for the whole scene.
+    ohrc_stretch = reader.percentile_stretch(band=0) if prefilter is not None else None
+
+    # Running sums of weighted logits for the rows covered by the current tile row,
+    # which always starts at `band_start`.
+    band_height = min(tile_size, height)
+    logit_sum = np.zeros((n_classes, band_height, width), dtype=np.float32)
+    weight_sum = np.zeros((band_height, width), dtype=np.float32)
+    band_start = 0
+
+    outputs = _open_outputs(reader, output_path, probabilities_path, n_classes)
+    try:
+        for index, row in enumerate(row_origins):
+            for cols in iter_batches(col_origins, batch_size):
+                tiles = []
+                for col in cols:
+                    tile = np.asarray(reader.read(row, col, tile_size, tile_size), dtype=np.float32)
+                    tile = tile[None] if tile.ndim == 2 else tile.transpose(2, 0, 1)
+                    tiles.append(_pad_tile(tile, tile_size))
+                tiles = np.stack(tiles)
+                if prefilter is not None:
+                    keep = prefilter.select(tiles[:, 0], tiles[:, 1], input_range=ohrc_stretch)
+                    logits = np.zeros((len(tiles), n_classes, tile_size, tile_size), dtype=np.float32)
+                    logits[~keep, 0] = BACKGROUND_LOGIT
+                    if keep.any():
+                        logits[keep] = segmenter.predict(tiles[keep])
+                else:
+                    logits = segmenter.predict(tiles)
+                for col, tile_logits in zip(cols, logits):
+                    h, w = min(tile_size, height - row), min(tile_size, width - col)
+                    logit_sum[:, :h, col:col + w] += tile_logits[:, :h, :w] * weights[:h, :w]
+                    weight_sum[:h, col:col + w] += weights[:h, :w]
+
+            # Rows above the next tile row are final: write them and shift the band.
+            next_row = row_origins[index + 1] if index + 1 < len(row_origins) else height
+            done = next_row - band_start
+            probabilities = _softmax(logit_sum[:, :done] / weight_sum[:done])
+            classes = probabilities.argmax(axis=0).astype(np.uint8)
+            class_counts += np.bincount(classes.ravel(), minlength=n_classes)[:n_classes]
+            window = Window(0, band_start, width, done)
+            outputs['classes'].write(classes, 1, window=window)
+            if 'probabilities' in outputs:
+                outputs['probabilities'].write(np.round(probabilities * 255).astype(np.uint8), window=window)
+
+            logit_sum = np.roll(logit_sum, -done, axis=1)
+            weight_sum = np.roll(weight_sum, -done, axis=0)
+            logit_sum[:, -done:] = 0
+            weight_sum[-done:] = 0
+            band_start = next_row
+    finally:
+        for dataset in outputs.values():
+            dataset.close()
+
+    return class_counts
+
+def load_class_mask(mask_path, class_id=LANDSLIDE_CLASS, window=None):
+    """
+    Reads a binary mask for one class from a `segment_scene` output.
+
+    The result has the same grid as the fused scene, so it can be passed to
+    `postprocessing.find_landslide_source` together with the scene's DTM band.
+
+    Args:
+        mask_path (str): Class mask GeoTIFF written by `segment_scene`.
+        class_id (int): Class to extract (1 = landslide).
+        window (rasterio.windows.Window, optional): Read only this window.
+    """
+    import rasterio
+
+    with rasterio.open(mask_path) as src:
+        return (src.read(1, window=window) == class_id).astype(np.uint8)
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Segment a whole fused scene with the UNet.")
+    parser.add_argument("scene", help="Fused (OHRC, DTM, Slope) scene: a 3-band GeoTIFF or a (C, H, W) .npy file.")
+    parser.add_argument("--model", default=MODEL_PATH, help="UNet state_dict, TorchScript int8 artifact or .onnx model.")
+    parser.add_argument("--variant", default='classic', choices=sorted(UNET_VARIANTS), help="UNet preset of a state_dict checkpoint.")
+    parser.add_argument("--output", default='runs/segmentation/classes.tif', help="Class mask GeoTIFF.")
+    parser.add_argument("--probabilities", default=None, help="Optional per-class probability GeoTIFF.")
+    parser.add_argument("--tile-size", type=int, default=512, help="Tile size in pixels.")
+    parser.add_argument("--overlap", type=int, default=64, help="Tile overlap in pixels.")
+    parser.add_argument("--batch-size", type=int, default=4, help="Tiles per forward pass.")
+    parser.add_argument("--backend", default='auto', choices=BACKENDS, help="Inference backend.")
+    parser.add_argument("--threads", type=int, default=None, help="CPU threads used by the backend.")
+    parser.add_argument("--prefilter", default=None, help="Calibrated tile prefilter (.json) to skip featureless tiles.")
+    args = parser.parse_args()
+
+    print("--- Running Scene Segmentation ---")
+    unet = load_segmenter(args.model, backend=args.backend, variant=args.variant, num_threads=args.threads)
+    tile_prefilter = TilePrefilter.load(args.prefilter) if args.prefilter else None
+    counts = segment_scene(unet, args.scene, args.output, probabilities_path=args.probabilities,
+                           tile_size=args.tile_size, overlap=args.overlap, batch_size=args.batch_size,
+                           prefilter=tile_prefilter)
+    print(f"Class mask saved to: {args.output}")
+    print(f"Pixels per class: {counts.tolist()}")
+    if tile_prefilter is not None:
+        print(f"Prefilter skipped {tile_prefilter.skip_rate:.1%} of {tile_prefilter.seen} tiles.")
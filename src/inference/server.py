@@ -0,0 +1,299 @@
+import argparse
+import io
+import json
+import queue
+import threading
+import time
+import urllib.request
+from collections import deque
+from concurrent.futures import Future
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import numpy as np
+
+from src.inference.backends import BACKENDS, load_detector, load_segmenter
+from src.models.unet import UNET_VARIANTS
+
+# --- Configuration ---
+DEFAULT_HOST = '127.0.0.1'
+DEFAULT_PORT = 8765
+LATENCY_WINDOW = 1000
+
+class DynamicBatcher:
+    """
+    Coalesces concurrent requests into micro-batches for one model.
+
+    Worker threads take the oldest queued request, then keep collecting
+    requests until the batch is full or the oldest request has waited
+    `max_latency_ms`, and run them through `predict_fn` in one call.
+
+    Args:
+        predict_fn (callable): Takes a list of inputs, returns a list of outputs.
+        max_batch_size (int): Largest batch passed to `predict_fn`.
+        max_latency_ms (float): Longest time a request waits for a batch to fill.
+        num_workers (int): Threads running batches concurrently against the same model.
+    """
+    def __init__(self, predict_fn, max_batch_size=16, max_latency_ms=10.0, num_workers=1, name='model'):
+        self.predict_fn = predict_fn
+        self.max_batch_size = max_batch_size
+        self.max_latency = max_latency_ms / 1000.0
+        self.name = name
+        self._queue = queue.Queue()
+        self._lock = threading.Lock()
+        self._latencies = deque(maxlen=LATENCY_WINDOW)
+        self._batch_sizes = deque(maxlen=LATENCY_WINDOW)
+        self._counters = {'requests': 0, 'batches': 0, 'errors': 0}
+        self._stopped = False
+        self._workers = [threading.Thread(target=self._run, name=f"{name}-worker-{i}", daemon=True)
+                         for i in range(num_workers)]
+        for worker in self._workers:
+            worker.start()
+
+    def submit(self, item):
+        """Queues one input and returns a Future for its output."""
+        if self._stopped:
+            raise RuntimeError(f"Batcher '{self.name}' has been stopped.")
+        future = Future()
+        self._queue.put((item, future, time.perf_counter()))
+        return future
+
+    def predict(self, item, timeout=None):
+        """Blocking convenience wrapper around `submit`."""
+        return self.submit(item).result(timeout)
+
+    def _collect_batch(self):
+        first = self._queue.get()
+        if first is None:
+            return None
+        batch = [first]
+        deadline = first[2] + self.max_latency
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.perf_counter()
+            try:
+                item = self._queue.get(timeout=max(remaining, 0)) if remaining > 0 else self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if item is None:
+                # Let the other workers see the stop signal as well.
+                self._queue.put(None)
+                break
+            batch.append(item)
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._collect_batch()
+            if batch is None:
+                self._queue.put(None)
+                return
+            inputs = [item for item, _, _ in batch]
+            try:
+                outputs = self.predict_fn(inputs)
+                for (_, future, _), output in zip(batch, outputs):
+                    future.set_result(output)
+                failed = False
+            except Exception as e:
+                for _, future, _ in batch:
+                    future.set_exception(e)
+                failed = True
+
+            done = time.perf_counter()
+            with self._lock:
+                self._counters['requests'] += len(batch)
+                self._counters['batches'] += 1
+                self._counters['errors'] += len(batch) if failed else 0
+                self._batch_sizes.append(len(batch))
+                self._latencies.extend((done - queued) * 1000 for _, _, queued in batch)
+
+    def metrics(self):
+        """Returns queue depth, request counters, batch sizes and latency percentiles."""
+        with self._lock:
+            latencies = np.array(self._latencies) if self._latencies else np.zeros(1)
+            batch_sizes = np.array(self._batch_sizes) if self._batch_sizes else np.zeros(1)
+            return {
+                'queue_depth': self._queue.qsize(),
+                **self._counters,
+                'mean_batch_size': float(batch_sizes.mean()),
+                'latency_ms_p50': float(np.percentile(latencies, 50)),
+                'latency_ms_p95': float(np.percentile(latencies, 95)),
+                'latency_ms_max': float(latencies.max()),
+            }
+
+    def stop(self):
+        self._stopped = True
+        self._queue.put(None)
+        for worker in self._workers:
+            worker.join()
+
+def _segment_batch(segmenter, windows):
+    """Runs equally-shaped windows through the segmenter together."""
+    results = [None] * len(windows)
+    by_shape = {}
+    for index, window in enumerate(windows):
+        by_shape.setdefault(window.shape, []).append(index)
+    for indices in by_shape.values():
+        logits = segmenter.predict(np.stack([windows[i] for i in indices]).astype(np.float32))
+        for i, window_logits in zip(indices, logits):
+            results[i] = window_logits.argmax(axis=0).astype(np.uint8)
+    return results
+
+class InferenceService:
+    """
+    Keeps the detector and segmenter warm and serves them through dynamic batchers.
+
+    Args:
+        detector (optional): A detector backend; enables `/detect`.
+        segmenter (optional): A segmenter backend; enables `/segment`.
+        max_batch_size (int): Largest micro-batch per model.
+        max_latency_ms (float): Longest time a request waits for its batch to fill.
+        num_workers (int): Worker threads per model.
+        conf (float): Detection confidence threshold used for every request.
+    """
+    def __init__(self, detector=None, segmenter=None, max_batch_size=16, max_latency_ms=10.0, num_workers=1, conf=0.25):
+        self.batchers = {}
+        if detector is not None:
+            self.batchers['detect'] = DynamicBatcher(lambda images: detector.predict(images, conf=conf),
+                                                     max_batch_size, max_latency_ms, num_workers, name='detect')
+        if segmenter is not None:
+            self.batchers['segment'] = DynamicBatcher(lambda windows: _segment_batch(segmenter, windows),
+                                                      max_batch_size, max_latency_ms, num_workers, name='segment')
+
+    def metrics(self):
+        return {name: batcher.metrics() for name, batcher in self.batchers.items()}
+
+    def stop(self):
+        for batcher in self.batchers.values():
+            batcher.stop()
+
+def encode_array(array):
+    """Serializes an array to .npy bytes, keeping its dtype and shape."""
+    buffer = io.BytesIO()
+    np.save(buffer, np.asarray(array), allow_pickle=False)
+    return buffer.getvalue()
+
+def decode_array(data):
+    """Decodes .npy bytes, or an encoded image (PNG/JPEG/TIFF) at its native bit depth."""
+    if data[:6] == b'\x93NUMPY':
+        return np.load(io.BytesIO(data), allow_pickle=False)
+    from PIL import Image
+
+    with Image.open(io.BytesIO(data)) as img:
+        return np.array(img)
+
+def _make_handler(service):
+    class InferenceRequestHandler(BaseHTTPRequestHandler):
+        def _send(self, status, body, content_type='application/json'):
+            self.send_response(status)
+            self.send_header('Content-Type', content_type)
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def _send_json(self, status, payload):
+            self._send(status, json.dumps(payload).encode())
+
+        def do_GET(self):
+            if self.path == '/health':
+                self._send_json(200, {'status': 'ok', 'models': sorted(service.batchers)})
+            elif self.path == '/metrics':
+                self._send_json(200, service.metrics())
+            else:
+                self._send_json(404, {'error': f"Unknown path {self.path}"})
+
+        def do_POST(self):
+            route = self.path.strip('/')
+            if route not in service.batchers:
+                self._send_json(404, {'error': f"No model is served at {self.path}"})
+                return
+            try:
+                data = decode_array(self.rfile.read(int(self.headers.get('Content-Length', 0))))
+                result = service.batchers[route].predict(data)
+            except Exception as e:
+                self._send_json(500, {'error': str(e)})
+                return
+            if route == 'detect':
+                self._send_json(200, {key: value.tolist() for key, value in result.items()})
+            else:
+                self._send(200, encode_array(result), 'application/octet-stream')
+
+        def log_message(self, format, *args):
+            # Keep per-request logging out of the console; use /metrics instead.
+            pass
+
+    return InferenceRequestHandler
+
+def create_server(service, host=DEFAULT_HOST, port=DEFAULT_PORT):
+    """
+    Creates (but does not start) the HTTP server for an `InferenceService`.
+
+    Endpoints:
+        POST /detect   image bytes or .npy array -> JSON detections
+        POST /segment  (C, H, W) .npy window     -> .npy uint8 class mask
+        GET  /metrics  queue depth, counters and latency percentiles per model
+        GET  /health   served models
+
+    Use port 0 to let the OS pick a free port (see `server.server_address`).
+    """
+    return ThreadingHTTPServer((host, port), _make_handler(service))
+
+class InferenceClient:
+    """Minimal client for the local inference server."""
+    def __init__(self, url=f"http://{DEFAULT_HOST}:{DEFAULT_PORT}", timeout=60):
+        self.url = url.rstrip('/')
+        self.timeout = timeout
+
+    def _post(self, route, array):
+        request = urllib.request.Request(f"{self.url}/{route}", data=encode_array(array), method='POST',
+                                         headers={'Content-Type': 'application/octet-stream'})
+        with urllib.request.urlopen(request, timeout=self.timeout) as response:
+            return response.read()
+
+    def detect(self, image):
+        """Returns the detections dict for one image array."""
+        result = json.loads(self._post('detect', image))
+        return {
+            'boxes': np.array(result['boxes'], dtype=np.float32).reshape(-1, 4),
+            'scores': np.array(result['scores'], dtype=np.float32),
+            'class_ids': np.array(result['class_ids'], dtype=np.int32),
+        }
+
+    def segment(self, window):
+        """Returns the class mask for one (C, H, W) window."""
+        return decode_array(self._post('segment', window))
+
+    def metrics(self):
+        with urllib.request.urlopen(f"{self.url}/metrics", timeout=self.timeout) as response:
+            return json.loads(response.read())
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Serve the YOLOv8 and UNet models over a local HTTP endpoint.")
+    parser.add_argument("--detector", default=None, help="YOLOv8 .pt or .onnx model to serve at /detect.")
+    parser.add_argument("--segmenter", default=None, help="UNet .pth, TorchScript .pt or .onnx model to serve at /segment.")
+    parser.add_argument("--variant", default='classic', choices=sorted(UNET_VARIANTS), help="UNet preset of a state_dict checkpoint.")
+    parser.add_argument("--backend", default='auto', choices=BACKENDS, help="Inference backend.")
+    parser.add_argument("--threads", type=int, default=None, help="CPU threads per model.")
+    parser.add_argument("--workers", type=int, default=1, help="Batch worker threads per model.")
+    parser.add_argument("--max-batch-size", type=int, default=16, help="Largest micro-batch.")
+    parser.add_argument("--max-latency-ms", type=float, default=10.0, help="Longest wait for a micro-batch to fill.")
+    parser.add_argument("--host", default=DEFAULT_HOST, help="Interface to bind; keep it local.")
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT, help="Port to listen on.")
+    args = parser.parse_args()
+
+    if not args.detector and not args.segmenter:
+        parser.error("Nothing to serve: pass --detector and/or --segmenter.")
+
+    print("--- Starting Inference Server ---")
+    detector_model = load_detector(args.detector, backend=args.backend, num_threads=args.threads) if args.detector else None
+    segmenter_model = load_segmenter(args.segmenter, backend=args.backend, variant=args.variant,
+                                     num_threads=args.threads) if args.segmenter else None
+    inference_service = InferenceService(detector_model, segmenter_model, max_batch_size=args.max_batch_size,
+                                         max_latency_ms=args.max_latency_ms, num_workers=args.workers)
+    http_server = create_server(inference_service, args.host, args.port)
+    print(f"Serving {sorted(inference_service.batchers)} on http://{args.host}:{http_server.server_address[1]}")
+    try:
+        http_server.serve_forever()
+    except KeyboardInterrupt:
+        print("\nShutting down...")
+    finally:
+        http_server.server_close()
+        inference_service.stop()
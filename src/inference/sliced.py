@@ -0,0 +1,144 @@
+import argparse
+
+import numpy as np
+
+from src.inference.backends import BACKENDS, load_detector, prepare_image
+from src.inference.boxes import concat_detections, empty_detections, non_max_suppression, select_detections
+from src.inference.predict import DetectionWriter, detections_to_columns, iter_batches
+from src.inference.prefilter import TilePrefilter
+from src.inference.raster import SceneReader, compute_window_origins
+
+def iter_slice_rows(height, width, slice_size=640, overlap=0.2):
+    """
+    Groups the slice windows of a scene into rows.
+
+    Args:
+        height (int): Scene height in pixels.
+        width (int): Scene width in pixels.
+        slice_size (int): Side of each square slice in pixels.
+        overlap (float): Overlap between neighbouring slices, as a fraction of `slice_size`.
+
+    Yields:
+        tuple: (row_origin, [(row, col, height, width), ...]) for each row of slices.
+    """
+    overlap_px = int(round(slice_size * overlap))
+    col_origins = compute_window_origins(width, slice_size, overlap_px)
+    for row in compute_window_origins(height, slice_size, overlap_px):
+        yield row, [(row, col, min(slice_size, height - row), min(slice_size, width - col)) for col in col_origins]
+
+def merge_detections(detections, merge_threshold=0.5, metric='ios'):
+    """
+    Removes duplicate detections of the same object from neighbouring slices.
+
+    Intersection-over-smaller is used by default so that a boulder cut in half
+    by a slice border is merged into the full detection from the next slice.
+    """
+    keep = non_max_suppression(detections['boxes'], detections['scores'], merge_threshold,
+                               detections['class_ids'], metric=metric)
+    return select_detections(detections, keep)
+
+def sliced_detect(detector, scene, slice_size=640, overlap=0.2, batch_size=8, conf=0.25, iou=0.45,
+                  merge_threshold=0.5, metric='ios', prefilter=None, progress=None):
+    """
+    Detects objects in a large scene by running the detector on overlapping slices.
+
+    Slices are read one row at a time and batched through the model at full
+    resolution. Scenes with a higher bit depth are converted to 8 bits with one
+    scene-wide contrast stretch, so neighbouring slices match. Boxes are
+    shifted to scene coordinates and merged across slice borders. Detections are finalized as soon as no later slice can
+    overlap them, so only one row of slices and the detections along its
+    lower edge are held in memory.
+
+    Args:
+        detector: A detector backend (see `src.inference.backends`).
+        scene (str or np.ndarray or SceneReader): The scene to process.
+        slice_size (int): Side of each square slice in pixels; match the detector's input size.
+        overlap (float): Overlap between neighbouring slices, as a fraction of `slice_size`.
+        batch_size (int): Slices per forward pass.
+        conf (float): Minimum detection confidence.
+        iou (float): NMS IoU threshold used inside each slice.
+        merge_threshold (float): Overlap above which detections from different slices are merged.
+        metric (str): Overlap measure for merging, 'ios' or 'iou'.
+        prefilter (callable, optional): Called with a list of slice arrays; returns a
+                                        boolean array of the slices worth running the detector on.
+        progress (callable, optional): Called with the fraction of slice rows processed.
+
+    Yields:
+        dict: Detections in scene pixel coordinates, one finalized chunk at a time.
+    """
+    reader = scene if isinstance(scene, SceneReader) else SceneReader(scene)
+    stretch = None if reader.dtype == np.uint8 else reader.percentile_stretch()
+    pending = empty_detections()
+    rows = list(iter_slice_rows(reader.height, reader.width, slice_size, overlap))
+    for index, (row_origin, windows) in enumerate(rows):
+        row_detections = [pending]
+        for batch in iter_batches(windows, batch_size):
+            slices = [reader.read(*window) for window in batch]
+            if stretch is not None:
+                slices = [prepare_image(s, stretch) for s in slices]
+            if prefilter is not None:
+                selected = np.asarray(prefilter(slices), dtype=bool)
+                batch = [w for w, keep in zip(batch, selected) if keep]
+                slices = [s for s, keep in zip(slices, selected) if keep]
+                if not slices:
+                    continue
+            for (row, col, _, _), dets in zip(batch, detector.predict(slices, conf=conf, iou=iou)):
+                dets['boxes'] = dets['boxes'] + np.array([col, row, col, row], dtype=np.float32)
+                row_detections.append(dets)
+
+        merged = merge_detections(concat_detections(row_detections), merge_threshold, metric)
+        # Boxes that end above the next row of slices can no longer gain duplicates.
+        next_row = rows[index + 1][0] if index + 1 < len(rows) else np.inf
+        done = merged['boxes'][:, 3] <= next_row
+        pending = select_detections(merged, ~done)
+        if progress is not None:
+            progress((index + 1) / len(rows))
+        if done.any():
+            yield select_detections(merged, done)
+
+def run_sliced_inference(model_path, scene_path, output_path='runs/inference/scene_detections.parquet', slice_size=640,
+                         overlap=0.2, batch_size=8, backend='auto', num_threads=None, conf=0.25, detector=None,
+                         prefilter=None):
+    """
+    Runs sliced detection over a large scene and streams the merged detections to a results file.
+
+    Returns:
+        int: The number of detections written.
+    """
+    print("--- Running Sliced Inference ---")
+    if detector is None:
+        detector = load_detector(model_path, backend=backend, num_threads=num_threads, imgsz=slice_size)
+
+    writer = DetectionWriter(output_path)
+    with SceneReader(scene_path) as reader:
+        print(f"Scene: {scene_path} ({reader.width}x{reader.height} px)")
+        try:
+            for chunk in sliced_detect(detector, reader, slice_size=slice_size, overlap=overlap,
+                                       batch_size=batch_size, conf=conf, prefilter=prefilter):
+                writer.write([detections_to_columns(scene_path, (reader.height, reader.width), chunk)])
+        finally:
+            writer.close()
+
+    print(f"{writer.rows_written} detections written to: {output_path}")
+    if prefilter is not None:
+        print(f"Prefilter skipped {prefilter.skip_rate:.1%} of {prefilter.seen} slices.")
+    return writer.rows_written
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Detect boulders in a large scene with sliced inference.")
+    parser.add_argument("scene", help="Path to the scene (GeoTIFF or image).")
+    parser.add_argument("--model", default='models/lunar_rockfall_detector.pt', help="Trained .pt model or exported .onnx model.")
+    parser.add_argument("--output", default='runs/inference/scene_detections.parquet', help="Columnar results file (.parquet or .csv).")
+    parser.add_argument("--slice-size", type=int, default=640, help="Slice size in pixels.")
+    parser.add_argument("--overlap", type=float, default=0.2, help="Slice overlap as a fraction of the slice size.")
+    parser.add_argument("--batch-size", type=int, default=8, help="Slices per forward pass.")
+    parser.add_argument("--backend", default='auto', choices=BACKENDS, help="Inference backend.")
+    parser.add_argument("--threads", type=int, default=None, help="CPU threads used by the backend.")
+    parser.add_argument("--conf", type=float, default=0.25, help="Minimum detection confidence.")
+    parser.add_argument("--prefilter", default=None, help="Calibrated tile prefilter (.json) to skip featureless slices.")
+    args = parser.parse_args()
+
+    run_sliced_inference(args.model, args.scene, output_path=args.output, slice_size=args.slice_size,
+                         overlap=args.overlap, batch_size=args.batch_size, backend=args.backend,
+                         num_threads=args.threads, conf=args.conf,
+                         prefilter=TilePrefilter.load(args.prefilter) if args.prefilter else None)
@@ -0,0 +1,315 @@
+import argparse
+import io
+import json
+import math
+import threading
+from collections import OrderedDict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+import cv2
+import numpy as np
+from PIL import Image
+
+from src.inference.predict import BOX_COLOR
+from src.inference.raster import SceneReader
+
+# --- Configuration ---
+DEFAULT_HOST = '127.0.0.1'
+DEFAULT_PORT = 8766
+TILE_SIZE = 256
+DEFAULT_CACHE_TILES = 4096
+# Longest side read to estimate a scene's contrast stretch.
+STRETCH_SAMPLE_SIZE = 1024
+MASK_COLOR = (255, 64, 64, 110)
+# Above this many boxes in a tile, the detections layer shows their density instead of outlines.
+MAX_TILE_BOXES = 2000
+LAYERS = ('image', 'mask', 'detections')
+
+def build_overviews(path, factors=(2, 4, 8, 16, 32, 64, 128), resampling='average'):
+    """
+    Adds internal overviews to a GeoTIFF so zoomed-out tiles read little data.
+
+    Run this once on converted scenes (`convert_images.py` output) before viewing them.
+    """
+    import rasterio
+    from rasterio.enums import Resampling
+
+    with rasterio.open(path, 'r+') as dataset:
+        factors = [f for f in factors if max(dataset.width, dataset.height) / f >= TILE_SIZE / 2]
+        dataset.build_overviews(factors, Resampling[resampling])
+
+def _encode_png(array):
+    buffer = io.BytesIO()
+    Image.fromarray(array).save(buffer, format='PNG', compress_level=1)
+    return buffer.getvalue()
+
+class TiledScene:
+    """
+    Serves a large scene as a deep-zoom pyramid of 256 px tiles, rendered on demand.
+
+    Zoom level `max_zoom` shows full-resolution pixels and each level below
+    halves the resolution, down to the whole scene in one tile at level 0.
+    Tiles are read with `SceneReader.read_resampled` (using the GeoTIFF's
+    overviews when present), contrast-stretched with one scene-wide stretch
+    so tiles match at their borders, and kept in an LRU cache.
+
+    Optional overlay layers are rendered the same way: a landslide (or any
+    class) mask, and detection boxes, looked up for the tile's viewport only.
+    Tiles holding more than `MAX_TILE_BOXES` boxes (zoomed-out views of dense
+    scenes) show the density of box centers instead of every outline.
+
+    Args:
+        scene: Scene GeoTIFF, .npy or array.
+        mask (optional): Class mask on the same pixel grid (e.g. `segment_scene` output).
+        detections (dict, optional): 'boxes', 'scores', 'class_ids' in scene pixel coordinates.
+        mask_value (int, optional): Mask value to show; None shows every non-zero pixel.
+        cache_tiles (int): Rendered tiles kept in memory.
+    """
+    def __init__(self, scene, mask=None, detections=None, mask_value=None, cache_tiles=DEFAULT_CACHE_TILES):
+        self.reader = scene if isinstance(scene, SceneReader) else SceneReader(scene)
+        self.mask_reader = None if mask is None else (mask if isinstance(mask, SceneReader) else SceneReader(mask))
+        self.mask_value = mask_value
+        self.height, self.width = self.reader.height, self.reader.width
+        self.max_zoom = max(0, math.ceil(math.log2(max(self.height, self.width) / TILE_SIZE)))
+        self.cache_tiles = cache_tiles
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+        # rasterio datasets must not be read from several threads at once.
+        self._read_lock = threading.Lock()
+        self.stats = {'hits': 0, 'misses': 0}
+        self._set_detections(detections)
+        self._set_stretch()
+
+    def _set_stretch(self):
+        self.stretch = self.reader.percentile_stretch(STRETCH_SAMPLE_SIZE)
+
+    def _set_detections(self, detections):
+        if detections is None or len(detections['boxes']) == 0:
+            self.boxes = np.zeros((0, 4), dtype=np.float32)
+            self.scores = np.zeros(0, dtype=np.float32)
+            self._max_box_height = 0.0
+            return
+        # Sorted by top edge, so a viewport's boxes are one searchsorted range.
+        order = np.argsort(detections['boxes'][:, 1], kind='stable')
+        self.boxes = np.asarray(detections['boxes'], dtype=np.float32)[order]
+        self.scores = np.asarray(detections['scores'], dtype=np.float32)[order]
+        self._max_box_height = float(np.max(self.boxes[:, 3] - self.boxes[:, 1]))
+
+    def info(self):
+        return {'width': self.width, 'height': self.height, 'tile_size': TILE_SIZE, 'max_zoom': self.max_zoom,
+                'layers': [layer for layer in LAYERS if self.has_layer(layer)], 'detections': len(self.boxes)}
+
+    def has_layer(self, layer):
+        return layer == 'image' or (layer == 'mask' and self.mask_reader is not None) or \
+            (layer == 'detections' and len(self.boxes) > 0)
+
+    def tile_window(self, z, x, y):
+        """Scene pixel window (row, col, size) covered by tile (z, x, y)."""
+        size = TILE_SIZE * 2 ** (self.max_zoom - z)
+        return y * size, x * size, size
+
+    def detections_in(self, row0, col0, row1, col1):
+        """Indices of the detections intersecting a scene pixel window."""
+        lo = np.searchsorted(self.boxes[:, 1], row0 - self._max_box_height, side='left')
+        hi = np.searchsorted(self.boxes[:, 1], row1, side='right')
+        boxes = self.boxes[lo:hi]
+        hit = (boxes[:, 3] >= row0) & (boxes[:, 0] <= col1) & (boxes[:, 2] >= col0)
+        return lo + np.flatnonzero(hit)
+
+    def tile(self, layer, z, x, y):
+        """
+        Returns one tile as PNG bytes, from the cache when possible.
+
+        Raises:
+            KeyError: For unknown layers or tiles outside the pyramid.
+        """
+        if not self.has_layer(layer) or not 0 <= z <= self.max_zoom:
+            raise KeyError(f"No tile {layer}/{z}/{x}/{y}")
+        row, col, size = self.tile_window(z, x, y)
+        if row >= self.height or col >= self.width or row < 0 or col < 0:
+            raise KeyError(f"No tile {layer}/{z}/{x}/{y}")
+
+        key = (layer, z, x, y)
+        with self._lock:
+            if key in self._cache:
+                self._cache.move_to_end(key)
+                self.stats['hits'] += 1
+                return self._cache[key]
+        png = _encode_png(self._render(layer, row, col, size))
+        with self._lock:
+            self.stats['misses'] += 1
+            self._cache[key] = png
+            if len(self._cache) > self.cache_tiles:
+                self._cache.popitem(last=False)
+        return png
+
+    def _render(self, layer, row, col, size):
+        scale = size / TILE_SIZE
+        # Edge tiles only cover part of their window; the rest stays transparent.
+        out_h = max(1, math.ceil((min(row + size, self.height) - row) / scale))
+        out_w = max(1, math.ceil((min(col + size, self.width) - col) / scale))
+        tile = np.zeros((TILE_SIZE, TILE_SIZE, 4), dtype=np.uint8)
+
+        if layer == 'image':
+            with self._read_lock:
+                pixels = self.reader.read_resampled(row, col, size, size, out_h, out_w, 'average')
+            pixels = pixels[..., :3] if pixels.ndim == 3 else pixels[..., None]
+            low, high = self.stretch
+            pixels = np.clip((pixels.astype(np.float32) - low) * (255.0 / max(high - low, 1e-6)), 0, 255)
+            tile[:out_h, :out_w, :3] = pixels.astype(np.uint8)
+            tile[:out_h, :out_w, 3] = 255
+        elif layer == 'mask':
+            with self._read_lock:
+                values = self.mask_reader.read_resampled(row, col, size, size, out_h, out_w, 'nearest')
+            values = values[..., 0] if values.ndim == 3 else values
+            inside = values > 0 if self.mask_value is None else values == self.mask_value
+            tile[:out_h, :out_w][inside] = MASK_COLOR
+        else:
+            index = self.detections_in(row, col, row + size, col + size)
+            if len(index) > MAX_TILE_BOXES:
+                self._render_density(tile, self.boxes[index], row, col, scale)
+                return tile
+            thickness = 2 if scale < 4 else 1
+            for xmin, ymin, xmax, ymax in self.boxes[index]:
+                p1 = (int(round((xmin - col) / scale)), int(round((ymin - row) / scale)))
+                p2 = (int(round((xmax - col) / scale)), int(round((ymax - row) / scale)))
+                cv2.rectangle(tile, p1, p2, (*BOX_COLOR, 255), thickness)
+        return tile
+
+    @staticmethod
+    def _render_density(tile, boxes, row, col, scale):
+        """Shades each tile pixel by the number of box centers in it, brighter for more boxes."""
+        cx = ((boxes[:, 0] + boxes[:, 2]) / 2 - col) / scale
+        cy = ((boxes[:, 1] + boxes[:, 3]) / 2 - row) / scale
+        inside = (cx >= 0) & (cx < TILE_SIZE) & (cy >= 0) & (cy < TILE_SIZE)
+        pixels = cy[inside].astype(np.int64) * TILE_SIZE + cx[inside].astype(np.int64)
+        counts = np.bincount(pixels, minlength=TILE_SIZE * TILE_SIZE).reshape(TILE_SIZE, TILE_SIZE)
+        covered = counts > 0
+        tile[covered, :3] = BOX_COLOR
+        tile[covered, 3] = np.clip(96 + 32 * np.log2(counts[covered]), 0, 255).astype(np.uint8)
+
+    def close(self):
+        self.reader.close()
+        if self.mask_reader is not None:
+            self.mask_reader.close()
+
+def load_scene_detections(detections_path, scene_path):
+    """Reads one scene's detections from a Parquet results file."""
+    import pyarrow.compute as pc
+    import pyarrow.parquet as pq
+
+    table = pq.read_table(detections_path, filters=pc.field('image_path') == str(scene_path),
+                          columns=['xmin', 'ymin', 'xmax', 'ymax', 'score', 'class_id'])
+    return {
+        'boxes': np.stack([table[name].to_numpy() for name in ('xmin', 'ymin', 'xmax', 'ymax')], axis=1).astype(np.float32),
+        'scores': table['score'].to_numpy().astype(np.float32),
+        'class_ids': table['class_id'].to_numpy().astype(np.int32),
+    }
+
+def _make_handler(scenes):
+    class TileRequestHandler(BaseHTTPRequestHandler):
+        def _send(self, status, body, content_type='application/json'):
+            self.send_response(status)
+            self.send_header('Content-Type', content_type)
+            self.send_header('Content-Length', str(len(body)))
+            # The viewer page is served by the dashboard, on another port.
+            self.send_header('Access-Control-Allow-Origin', '*')
+            if content_type == 'image/png':
+                self.send_header('Cache-Control', 'max-age=3600')
+            self.end_headers()
+            self.wfile.write(body)
+
+        def _send_json(self, status, payload):
+            self._send(status, json.dumps(payload).encode())
+
+        def do_GET(self):
+            url = urlparse(self.path)
+            parts = url.path.strip('/').split('/')
+            try:
+                if parts[0] == 'scenes' and len(parts) == 1:
+                    self._send_json(200, {name: scene.info() for name, scene in list(scenes.items())})
+                elif parts[0] == 'scenes' and len(parts) == 2:
+                    self._send_json(200, scenes[parts[1]].info())
+                elif parts[0] == 'tiles' and len(parts) == 6:
+                    name, layer, z, x, y = parts[1], parts[2], int(parts[3]), int(parts[4]), int(parts[5].split('.')[0])
+                    self._send(200, scenes[name].tile(layer, z, x, y), 'image/png')
+                elif parts[0] == 'detections' and len(parts) == 2:
+                    # ?bbox=col0,row0,col1,row1 in scene pixels: the boxes of the current viewport.
+                    scene = scenes[parts[1]]
+                    col0, row0, col1, row1 = (float(v) for v in parse_qs(url.query)['bbox'][0].split(','))
+                    index = scene.detections_in(row0, col0, row1, col1)
+                    self._send_json(200, {'boxes': scene.boxes[index].tolist(), 'scores': scene.scores[index].tolist()})
+                else:
+                    self._send_json(404, {'error': f"Unknown path {self.path}"})
+            except (KeyError, ValueError) as e:
+                self._send_json(404, {'error': str(e)})
+
+        def log_message(self, format, *args):
+            pass
+
+    return TileRequestHandler
+
+def create_tile_server(scenes, host=DEFAULT_HOST, port=DEFAULT_PORT):
+    """
+    Creates (but does not start) the HTTP tile server.
+
+    `scenes` maps names to `TiledScene`s and may be updated while serving.
+
+    Endpoints:
+        GET /scenes                           size and zoom levels of every scene
+        GET /tiles/<scene>/<layer>/<z>/<x>/<y>.png
+        GET /detections/<scene>?bbox=col0,row0,col1,row1
+
+    Use port 0 to let the OS pick a free port (see `server.server_address`).
+    """
+    return ThreadingHTTPServer((host, port), _make_handler(scenes))
+
+def viewer_html(tile_url, name, info, height=700):
+    """
+    A Leaflet page browsing one scene of a tile server, with its overlay layers.
+    """
+    layers = {layer: f"{tile_url}/tiles/{name}/{layer}/{{z}}/{{x}}/{{y}}.png" for layer in info['layers']}
+    return f"""
+<link rel="stylesheet" href="https://unpkg.com/leaflet@1.9.4/dist/leaflet.css"/>
+<script src="https://unpkg.com/leaflet@1.9.4/dist/leaflet.js"></script>
+<div id="map" style="height: {height}px; background: #000;"></div>
+<script>
+  const info = {json.dumps(info)};
+  const urls = {json.dumps(layers)};
+  const map = L.map('map', {{crs: L.CRS.Simple, minZoom: 0, maxZoom: info.max_zoom + 2}});
+  const bounds = L.latLngBounds(map.unproject([0, info.height], info.max_zoom),
+                                map.unproject([info.width, 0], info.max_zoom));
+  const options = {{tileSize: info.tile_size, maxNativeZoom: info.max_zoom, maxZoom: info.max_zoom + 2,
+                    bounds: bounds, noWrap: true}};
+  const base = L.tileLayer(urls.image, options).addTo(map);
+  const overlays = {{}};
+  for (const layer of ['mask', 'detections']) {{
+    if (urls[layer]) overlays[layer] = L.tileLayer(urls[layer], options).addTo(map);
+  }}
+  L.control.layers({{'scene': base}}, overlays).addTo(map);
+  map.fitBounds(bounds);
+</script>
+"""
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Serve deep-zoom tiles of large scenes with mask and detection overlays.")
+    parser.add_argument("scenes", nargs='+', help="Scene GeoTIFFs or .npy arrays.")
+    parser.add_argument("--mask", default=None, help="Class mask for the (first) scene.")
+    parser.add_argument("--detections", default=None, help="Parquet results with detections for the scenes.")
+    parser.add_argument("--build-overviews", action='store_true', help="Add GeoTIFF overviews before serving.")
+    parser.add_argument("--host", default=DEFAULT_HOST)
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    args = parser.parse_args()
+
+    served = {}
+    for i, scene_path in enumerate(args.scenes):
+        if args.build_overviews and scene_path.lower().endswith(('.tif', '.tiff')):
+            build_overviews(scene_path)
+        dets = load_scene_detections(args.detections, scene_path) if args.detections else None
+        scene_name = scene_path.replace('\\', '/').rsplit('/', 1)[-1].rsplit('.', 1)[0]
+        served[scene_name] = TiledScene(scene_path, mask=args.mask if i == 0 else None, detections=dets)
+        print(f"{scene_name}: {served[scene_name].info()}")
+    server = create_tile_server(served, args.host, args.port)
+    print(f"Serving tiles on http://{args.host}:{server.server_address[1]}/tiles/<scene>/<layer>/<z>/<x>/<y>.png")
+    server.serve_forever()
@@ -0,0 +1,349 @@
+import argparse
+import json
+import os
+import re
+from collections import OrderedDict
+
+import numpy as np
+
+from src.inference.catalog import LUNAR_CRS, box_corners_to_lunar, pixel_size_m, read_georeference
+from src.inference.raster import SceneReader
+
+# --- Configuration ---
+DEFAULT_BAND_ROWS = 2048
+DEFAULT_BATCH_ROWS = 262144
+# Partition files kept open at once; older ones are closed and later rows start a new part file.
+MAX_OPEN_PARTITIONS = 64
+DETECTION_FIELDS = (('scene', 'string'), ('image_path', 'string'), ('score', 'float32'), ('class_id', 'int32'))
+POLYGON_FIELDS = (('scene', 'string'), ('polygon_id', 'int64'), ('area_px', 'int64'), ('area_m2', 'float64'))
+
+def _scene_name(path):
+    return os.path.splitext(os.path.basename(str(path)))[0]
+
+def _crs_metadata(crs):
+    """The GeoParquet `crs` entry (PROJJSON), or None for unknown/pixel coordinates."""
+    if crs is None:
+        return None
+    from rasterio.crs import CRS
+
+    return CRS.from_user_input(crs).to_dict(projjson=True)
+
+class GeoFeatureWriter:
+    """
+    Streams features to GeoParquet or a GeoPackage layer, one batch at a time.
+
+    A path ending in .gpkg appends to a GeoPackage layer through pyogrio.
+    Anything else is written as GeoParquet: a single file, or with
+    `partition_by` a directory of `<column>=<value>/part-<n>.parquet` files.
+    Geometries are stored as WKB with the GeoParquet 1.1 `geo` metadata,
+    including the CRS as PROJJSON.
+    """
+    def __init__(self, output_path, fields, crs=LUNAR_CRS, geometry_type='Polygon', partition_by=None, layer=None):
+        import pyarrow as pa
+
+        self.output_path = output_path
+        self.fields = fields
+        self.crs = crs
+        self.geometry_type = geometry_type
+        self.partition_by = partition_by
+        self.layer = layer or _scene_name(output_path)
+        self.rows_written = 0
+        self._is_gpkg = output_path.lower().endswith('.gpkg')
+        self._writers = OrderedDict()
+        self._parts = {}
+
+        geo = {'version': '1.1.0', 'primary_column': 'geometry',
+               'columns': {'geometry': {'encoding': 'WKB', 'geometry_types': [geometry_type],
+                                        'crs': _crs_metadata(crs)}}}
+        self.schema = pa.schema([(name, pa.type_for_alias(kind)) for name, kind in fields] + [('geometry', pa.binary())],
+                                metadata={'geo': json.dumps(geo)})
+        if partition_by is None or self._is_gpkg:
+            os.makedirs(os.path.dirname(output_path) or '.', exist_ok=True)
+        else:
+            os.makedirs(output_path, exist_ok=True)
+
+    def write(self, geometries, columns):
+        """
+        Appends one batch.
+
+        Args:
+            geometries (np.ndarray): shapely geometries.
+            columns (dict): Field name -> array, one entry per geometry.
+        """
+        import shapely
+
+        if len(geometries) == 0:
+            return
+        wkb = shapely.to_wkb(geometries)
+        if self._is_gpkg:
+            self._write_gpkg(wkb, columns)
+        elif self.partition_by is None:
+            self._write_parquet(None, wkb, columns)
+        else:
+            keys = np.asarray(columns[self.partition_by])
+            for value in np.unique(keys):
+                rows = np.flatnonzero(keys == value)
+                self._write_parquet(str(value), wkb[rows], {name: np.asarray(c)[rows] for name, c in columns.items()})
+        self.rows_written += len(geometries)
+
+    def _write_gpkg(self, wkb, columns):
+        from pyogrio.raw import write
+
+        crs = None
+        if self.crs is not None:
+            from rasterio.crs import CRS
+
+            crs = CRS.from_user_input(self.crs).to_wkt()
+        names = [name for name, _ in self.fields]
+        write(self.output_path, wkb, [np.asarray(columns[name]) for name in names], fields=names, layer=self.layer,
+              driver='GPKG', geometry_type=self.geometry_type, crs=crs, append=self.rows_written > 0)
+
+    def _writer_for(self, partition):
+        import pyarrow.parquet as pq
+
+        if partition in self._writers:
+            self._writers.move_to_end(partition)
+            return self._writers[partition]
+        if partition is None:
+            path = self.output_path
+        else:
+            safe_value = re.sub(r'[^\w.-]', '_', partition)
+            directory = os.path.join(self.output_path, f"{self.partition_by}={safe_value}")
+            os.makedirs(directory, exist_ok=True)
+            part = self._parts.get(partition, 0)
+            self._parts[partition] = part + 1
+            path = os.path.join(directory, f"part-{part}.parquet")
+        self._writers[partition] = pq.ParquetWriter(path, self.schema, compression='zstd')
+        if len(self._writers) > MAX_OPEN_PARTITIONS:
+            self._writers.popitem(last=False)[1].close()
+        return self._writers[partition]
+
+    def _write_parquet(self, partition, wkb, columns):
+        import pyarrow as pa
+
+        arrays = [pa.array(np.asarray(columns[name]), type=self.schema.field(name).type) for name, _ in self.fields]
+        batch = pa.record_batch(arrays + [pa.array(wkb, type=pa.binary())], schema=self.schema)
+        self._writer_for(partition).write_batch(batch)
+
+    def close(self):
+        for writer in self._writers.values():
+            writer.close()
+        self._writers.clear()
+        if self.rows_written == 0 and not self._is_gpkg and self.partition_by is None:
+            import pyarrow.parquet as pq
+
+            # Nothing to export: still leave a valid, empty GeoParquet file.
+            pq.write_table(self.schema.empty_table(), self.output_path)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+def export_detections(detections_path, output_path='runs/export/detections', dst_crs=LUNAR_CRS, partition_by='scene',
+                      batch_rows=DEFAULT_BATCH_ROWS):
+    """
+    Exports the pixel boxes of a Parquet results file (`predict.py`, `sliced.py`) as lunar polygons.
+
+    The results are read in record batches and each batch's boxes are
+    converted per image with one vectorized transform, so memory stays
+    bounded by `batch_rows` whatever the size of the result set.
+
+    Args:
+        detections_path (str): Parquet results file.
+        output_path (str): GeoParquet file or directory, or a .gpkg file.
+        dst_crs: CRS of the exported geometries.
+        partition_by (str, optional): Field to partition GeoParquet output by ('scene' by default).
+        batch_rows (int): Detections converted per batch.
+
+    Returns:
+        int: The number of exported detections.
+    """
+    import pyarrow.parquet as pq
+    import shapely
+
+    print("--- Exporting Detections ---")
+    georeferences = {}
+    skipped = 0
+    results = pq.ParquetFile(detections_path)
+    with GeoFeatureWriter(output_path, DETECTION_FIELDS, crs=dst_crs, partition_by=partition_by) as writer:
+        for batch in results.iter_batches(batch_size=batch_rows,
+                                          columns=['image_path', 'xmin', 'ymin', 'xmax', 'ymax', 'score', 'class_id']):
+            image_paths = batch.column('image_path').to_numpy(zero_copy_only=False)
+            boxes = np.stack([batch.column(name).to_numpy() for name in ('xmin', 'ymin', 'xmax', 'ymax')], axis=1)
+            for image_path in np.unique(image_paths):
+                if image_path not in georeferences:
+                    georeferences[image_path] = read_georeference(image_path)
+                rows = np.flatnonzero(image_paths == image_path)
+                if georeferences[image_path] is None:
+                    skipped += len(rows)
+                    continue
+                xs, ys = box_corners_to_lunar(boxes[rows], *georeferences[image_path], dst_crs=dst_crs)
+                writer.write(shapely.polygons(np.stack([xs, ys], axis=-1)), {
+                    'scene': np.full(len(rows), _scene_name(image_path), dtype=object),
+                    'image_path': image_paths[rows],
+                    'score': batch.column('score').to_numpy()[rows],
+                    'class_id': batch.column('class_id').to_numpy()[rows],
+                })
+        exported = writer.rows_written
+    if skipped:
+        print(f"Skipped {skipped} detections from images without georeferencing.")
+    print(f"{exported} detections exported to: {output_path}")
+    return exported
+
+def _shares_edge(a, b):
+    import shapely
+
+    return shapely.length(shapely.intersection(a, b)) > 0
+
+def iter_mask_polygons(source, band_rows=DEFAULT_BAND_ROWS, mask_value=None):
+    """
+    Vectorizes a binary (or class) mask into polygons, one row band at a time.
+
+    Each band is traced with `rasterio.features.shapes` in pixel coordinates.
+    Polygons touching a band border are held back and unioned with the
+    pieces they share an edge with in the next band, so every region comes
+    out whole while only the open border pieces stay in memory. Regions are
+    4-connected.
+
+    Args:
+        source: Mask GeoTIFF (e.g. from `segment_scene`), .npy, image file or array.
+        band_rows (int): Rows read and traced at a time.
+        mask_value (int, optional): Pixel value to vectorize; None takes every non-zero pixel.
+
+    Yields:
+        np.ndarray: Batches of finished shapely polygons, in pixel coordinates (x=col, y=row).
+    """
+    import shapely
+    from affine import Affine
+    from rasterio.features import shapes
+    from scipy.sparse import coo_matrix
+    from scipy.sparse.csgraph import connected_components
+
+    with SceneReader(source) as reader:
+        height, width = reader.height, reader.width
+        open_pieces = np.empty(0, dtype=object)
+        for r0 in range(0, height, band_rows):
+            r1 = min(r0 + band_rows, height)
+            band = reader.read(r0, 0, r1 - r0, width)
+            band = band[..., 0] if band.ndim == 3 else band
+            inside = band > 0 if mask_value is None else band == mask_value
+            pieces = np.array([shapely.geometry.shape(geometry) for geometry, _ in
+                               shapes(inside.astype(np.uint8), mask=inside, connectivity=4,
+                                      transform=Affine.translation(0, r0))], dtype=object)
+
+            if len(open_pieces) and len(pieces):
+                # Join the pieces left open by the previous band with those continuing them.
+                top = np.flatnonzero(shapely.bounds(pieces)[:, 1] == r0)
+                tree = shapely.STRtree(pieces[top])
+                left, right = tree.query(open_pieces, predicate='intersects')
+                touching = _shares_edge(open_pieces[left], pieces[top][right])
+                left, right = left[touching], top[right[touching]]
+                count = len(open_pieces) + len(pieces)
+                graph = coo_matrix((np.ones(len(left)), (left, right + len(open_pieces))), shape=(count, count))
+                _, group = connected_components(graph, directed=False)
+                nodes = np.concatenate([open_pieces, pieces])
+                order = np.argsort(group, kind='stable')
+                starts = np.flatnonzero(np.concatenate([[True], np.diff(group[order]) != 0]))
+                pieces = np.array([shapely.union_all(members) if len(members) > 1 else members[0]
+                                   for members in np.split(nodes[order], starts[1:])], dtype=object)
+            elif len(open_pieces):
+                pieces = open_pieces
+
+            continues = (shapely.bounds(pieces)[:, 3] == r1) & (r1 < height) if len(pieces) else np.zeros(0, bool)
+            open_pieces = pieces[continues]
+            if (~continues).any():
+                yield pieces[~continues]
+        if len(open_pieces):
+            yield open_pieces
+
+def export_mask_polygons(source, output_path='runs/export/landslides.parquet', dst_crs=LUNAR_CRS, scene=None,
+                         band_rows=DEFAULT_BAND_ROWS, mask_value=None, pixel_scale=None, partition_by=None):
+    """
+    Exports the regions of a landslide or change mask as georeferenced polygons.
+
+    Polygons are streamed from `iter_mask_polygons`, mapped through the
+    mask's geotransform (and reprojected to `dst_crs` when it differs from
+    the mask CRS) and written batch by batch.
+
+    Args:
+        source: Mask GeoTIFF, .npy, image file or array.
+        output_path (str): GeoParquet file or directory, or a .gpkg file.
+        dst_crs: CRS of the exported geometries; None keeps the mask CRS.
+            Masks without georeferencing are exported in pixel coordinates.
+        scene (str, optional): Scene name stored with every polygon; defaults to the file name.
+        band_rows (int): Rows vectorized at a time.
+        mask_value (int, optional): Pixel value to vectorize; None takes every non-zero pixel.
+        pixel_scale (float, optional): Pixel size in meters; defaults to the ground pixel size of
+            the geotransform at each polygon's centroid (see `pixel_size_m`).
+        partition_by (str, optional): Field to partition GeoParquet output by.
+
+    Returns:
+        int: The number of exported polygons.
+    """
+    import shapely
+
+    print("--- Exporting Mask Polygons ---")
+    with SceneReader(source) as reader:
+        transform, src_crs = reader.transform, reader.crs
+    if scene is None:
+        scene = 'array' if isinstance(source, np.ndarray) else _scene_name(source)
+    out_crs = None if src_crs is None else (dst_crs or src_crs)
+    reproject = src_crs is not None and dst_crs is not None and src_crs != dst_crs
+
+    def to_crs(coords):
+        xs = transform.a * coords[:, 0] + transform.b * coords[:, 1] + transform.c
+        ys = transform.d * coords[:, 0] + transform.e * coords[:, 1] + transform.f
+        if reproject:
+            from rasterio.warp import transform as transform_points
+
+            xs, ys = (np.asarray(v) for v in transform_points(src_crs, dst_crs, xs, ys))
+        return np.stack([xs, ys], axis=1)
+
+    with GeoFeatureWriter(output_path, POLYGON_FIELDS, crs=out_crs, partition_by=partition_by) as writer:
+        for polygons in iter_mask_polygons(source, band_rows, mask_value):
+            # Pixel polygons cover whole pixels, so their area is the pixel count.
+            area_px = np.rint(shapely.area(polygons)).astype(np.int64)
+            if pixel_scale is not None:
+                pixel_area = pixel_scale ** 2
+            elif transform is None:
+                pixel_area = 1.0
+            else:
+                centroids = shapely.get_coordinates(shapely.centroid(polygons))
+                lat = transform.e * centroids[:, 1] + transform.d * centroids[:, 0] + transform.f
+                x_size, y_size = pixel_size_m(transform, src_crs, lat)
+                pixel_area = x_size * y_size
+            geometries = shapely.transform(polygons, to_crs) if transform is not None else polygons
+            writer.write(geometries, {
+                'scene': np.full(len(polygons), scene, dtype=object),
+                'polygon_id': np.arange(writer.rows_written, writer.rows_written + len(polygons)),
+                'area_px': area_px,
+                'area_m2': area_px * pixel_area,
+            })
+        exported = writer.rows_written
+    print(f"{exported} polygons exported to: {output_path}")
+    return exported
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Export detections and mask polygons to GeoParquet or GeoPackage.")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    detections_parser = subparsers.add_parser('detections', help="Export a Parquet results file as box polygons.")
+    detections_parser.add_argument("detections", help="Parquet results from predict.py or sliced.py.")
+    detections_parser.add_argument("--output", default='runs/export/detections', help="GeoParquet directory/file or .gpkg.")
+    detections_parser.add_argument("--no-partition", action='store_true', help="Write a single GeoParquet file.")
+
+    masks_parser = subparsers.add_parser('masks', help="Vectorize mask GeoTIFFs into polygons.")
+    masks_parser.add_argument("masks", nargs='+', help="Mask GeoTIFFs (e.g. segment_scene or change masks).")
+    masks_parser.add_argument("--output", default='runs/export/landslides', help="Output directory (one file per mask).")
+    masks_parser.add_argument("--format", choices=('parquet', 'gpkg'), default='parquet', help="Output format.")
+    masks_parser.add_argument("--class-id", type=int, default=None, help="Class value to vectorize; default is non-zero.")
+    args = parser.parse_args()
+
+    if args.command == 'detections':
+        export_detections(args.detections, args.output, partition_by=None if args.no_partition else 'scene')
+    else:
+        for mask_path in args.masks:
+            export_mask_polygons(mask_path, os.path.join(args.output, f"{_scene_name(mask_path)}.{args.format}"),
+                                 mask_value=args.class_id)
@@ -0,0 +1,144 @@
+import argparse
+import time
+
+import numpy as np
+import torch
+import torch.nn as nn
+
+from src.models.unet import UNet, UNET_VARIANTS
+
+# --- Configuration ---
+INPUT_CHANNELS = 3
+NUM_CLASSES = 3
+INPUT_SIZES = (256, 512, 1024)
+
+def count_parameters(model):
+    """Returns the number of trainable parameters in a model."""
+    return sum(p.numel() for p in model.parameters() if p.requires_grad)
+
+def profile_forward(model, input_shape):
+    """
+    Runs one forward pass with hooks attached to measure compute and memory.
+
+    FLOPs are counted for convolutions only (2 x multiply-accumulates), which
+    dominate a UNet; BatchNorm, ReLU and pooling are negligible in comparison.
+    Activation memory is the total size of every leaf module's output, i.e. an
+    upper bound on what a forward pass without buffer reuse has to hold.
+
+    Args:
+        model (nn.Module): The model to profile.
+        input_shape (tuple): Input shape as (batch, channels, height, width).
+
+    Returns:
+        dict: 'gflops' and 'activation_mb' for a single forward pass.
+    """
+    stats = {'macs': 0, 'activation_bytes': 0}
+
+    def hook(module, inputs, output):
+        stats['activation_bytes'] += output.numel() * output.element_size()
+        if isinstance(module, nn.Conv2d):
+            kernel_ops = (module.in_channels // module.groups) * module.kernel_size[0] * module.kernel_size[1]
+            stats['macs'] += output.numel() * kernel_ops
+        elif isinstance(module, nn.ConvTranspose2d):
+            kernel_ops = (module.out_channels // module.groups) * module.kernel_size[0] * module.kernel_size[1]
+            stats['macs'] += inputs[0].numel() * kernel_ops
+
+    handles = [m.register_forward_hook(hook) for m in model.modules() if len(list(m.children())) == 0]
+    try:
+        with torch.no_grad():
+            model(torch.zeros(input_shape))
+    finally:
+        for handle in handles:
+            handle.remove()
+
+    return {
+        'gflops': 2 * stats['macs'] / 1e9,
+        'activation_mb': stats['activation_bytes'] / 2**20,
+    }
+
+def measure_latency(model, input_shape, warmup=2, runs=5):
+    """
+    Measures CPU forward-pass latency in milliseconds.
+
+    Args:
+        model (nn.Module): The model to time, already in eval mode.
+        input_shape (tuple): Input shape as (batch, channels, height, width).
+        warmup (int): Untimed runs used to warm up allocator and kernels.
+        runs (int): Timed runs.
+
+    Returns:
+        dict: Median and minimum latency in milliseconds.
+    """
+    dummy_input = torch.randn(input_shape)
+    timings = []
+    with torch.no_grad():
+        for _ in range(warmup):
+            model(dummy_input)
+        for _ in range(runs):
+            start = time.perf_counter()
+            model(dummy_input)
+            timings.append((time.perf_counter() - start) * 1000)
+    return {'latency_ms': float(np.median(timings)), 'latency_min_ms': float(np.min(timings))}
+
+def benchmark_variants(variants=None, input_sizes=INPUT_SIZES, bilinear_options=(True, False),
+                       batch_size=1, warmup=2, runs=5):
+    """
+    Benchmarks UNet variants across input sizes and upsampling modes.
+
+    Args:
+        variants (dict, optional): Mapping of variant name to `UNet` keyword arguments.
+                                   Defaults to `UNET_VARIANTS`.
+        input_sizes (iterable): Square input sizes to test.
+        bilinear_options (iterable): Upsampling modes to test (True = bilinear,
+                                     False = transposed convolution).
+        batch_size (int): Batch size of the benchmark input.
+        warmup (int): Untimed runs per configuration.
+        runs (int): Timed runs per configuration.
+
+    Returns:
+        list: One result dict per (variant, upsampling, input size).
+    """
+    variants = variants or UNET_VARIANTS
+    results = []
+    for name, kwargs in variants.items():
+        for bilinear in bilinear_options:
+            model = UNet(INPUT_CHANNELS, NUM_CLASSES, bilinear=bilinear, **kwargs).eval()
+            params = count_parameters(model)
+            for size in input_sizes:
+                input_shape = (batch_size, INPUT_CHANNELS, size, size)
+                row = {
+                    'variant': name,
+                    'upsampling': 'bilinear' if bilinear else 'transposed',
+                    'input_size': size,
+                    'params_m': params / 1e6,
+                }
+                row.update(profile_forward(model, input_shape))
+                row.update(measure_latency(model, input_shape, warmup=warmup, runs=runs))
+                results.append(row)
+                print(f"{name:>16} {row['upsampling']:>10} {size:>5}px | "
+                      f"{row['params_m']:7.2f}M params | {row['gflops']:8.2f} GFLOPs | "
+                      f"{row['activation_mb']:8.1f} MB act | {row['latency_ms']:9.1f} ms")
+    return results
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Benchmark UNet variants on CPU.")
+    parser.add_argument("--variants", nargs="+", choices=sorted(UNET_VARIANTS), default=None,
+                        help="Variants to benchmark. Defaults to all.")
+    parser.add_argument("--sizes", nargs="+", type=int, default=list(INPUT_SIZES),
+                        help="Square input sizes in pixels.")
+    parser.add_argument("--threads", type=int, default=None, help="Number of CPU threads for PyTorch.")
+    parser.add_argument("--runs", type=int, default=5, help="Timed runs per configuration.")
+    parser.add_argument("--output", type=str, default=None, help="Optional CSV path for the results.")
+    args = parser.parse_args()
+
+    if args.threads:
+        torch.set_num_threads(args.threads)
+
+    selected = {name: UNET_VARIANTS[name] for name in args.variants} if args.variants else None
+    print(f"--- Benchmarking UNet variants on CPU ({torch.get_num_threads()} threads) ---")
+    benchmark_results = benchmark_variants(selected, input_sizes=args.sizes, runs=args.runs)
+
+    if args.output:
+        import pandas as pd
+        pd.DataFrame(benchmark_results).to_csv(args.output, index=False)
+        print(f"Results saved to: {args.output}")
@@ -0,0 +1,194 @@
+import argparse
+import copy
+import os
+import time
+
+import numpy as np
+import torch
+import torch.nn as nn
+from torch.ao.quantization import (DeQuantStub, QConfig, QuantStub, convert, default_weight_observer,
+                                   fuse_modules, get_default_qconfig, prepare)
+from torch.utils.data import DataLoader, Subset
+
+from src.models.unet import DoubleConv, UNet, UNET_VARIANTS
+
+# --- Configuration ---
+DATA_DIR = 'data/processed/segmentation'
+MASKS_DIR = 'data/labeled/segmentation'
+CHECKPOINT_PATH = 'models/unet_landslide_detector_best.pth'
+QUANTIZED_MODEL_PATH = 'models/unet_landslide_detector_int8.pt'
+NUM_CLASSES = 3
+INPUT_CHANNELS = 3
+
+class QuantizableUNet(nn.Module):
+    """
+    Wraps a fused UNet with the quant/dequant stubs needed for eager-mode
+    static quantization. Inputs and outputs stay float32 tensors.
+    """
+    def __init__(self, model):
+        super().__init__()
+        self.quant = QuantStub()
+        self.model = model
+        self.dequant = DeQuantStub()
+
+    def forward(self, x):
+        return self.dequant(self.model(self.quant(x)))
+
+def fuse_unet(model):
+    """
+    Folds every BatchNorm into the preceding convolution and fuses the ReLU.
+
+    The returned model is an eval-mode copy; it gives identical outputs to the
+    original and is already faster on CPU, even without quantization.
+
+    Args:
+        model (UNet): A float UNet.
+
+    Returns:
+        UNet: A fused copy of the model.
+    """
+    fused = copy.deepcopy(model).eval()
+    for module in fused.modules():
+        if isinstance(module, DoubleConv):
+            # Separable blocks have a depthwise conv in front of each pointwise conv.
+            groups = [['1', '2', '3'], ['5', '6', '7']] if len(module.double_conv) == 8 else [['0', '1', '2'], ['3', '4', '5']]
+            fuse_modules(module.double_conv, groups, inplace=True)
+    return fused
+
+def make_calibration_loader(dataset, num_samples=64, batch_size=8, seed=0):
+    """
+    Builds a loader over a random sample of a `LunarDataset` for calibration.
+
+    Args:
+        dataset (Dataset): The dataset to sample tiles from.
+        num_samples (int): Number of tiles used to calibrate activation ranges.
+        batch_size (int): Calibration batch size.
+        seed (int): Seed for the sample selection, so artifacts are reproducible.
+
+    Returns:
+        DataLoader: A loader yielding `{'data', 'mask'}` batches.
+    """
+    rng = np.random.default_rng(seed)
+    indices = rng.choice(len(dataset), size=min(num_samples, len(dataset)), replace=False)
+    return DataLoader(Subset(dataset, indices.tolist()), batch_size=batch_size, shuffle=False)
+
+def quantize_unet(model, calibration_loader, backend='x86'):
+    """
+    Applies post-training static int8 quantization to a UNet.
+
+    Args:
+        model (UNet): A trained float UNet.
+        calibration_loader (DataLoader): Batches of representative input tiles.
+        backend (str): Quantized engine, 'x86'/'fbgemm' for servers or 'qnnpack' for ARM.
+
+    Returns:
+        nn.Module: The quantized model, taking and returning float tensors.
+    """
+    torch.backends.quantized.engine = backend
+    quantizable = QuantizableUNet(fuse_unet(model)).eval()
+    quantizable.qconfig = get_default_qconfig(backend)
+    # Transposed convolutions only support per-tensor weight quantization.
+    for module in quantizable.modules():
+        if isinstance(module, nn.ConvTranspose2d):
+            module.qconfig = QConfig(activation=quantizable.qconfig.activation, weight=default_weight_observer)
+    prepare(quantizable, inplace=True)
+
+    print(f"Calibrating on {len(calibration_loader.dataset)} tiles...")
+    with torch.no_grad():
+        for batch in calibration_loader:
+            quantizable(batch['data'])
+
+    return convert(quantizable, inplace=True)
+
+def save_quantized_model(quantized_model, path, input_size=256):
+    """
+    Saves a quantized model as a self-contained TorchScript artifact.
+
+    The artifact can be loaded with `torch.jit.load` on a host that does not
+    have this repository's model code.
+    """
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    example = torch.randn(1, INPUT_CHANNELS, input_size, input_size)
+    with torch.no_grad():
+        scripted = torch.jit.trace(quantized_model, example)
+    torch.jit.save(scripted, path)
+    print(f"Quantized model saved to: {path}")
+
+def _time_model(model, inputs, runs):
+    timings = []
+    with torch.no_grad():
+        model(inputs)
+        for _ in range(runs):
+            start = time.perf_counter()
+            model(inputs)
+            timings.append((time.perf_counter() - start) * 1000)
+    return float(np.median(timings))
+
+def compare_models(float_model, quantized_model, loader, input_size=512, runs=5):
+    """
+    Reports the accuracy delta and CPU speedup of a quantized model.
+
+    Args:
+        float_model (nn.Module): The reference float model.
+        quantized_model (nn.Module): The quantized (or fused) model.
+        loader (DataLoader): Labelled batches used for the accuracy comparison.
+        input_size (int): Square input size for the latency comparison.
+        runs (int): Timed runs per model.
+
+    Returns:
+        dict: Pixel accuracy of both models, the agreement between their
+              predictions, and their latencies.
+    """
+    float_model.eval()
+    quantized_model.eval()
+    float_correct = quant_correct = agree = total = 0
+    with torch.no_grad():
+        for batch in loader:
+            masks = batch['mask']
+            float_pred = float_model(batch['data']).argmax(dim=1)
+            quant_pred = quantized_model(batch['data']).argmax(dim=1)
+            float_correct += (float_pred == masks).sum().item()
+            quant_correct += (quant_pred == masks).sum().item()
+            agree += (float_pred == quant_pred).sum().item()
+            total += masks.numel()
+
+    inputs = torch.randn(1, INPUT_CHANNELS, input_size, input_size)
+    float_ms = _time_model(float_model, inputs, runs)
+    quant_ms = _time_model(quantized_model, inputs, runs)
+    report = {
+        'float_pixel_accuracy': float_correct / total,
+        'quantized_pixel_accuracy': quant_correct / total,
+        'accuracy_delta': (quant_correct - float_correct) / total,
+        'prediction_agreement': agree / total,
+        'float_latency_ms': float_ms,
+        'quantized_latency_ms': quant_ms,
+        'speedup': float_ms / quant_ms,
+    }
+    return report
+
+if __name__ == '__main__':
+    from src.data.dataset import LunarDataset
+
+    parser = argparse.ArgumentParser(description="Fuse and int8-quantize a trained UNet for CPU inference.")
+    parser.add_argument("--checkpoint", default=CHECKPOINT_PATH, help="Float UNet state_dict.")
+    parser.add_argument("--variant", default='classic', choices=sorted(UNET_VARIANTS), help="UNet preset the checkpoint was trained with.")
+    parser.add_argument("--output", default=QUANTIZED_MODEL_PATH, help="Where to save the TorchScript int8 artifact.")
+    parser.add_argument("--num-calibration", type=int, default=64, help="Number of tiles used for calibration.")
+    parser.add_argument("--backend", default='x86', choices=['x86', 'fbgemm', 'qnnpack'], help="Quantized engine.")
+    args = parser.parse_args()
+
+    print("--- Quantizing UNet for CPU Inference ---")
+    float_unet = UNet(INPUT_CHANNELS, NUM_CLASSES, **UNET_VARIANTS[args.variant])
+    float_unet.load_state_dict(torch.load(args.checkpoint, map_location='cpu'))
+    float_unet.eval()
+
+    dataset = LunarDataset(data_dir=DATA_DIR, masks_dir=MASKS_DIR)
+    calibration_loader = make_calibration_loader(dataset, num_samples=args.num_calibration)
+    quantized_unet = quantize_unet(float_unet, calibration_loader, backend=args.backend)
+    save_quantized_model(quantized_unet, args.output)
+
+    # Evaluate on a different sample than the one used for calibration.
+    eval_loader = make_calibration_loader(dataset, num_samples=args.num_calibration, seed=1)
+    results = compare_models(float_unet, quantized_unet, eval_loader)
+    for key, value in results.items():
+        print(f"  {key}: {value:.4f}")
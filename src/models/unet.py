@@ -1,22 +1,51 @@
 import torch
 import torch.nn as nn
 import torch.nn.functional as F
+from torch.ao.nn.quantized import FloatFunctional
+
+# Named width/depth presets for the UNet family. "classic" is the original
+# 64-1024 channel network (~17M parameters); the others trade capacity for
+# CPU throughput. Use `src/models/benchmark.py` to measure them.
+UNET_VARIANTS = {
+    'classic': {},
+    'slim': {'width_mult': 0.5},
+    'slim-separable': {'width_mult': 0.5, 'separable': True},
+    'tiny': {'width_mult': 0.25, 'depth': 3},
+    'tiny-separable': {'width_mult': 0.25, 'depth': 3, 'separable': True},
+}
 
 class DoubleConv(nn.Module):
-    """(convolution => [BN] => ReLU) * 2"""
+    """(convolution => [BN] => ReLU) * 2
 
-    def __init__(self, in_channels, out_channels, mid_channels=None):
+    With `separable=True` each 3x3 convolution is replaced by a depthwise 3x3
+    convolution followed by a pointwise 1x1 convolution, which cuts the
+    parameters and FLOPs of the block by roughly a factor of 8.
+    """
+
+    def __init__(self, in_channels, out_channels, mid_channels=None, separable=False):
         super().__init__()
         if not mid_channels:
             mid_channels = out_channels
-        self.double_conv = nn.Sequential(
-            nn.Conv2d(in_channels, mid_channels, kernel_size=3, padding=1),
-            nn.BatchNorm2d(mid_channels),
-            nn.ReLU(inplace=True),
-            nn.Conv2d(mid_channels, out_channels, kernel_size=3, padding=1),
-            nn.BatchNorm2d(out_channels),
-            nn.ReLU(inplace=True)
-        )
+        if separable:
+            self.double_conv = nn.Sequential(
+                nn.Conv2d(in_channels, in_channels, kernel_size=3, padding=1, groups=in_channels, bias=False),
+                nn.Conv2d(in_channels, mid_channels, kernel_size=1),
+                nn.BatchNorm2d(mid_channels),
+                nn.ReLU(inplace=True),
+                nn.Conv2d(mid_channels, mid_channels, kernel_size=3, padding=1, groups=mid_channels, bias=False),
+                nn.Conv2d(mid_channels, out_channels, kernel_size=1),
+                nn.BatchNorm2d(out_channels),
+                nn.ReLU(inplace=True)
+            )
+        else:
+            self.double_conv = nn.Sequential(
+                nn.Conv2d(in_channels, mid_channels, kernel_size=3, padding=1),
+                nn.BatchNorm2d(mid_channels),
+                nn.ReLU(inplace=True),
+                nn.Conv2d(mid_channels, out_channels, kernel_size=3, padding=1),
+                nn.BatchNorm2d(out_channels),
+                nn.ReLU(inplace=True)
+            )
 
     def forward(self, x):
         return self.double_conv(x)
@@ -24,11 +53,11 @@ class DoubleConv(nn.Module):
 class Down(nn.Module):
     """Downscaling with maxpool then double conv"""
 
-    def __init__(self, in_channels, out_channels):
+    def __init__(self, in_channels, out_channels, separable=False):
         super().__init__()
         self.maxpool_conv = nn.Sequential(
             nn.MaxPool2d(2),
-            DoubleConv(in_channels, out_channels)
+            DoubleConv(in_channels, out_channels, separable=separable)
         )
 
     def forward(self, x):
@@ -37,15 +66,18 @@ class Down(nn.Module):
 class Up(nn.Module):
     """Upscaling then double conv"""
 
-    def __init__(self, in_channels, out_channels, bilinear=True):
+    def __init__(self, in_channels, out_channels, bilinear=True, separable=False):
         super().__init__()
 
         if bilinear:
             self.up = nn.Upsample(scale_factor=2, mode='bilinear', align_corners=True)
-            self.conv = DoubleConv(in_channels, out_channels, in_channels // 2)
+            self.conv = DoubleConv(in_channels, out_channels, in_channels // 2, separable=separable)
         else:
             self.up = nn.ConvTranspose2d(in_channels , in_channels // 2, kernel_size=2, stride=2)
-            self.conv = DoubleConv(in_channels, out_channels)
+            self.conv = DoubleConv(in_channels, out_channels, separable=separable)
+        # A FloatFunctional is a plain torch.cat in float mode; it lets static
+        # quantization observe and requantize the skip concatenation.
+        self.skip_cat = FloatFunctional()
 
     def forward(self, x1, x2):
         x1 = self.up(x1)
@@ -55,7 +87,7 @@ class Up(nn.Module):
 
         x1 = F.pad(x1, [diffX // 2, diffX - diffX // 2,
                         diffY // 2, diffY - diffY // 2])
-        x = torch.cat([x2, x1], dim=1)
+        x = self.skip_cat.cat([x2, x1], dim=1)
         return self.conv(x)
 
 class OutConv(nn.Module):
@@ -68,47 +100,75 @@ class OutConv(nn.Module):
 
 class UNet(nn.Module):
     """
-    A standard UNet model for semantic segmentation.
+    A configurable UNet model for semantic segmentation.
     This architecture is designed to take our fused 3-channel input
     (OHRC, DTM, Slope) and output a segmentation map.
+
+    The defaults reproduce the classic UNet (64-1024 channels, 4 levels), so
+    existing `unet_landslide_detector_best.pth` checkpoints keep loading.
     """
-    def __init__(self, n_channels, n_classes, bilinear=True):
+    def __init__(self, n_channels, n_classes, bilinear=True, base_channels=64,
+                 width_mult=1.0, depth=4, separable=False):
         """
         Args:
             n_channels (int): Number of input channels (3 for our case).
             n_classes (int): Number of output classes (e.g., 3 for background, landslide, boulder).
             bilinear (bool): Whether to use bilinear upsampling or a transposed convolution.
+            base_channels (int): Width of the first encoder level before `width_mult` is applied.
+            width_mult (float): Multiplier applied to every level's channel count.
+            depth (int): Number of down/up sampling levels. The input height and width
+                         should be divisible by 2**depth.
+            separable (bool): Use depthwise-separable convolutions in every `DoubleConv`.
         """
         super(UNet, self).__init__()
+        if depth < 1:
+            raise ValueError("UNet depth must be at least 1.")
         self.n_channels = n_channels
         self.n_classes = n_classes
         self.bilinear = bilinear
-
-        self.inc = DoubleConv(n_channels, 64)
-        self.down1 = Down(64, 128)
-        self.down2 = Down(128, 256)
-        self.down3 = Down(256, 512)
+        self.base_channels = base_channels
+        self.width_mult = width_mult
+        self.depth = depth
+        self.separable = separable
+
+        # Round the first level to a multiple of 8 and double at every level
+        # so that the skip connections always line up with the upsampled maps.
+        width = max(8, int(base_channels * width_mult + 4) // 8 * 8)
+        widths = [width * 2 ** i for i in range(depth + 1)]
         factor = 2 if bilinear else 1
-        self.down4 = Down(512, 1024 // factor)
-        self.up1 = Up(1024, 512 // factor, bilinear)
-        self.up2 = Up(512, 256 // factor, bilinear)
-        self.up3 = Up(256, 128 // factor, bilinear)
-        self.up4 = Up(128, 64, bilinear)
-        self.outc = OutConv(64, n_classes)
+
+        self.inc = DoubleConv(n_channels, widths[0], separable=separable)
+        for i in range(1, depth + 1):
+            out_channels = widths[i] // factor if i == depth else widths[i]
+            self.add_module(f'down{i}', Down(widths[i - 1], out_channels, separable))
+        for i in range(1, depth + 1):
+            level = depth - i
+            out_channels = widths[level] // factor if level > 0 else widths[0]
+            self.add_module(f'up{i}', Up(widths[level + 1], out_channels, bilinear, separable))
+        self.outc = OutConv(widths[0], n_classes)
 
     def forward(self, x):
-        x1 = self.inc(x)
-        x2 = self.down1(x1)
-        x3 = self.down2(x2)
-        x4 = self.down3(x3)
-        x5 = self.down4(x4)
-        x = self.up1(x5, x4)
-        x = self.up2(x, x3)
-        x = self.up3(x, x2)
-        x = self.up4(x, x1)
+        skips = [self.inc(x)]
+        for i in range(1, self.depth + 1):
+            skips.append(getattr(self, f'down{i}')(skips[-1]))
+        x = skips.pop()
+        for i in range(1, self.depth + 1):
+            x = getattr(self, f'up{i}')(x, skips.pop())
         logits = self.outc(x)
         return logits
 
+    def get_config(self):
+        """Returns the keyword arguments needed to rebuild this model."""
+        return {
+            'n_channels': self.n_channels,
+            'n_classes': self.n_classes,
+            'bilinear': self.bilinear,
+            'base_channels': self.base_channels,
+            'width_mult': self.width_mult,
+            'depth': self.depth,
+            'separable': self.separable,
+        }
+
 if __name__ == '__main__':
     # This block demonstrates how to instantiate and use the UNet model.
     print("Running UNet model demonstration...")
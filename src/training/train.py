@@ -6,7 +6,7 @@ from tqdm import tqdm
 import os
 import numpy as np
 
-from src.models.unet import UNet
+from src.models.unet import UNet, UNET_VARIANTS
 from src.data.dataset import LunarDataset
 
 # --- Configuration ---
@@ -15,6 +15,8 @@ MASKS_DIR = 'data/labeled/segmentation'
 MODEL_SAVE_PATH = 'models/unet_landslide_detector_best.pth'
 NUM_CLASSES = 3
 INPUT_CHANNELS = 3
+# One of the presets in UNET_VARIANTS; see src/models/benchmark.py for their cost.
+MODEL_VARIANT = 'classic'
 LEARNING_RATE = 1e-4
 BATCH_SIZE = 8
 NUM_EPOCHS = 50
@@ -65,7 +67,8 @@ def main():
 
     # --- Model, Optimizer, and Loss Function ---
     print("Initializing model, optimizer, and loss function...")
-    model = UNet(n_channels=INPUT_CHANNELS, n_classes=NUM_CLASSES).to(device)
+    model = UNet(n_channels=INPUT_CHANNELS, n_classes=NUM_CLASSES, **UNET_VARIANTS[MODEL_VARIANT]).to(device)
+    print(f"Model variant: {MODEL_VARIANT}")
     optimizer = optim.Adam(model.parameters(), lr=LEARNING_RATE, weight_decay=1e-8)
     criterion = nn.CrossEntropyLoss()
 
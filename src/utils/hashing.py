@@ -0,0 +1,24 @@
+import hashlib
+
+import numpy as np
+
+# --- Configuration ---
+HASH_CHUNK_BYTES = 1 << 26
+
+def hash_array(array):
+    """
+    Hashes an array's pixels together with its shape and dtype.
+
+    Large arrays (e.g. memory-mapped DTMs) are hashed a block of rows at a
+    time, so they are never copied whole; the digest is the same as for the
+    array in one piece.
+    """
+    array = np.asarray(array)
+    digest = hashlib.sha256(f"{array.shape}|{array.dtype.str}|".encode())
+    if array.ndim == 0 or array.nbytes <= HASH_CHUNK_BYTES:
+        digest.update(memoryview(np.ascontiguousarray(array)).cast('B'))
+        return digest.hexdigest()
+    rows = max(1, HASH_CHUNK_BYTES // max(1, array[0].nbytes))
+    for r0 in range(0, len(array), rows):
+        digest.update(memoryview(np.ascontiguousarray(array[r0:r0 + rows])).cast('B'))
+    return digest.hexdigest()
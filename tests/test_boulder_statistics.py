@@ -0,0 +1,80 @@
+import numpy as np
+import pyarrow as pa
+import pyarrow.parquet as pq
+import pytest
+
+from src.analysis.boulder_statistics import (DensityGrid, MOON_RADIUS_M, SizeFrequencyAccumulator,
+                                             accumulate_boulder_statistics)
+
+def test_size_histogram_bins_and_merges():
+    diameters = np.array([0.1, 1.0, 1.5, 9.99, 10.0, 500.0])
+    whole = SizeFrequencyAccumulator(min_diameter=1.0, max_diameter=100.0, bins_per_decade=1)
+    whole.update(diameters)
+    split = SizeFrequencyAccumulator(min_diameter=1.0, max_diameter=100.0, bins_per_decade=1)
+    split.update(diameters[:3])
+    split.merge(SizeFrequencyAccumulator(min_diameter=1.0, max_diameter=100.0, bins_per_decade=1))
+    other = SizeFrequencyAccumulator(min_diameter=1.0, max_diameter=100.0, bins_per_decade=1)
+    other.update(diameters[3:])
+    split.merge(other)
+
+    assert whole.counts.tolist() == [3, 1] and (whole.underflow, whole.overflow) == (1, 1)
+    assert split.counts.tolist() == whole.counts.tolist() and split.total == 6
+    assert whole.cumulative()[1].tolist() == [5, 2]
+    with pytest.raises(ValueError):
+        whole.merge(SizeFrequencyAccumulator(min_diameter=2.0))
+
+def test_density_grid_counts_and_cell_areas():
+    grid = DensityGrid(bounds=(-180, -90, 180, 90), cell_deg=10.0)
+    grid.update([5.0, 5.0, -175.0, 200.0], [85.0, 81.0, -85.0, 0.0])
+
+    assert grid.counts[0, 18] == 2 and grid.counts[-1, 0] == 1 and grid.outside == 1
+    total_area = grid.cell_areas_km2().sum() * grid.width
+    assert total_area == pytest.approx(4 * np.pi * (MOON_RADIUS_M / 1000) ** 2)
+
+def test_statistics_stream_from_georeferenced_results(tmp_path):
+    rasterio = pytest.importorskip("rasterio")
+    from rasterio.transform import from_origin
+
+    scene = str(tmp_path / 'scene.tif')
+    profile = {'driver': 'GTiff', 'height': 100, 'width': 100, 'count': 1, 'dtype': 'uint8',
+               'crs': '+proj=eqc +R=1737400 +units=m +no_defs', 'transform': from_origin(0.0, 0.0, 0.5, 0.5)}
+    with rasterio.open(scene, 'w', **profile) as dst:
+        dst.write(np.zeros((100, 100), dtype=np.uint8), 1)
+    paths = []
+    for i in range(2):
+        paths.append(str(tmp_path / f'results_{i}.parquet'))
+        pq.write_table(pa.table({
+            'image_path': [scene] * 3, 'xmin': [0.0, 10.0, 20.0], 'ymin': [0.0, 10.0, 20.0],
+            'xmax': [4.0, 30.0, 22.0], 'ymax': [4.0, 30.0, 22.0], 'score': [0.9, 0.9, 0.1], 'class_id': [0, 0, 0],
+        }), paths[-1])
+
+    sizes, density = accumulate_boulder_statistics(paths, bounds=(-1, -1, 1, 1), cell_deg=0.5, min_score=0.5,
+                                                   min_diameter=1.0, max_diameter=100.0, num_workers=2, batch_rows=2)
+
+    # 4 px and 20 px boxes at 0.5 m/px: 2 m and 10 m boulders, twice each.
+    diameters, cumulative = sizes.cumulative()
+    assert sizes.total == 4
+    assert cumulative[np.searchsorted(diameters, 2.0, side='right') - 1] == 4
+    assert cumulative[np.searchsorted(diameters, 10.0, side='right') - 1] == 2
+    assert density.counts.sum() == 4 and density.counts[2, 2] == 4
+
+def test_geographic_scenes_are_binned_in_meters(tmp_path):
+    rasterio = pytest.importorskip("rasterio")
+    from rasterio.transform import from_origin
+
+    # 0.5 m pixels at 60 degrees north, expressed in degrees.
+    meters_per_deg = np.radians(MOON_RADIUS_M)
+    scene = str(tmp_path / 'scene.tif')
+    profile = {'driver': 'GTiff', 'height': 100, 'width': 100, 'count': 1, 'dtype': 'uint8', 'crs': 'IAU_2015:30100',
+               'transform': from_origin(10.0, 60.0, 0.5 / (meters_per_deg * 0.5), 0.5 / meters_per_deg)}
+    with rasterio.open(scene, 'w', **profile) as dst:
+        dst.write(np.zeros((100, 100), dtype=np.uint8), 1)
+    path = str(tmp_path / 'results.parquet')
+    pq.write_table(pa.table({'image_path': [scene], 'xmin': [10.0], 'ymin': [10.0], 'xmax': [34.0], 'ymax': [34.0],
+                             'score': [0.9], 'class_id': [0]}), path)
+
+    sizes, _ = accumulate_boulder_statistics([path], min_diameter=1.0, max_diameter=100.0, bins_per_decade=100)
+
+    # A 24 px box is a 12 m boulder.
+    assert sizes.counts[np.searchsorted(sizes.edges, 12.0, side='right') - 1] == 1
+    assert sizes.counts.sum() == 1
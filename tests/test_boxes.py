@@ -0,0 +1,51 @@
+import numpy as np
+from src.inference.boxes import non_max_suppression
+from src.inference.backends import decode_yolo_output, letterbox
+
+def test_non_max_suppression_removes_overlapping_boxes():
+    """
+    Overlapping boxes collapse to the highest-scoring one; separate boxes survive.
+    """
+    boxes = np.array([[0, 0, 10, 10], [1, 1, 11, 11], [50, 50, 60, 60]], dtype=np.float32)
+    scores = np.array([0.6, 0.9, 0.5], dtype=np.float32)
+
+    keep = non_max_suppression(boxes, scores, iou_threshold=0.5)
+
+    assert keep.tolist() == [1, 2]
+
+def test_non_max_suppression_is_class_aware():
+    """
+    Boxes of different classes must not suppress each other.
+    """
+    boxes = np.array([[0, 0, 10, 10], [0, 0, 10, 10]], dtype=np.float32)
+    scores = np.array([0.9, 0.8], dtype=np.float32)
+
+    keep = non_max_suppression(boxes, scores, iou_threshold=0.5, class_ids=np.array([0, 1]))
+
+    assert sorted(keep.tolist()) == [0, 1]
+
+def test_decode_yolo_output_converts_center_format():
+    """
+    Raw (4 + n_classes, n_anchors) head output is decoded to xyxy boxes.
+    """
+    output = np.zeros((5, 3), dtype=np.float32)
+    output[:, 0] = [50, 40, 20, 10, 0.9]   # a confident box
+    output[:, 1] = [51, 40, 20, 10, 0.8]   # a duplicate of it
+    output[:, 2] = [200, 200, 20, 20, 0.1]  # below the confidence threshold
+
+    detections = decode_yolo_output(output, conf=0.25, iou=0.45)
+
+    assert detections['boxes'].tolist() == [[40, 35, 60, 45]]
+    assert detections['scores'][0] == np.float32(0.9)
+
+def test_letterbox_keeps_aspect_ratio():
+    """
+    A wide image is scaled to fit and padded vertically.
+    """
+    image = np.zeros((100, 200, 3), dtype=np.uint8)
+
+    padded, scale, (pad_x, pad_y) = letterbox(image, 64)
+
+    assert padded.shape == (64, 64, 3)
+    assert scale == 0.32
+    assert (pad_x, pad_y) == (0, 16)
@@ -0,0 +1,84 @@
+import numpy as np
+from src.inference.cache import CachedDetector, ResultCache, hash_array, make_cache_key, model_fingerprint
+
+class CountingDetector:
+    """A detector stub that counts how many images reach the model."""
+    def __init__(self):
+        self.calls = 0
+
+    def predict(self, images, conf=0.25, iou=0.45):
+        self.calls += len(images)
+        return [{'boxes': np.array([[0, 0, 1, 1]], dtype=np.float32) * image.mean(),
+                 'scores': np.array([conf], dtype=np.float32),
+                 'class_ids': np.array([0], dtype=np.int32)} for image in images]
+
+def test_result_cache_round_trip_and_stats(tmp_path):
+    cache = ResultCache(str(tmp_path))
+    mask = np.random.default_rng(0).integers(0, 2, (64, 64), dtype=np.uint8)
+
+    assert cache.get('missing') is None
+    cache.put('key', {'mask': mask})
+    restored = cache.get('key')
+
+    assert np.array_equal(restored['mask'], mask)
+    assert cache.stats()['hits'] == 1 and cache.stats()['misses'] == 1
+
+def test_result_cache_evicts_least_recently_used(tmp_path):
+    """
+    Once over budget, the entry that was read least recently goes first.
+    """
+    noise = np.random.default_rng(0).random((100, 100))
+    cache = ResultCache(str(tmp_path), max_bytes=10**9)
+    for key in ('a', 'b', 'c'):
+        cache.put(key, {'data': noise})
+    entry_size = cache.stats()['bytes'] // 3
+    cache.get('a')
+    cache.max_bytes = 3 * entry_size
+    cache.put('d', {'data': noise})
+
+    assert cache.get('b') is None
+    assert cache.get('a') is not None and cache.get('d') is not None
+
+def test_cached_detector_skips_model_for_repeat_images(tmp_path):
+    """
+    Repeat images hit the cache; new weights invalidate every entry.
+    """
+    weights = tmp_path / "model.pt"
+    weights.write_bytes(b"weights-v1")
+    cache = ResultCache(str(tmp_path / "cache"))
+    detector = CountingDetector()
+    images = [np.full((8, 8, 3), i, dtype=np.uint8) for i in range(3)]
+
+    first = CachedDetector(detector, cache, str(weights)).predict(images)
+    second = CachedDetector(detector, cache, str(weights)).predict(images + [images[0]])
+    weights.write_bytes(b"weights-v2-retrained")
+    CachedDetector(detector, cache, str(weights)).predict(images[:1])
+
+    assert detector.calls == 3 + 0 + 1
+    assert all(np.array_equal(a['boxes'], b['boxes']) for a, b in zip(first, second))
+    assert cache.prune_models([model_fingerprint(str(weights))]) == 3
+
+def test_cache_key_depends_on_parameters():
+    image_hash = hash_array(np.zeros((4, 4), dtype=np.uint8))
+
+    assert make_cache_key(image_hash, 'm', {'conf': 0.25}) != make_cache_key(image_hash, 'm', {'conf': 0.5})
+    assert hash_array(np.zeros((4, 4), dtype=np.uint8)) != hash_array(np.zeros((4, 4), dtype=np.uint16))
+
+def test_result_cache_treats_concurrently_evicted_entry_as_miss(tmp_path, monkeypatch):
+    """
+    An entry removed by another process between the index lookup and the load is a miss.
+    """
+    import os
+    import src.inference.cache as cache_module
+
+    cache = ResultCache(str(tmp_path))
+    cache.put('key', {'data': np.arange(3)})
+    path = cache._entry_path('key')
+    os.remove(path)
+    # Make the index lookup see the file, as if it was evicted just afterwards.
+    answers = iter([True])
+    monkeypatch.setattr(cache_module.os.path, 'exists', lambda p: next(answers, False))
+
+    assert cache.get('key') is None
+    assert cache.stats()['hits'] == 0 and cache.stats()['misses'] == 1
+    assert cache.stats()['entries'] == 0
@@ -0,0 +1,88 @@
+import numpy as np
+import pyarrow as pa
+import pyarrow.parquet as pq
+import pytest
+
+rasterio = pytest.importorskip("rasterio")
+from rasterio.transform import from_origin
+
+from src.inference.catalog import (DetectionCatalog, _intersecting_pairs, build_detection_catalog,
+                                   deduplicate_detections, pixel_boxes_to_lunar)
+
+# Equirectangular projection on the lunar sphere, in meters.
+MOON_EQC = '+proj=eqc +R=1737400 +units=m +no_defs'
+METERS_PER_DEG = np.pi * 1737400 / 180
+
+def _write_scene(path, left, top, crs=MOON_EQC):
+    profile = {'driver': 'GTiff', 'height': 100, 'width': 100, 'count': 1, 'dtype': 'uint8',
+               'crs': crs, 'transform': from_origin(left, top, 10.0, 10.0)}
+    with rasterio.open(path, 'w', **profile) as dst:
+        dst.write(np.zeros((100, 100), dtype=np.uint8), 1)
+    return str(path)
+
+def _write_detections(path, rows):
+    names = ('image_path', 'xmin', 'ymin', 'xmax', 'ymax', 'score', 'class_id')
+    pq.write_table(pa.table({name: [row[i] for row in rows] for i, name in enumerate(names)}), path)
+    return str(path)
+
+def test_pixel_boxes_follow_the_affine_and_projection(tmp_path):
+    with rasterio.open(_write_scene(tmp_path / 'scene.tif', 0.0, METERS_PER_DEG)) as dataset:
+        lunar = pixel_boxes_to_lunar([[0, 0, 100, 100]], dataset.transform, dataset.crs)
+
+    expected = [0.0, 1.0 - 1000 / METERS_PER_DEG, 1000 / METERS_PER_DEG, 1.0]
+    np.testing.assert_allclose(lunar[0], expected, atol=1e-6)
+
+def test_catalog_merges_overlapping_scenes_and_answers_bbox_queries(tmp_path):
+    # Scene b starts 500 m east of scene a, so a's column 60 is b's column 10.
+    a = _write_scene(tmp_path / 'a.tif', 0.0, 0.0)
+    b = _write_scene(tmp_path / 'b.tif', 500.0, 0.0)
+    detections = _write_detections(tmp_path / 'detections.parquet', [
+        (a, 60, 20, 70, 30, 0.6, 0),
+        (b, 10, 20, 20, 30, 0.9, 0),   # The same boulder seen in scene b.
+        (a, 5, 5, 10, 10, 0.8, 0),
+        (b, 80, 80, 90, 90, 0.7, 0),
+        (str(tmp_path / 'missing.png'), 0, 0, 5, 5, 0.5, 0),
+    ])
+
+    count = build_detection_catalog(detections, str(tmp_path / 'catalog.parquet'), cell_deg=0.005)
+    assert count == 3
+
+    catalog = DetectionCatalog(str(tmp_path / 'catalog.parquet'))
+    merged = catalog.query(600 / METERS_PER_DEG, -300 / METERS_PER_DEG, 700 / METERS_PER_DEG, -200 / METERS_PER_DEG)
+    assert merged.num_rows == 1
+    assert merged['score'][0].as_py() == pytest.approx(0.9)
+    assert merged['n_views'][0].as_py() == 2
+
+    assert catalog.query(-1, -1, 1, 1).num_rows == 3
+    assert catalog.query(10, 10, 11, 11).num_rows == 0
+
+def test_dense_detections_pair_only_intersecting_boxes_from_different_images():
+    rng = np.random.default_rng(0)
+    centers, sizes = rng.uniform(0, 0.01, (400, 2)), rng.uniform(1e-4, 1e-3, (400, 1))
+    boxes = np.concatenate([centers - sizes / 2, centers + sizes / 2], axis=1)
+    image_ids = rng.integers(0, 3, 400)
+
+    pairs = [np.stack(p) for p in _intersecting_pairs(boxes, image_ids, chunk_size=37)]
+    found = {tuple(pair) for pair in np.concatenate(pairs, axis=1).T}
+    overlaps = ((boxes[:, None, 0] <= boxes[None, :, 2]) & (boxes[None, :, 0] <= boxes[:, None, 2]) &
+                (boxes[:, None, 1] <= boxes[None, :, 3]) & (boxes[None, :, 1] <= boxes[:, None, 3]))
+    overlaps &= image_ids[:, None] != image_ids[None, :]
+    assert found == {(i, j) for i, j in zip(*np.nonzero(np.triu(overlaps, 1)))}
+
+def test_boxes_larger_than_a_grid_cell_are_still_merged():
+    boxes = np.array([[0.0, 0.0, 0.5, 0.5], [0.01, 0.01, 0.51, 0.51], [0.0, 0.0, 0.5, 0.5]])
+
+    keep, n_views = deduplicate_detections(boxes, np.array([0.5, 0.9, 0.7]), np.array([0, 1, 0]))
+
+    # Box 1 absorbs one of the two boxes from image 0; the other is kept on its own.
+    assert keep.tolist() == [1, 2] and n_views.tolist() == [2, 1]
+
+def test_distinct_objects_in_one_image_are_not_merged_through_another():
+    # Boxes 0 and 2 are neighbouring objects in image 0; box 1 from image 1
+    # overlaps both, and box 3 from image 2 is another view of box 2.
+    boxes = np.array([[0.0, 0.0, 1.0, 1.0], [0.5, 0.0, 1.5, 1.0], [1.0, 0.0, 2.0, 1.0], [1.05, 0.0, 2.05, 1.0]])
+
+    keep, n_views = deduplicate_detections(boxes, np.array([0.8, 0.6, 0.9, 0.7]), np.array([0, 1, 0, 2]),
+                                           iou_threshold=0.3)
+
+    assert keep.tolist() == [0, 2] and n_views.tolist() == [1, 3]
@@ -0,0 +1,75 @@
+import numpy as np
+import pytest
+
+rasterio = pytest.importorskip("rasterio")
+from rasterio.transform import from_origin
+
+from src.analysis.change_scheduler import _compare_group, find_overlapping_pairs, load_scene_footprints, run_change_detection
+
+def _write_scene(path, pixels, left, top, acquired=None):
+    profile = {'driver': 'GTiff', 'height': pixels.shape[0], 'width': pixels.shape[1], 'count': 1,
+               'dtype': pixels.dtype.name, 'crs': 'EPSG:32633', 'transform': from_origin(left, top, 1.0, 1.0)}
+    with rasterio.open(path, 'w', **profile) as dst:
+        dst.write(pixels, 1)
+        if acquired:
+            dst.update_tags(TIFFTAG_DATETIME=acquired)
+    return str(path)
+
+def _scenes(tmp_path, dtype=np.uint8):
+    rng = np.random.default_rng(0)
+    import cv2
+
+    ground = cv2.GaussianBlur((rng.random((300, 500)) * 255).astype(np.uint8), (0, 0), 2).astype(dtype)
+    changed = ground.copy()
+    changed[100:140, 220:260] = 255
+    return [
+        _write_scene(tmp_path / 'a.tif', ground[:, :300], 0, 300, '2019:01:01 00:00:00'),
+        _write_scene(tmp_path / 'b.tif', changed[:, 200:500], 200, 300, '2021:06:01 00:00:00'),
+        _write_scene(tmp_path / 'c.tif', ground[:, :300], 1000, 300, '2020:01:01 00:00:00'),
+    ]
+
+def test_pairs_are_found_by_footprint_and_ordered_by_time(tmp_path):
+    scenes = load_scene_footprints(_scenes(tmp_path))
+    pairs = find_overlapping_pairs(scenes)
+
+    assert [(p['before']['path'][-5:], p['after']['path'][-5:]) for p in pairs] == [('a.tif', 'b.tif')]
+    assert pairs[0]['overlap'] == (200.0, 0.0, 300.0, 300.0)
+
+def test_change_catalog_locates_the_new_feature(tmp_path):
+    catalog = run_change_detection(_scenes(tmp_path), output_path=str(tmp_path / 'changes.parquet'), num_workers=2)
+
+    assert len(catalog) >= 1
+    region = catalog.sort_values('area_px').iloc[-1]
+    assert 215 <= region['xmin'] <= 225 and 255 <= region['xmax'] <= 265
+    assert 155 <= region['ymin'] <= 165 and 195 <= region['ymax'] <= 205
+    assert region['before_path'].endswith('a.tif') and region['after_path'].endswith('b.tif')
+
+def test_overlap_window_is_clipped_before_building_its_transform(tmp_path):
+    from src.analysis.change_scheduler import _read_overlap
+    from src.inference.raster import SceneReader
+
+    pixels = np.arange(300 * 300, dtype=np.uint32).reshape(300, 300).astype(np.uint8)
+    with SceneReader(_write_scene(tmp_path / 'a.tif', pixels, 100, 300)) as reader:
+        # The bounds start 0.7 pixels left of the scene, so the rounded window starts at column -1.
+        read, transform = _read_overlap(reader, (99.3, 0.0, 150.0, 300.0))
+
+    assert read.shape == (300, 50)
+    np.testing.assert_array_equal(read, pixels[:, :50])
+    assert (transform.c, transform.f) == (100.0, 300.0)
+
+def test_float_scenes_get_a_data_range(tmp_path):
+    catalog = run_change_detection(_scenes(tmp_path, np.float32), output_path=str(tmp_path / 'changes.csv'),
+                                   num_workers=1)
+
+    region = catalog.sort_values('area_px').iloc[-1]
+    assert 215 <= region['xmin'] <= 225 and 255 <= region['xmax'] <= 265
+    assert 155 <= region['ymin'] <= 165 and 195 <= region['ymax'] <= 205
+
+def test_a_failing_pair_does_not_abort_its_group(tmp_path, capsys):
+    pairs = find_overlapping_pairs(load_scene_footprints(_scenes(tmp_path)))
+    missing = dict(pairs[0], before=dict(pairs[0]['before'], path=str(tmp_path / 'missing.tif')))
+
+    rows = _compare_group([missing] + pairs, 25, None)
+
+    assert rows and all(row['before_path'].endswith('a.tif') for row in rows)
+    assert 'missing.tif' in capsys.readouterr().out
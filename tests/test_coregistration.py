@@ -0,0 +1,37 @@
+import cv2
+import numpy as np
+from src.analysis.coregistration import coregister, estimate_transform, warp_to_reference
+
+def _terrain(size=1400, seed=1):
+    rng = np.random.default_rng(seed)
+    terrain = cv2.GaussianBlur((rng.random((size, size)) * 255).astype(np.float32), (0, 0), 3)
+    for _ in range(30):
+        center = (int(rng.integers(0, size)), int(rng.integers(0, size)))
+        cv2.circle(terrain, center, int(rng.integers(10, 60)), float(rng.integers(0, 255)), -1)
+    return terrain
+
+def test_recovers_rotation_scale_and_shift_between_different_footprints():
+    terrain = _terrain()
+    distortion = cv2.getRotationMatrix2D((700, 700), -6, 1.08)
+    distortion[:, 2] += (17.5, -9.25)
+    reference = terrain[300:1100, 300:1100]
+    moving = cv2.warpAffine(terrain, distortion, (1400, 1400))[200:1200, 250:1150]
+
+    result = estimate_transform(reference, moving, coarse_size=256, window=512)
+    aligned, coverage = warp_to_reference(moving, reference.shape, result['matrix'])
+
+    assert abs(result['rotation_deg'] - 6) < 0.1
+    assert abs(result['scale'] - 1 / 1.08) < 0.002
+    assert np.abs(aligned - reference)[100:700, 100:700].mean() < 1.0
+    assert coverage[100:700, 100:700].all()
+
+def test_coregister_caches_the_pair_transform(tmp_path):
+    terrain = _terrain(600)
+    reference, moving = terrain[50:550, 50:550], terrain[62:562, 41:541]
+
+    first = coregister(reference, moving, cache_dir=str(tmp_path))
+    again = coregister(reference, moving, cache_dir=str(tmp_path))
+
+    assert len(list(tmp_path.iterdir())) == 1
+    np.testing.assert_allclose(first['matrix'], again['matrix'])
+    np.testing.assert_allclose(first['matrix'][:, 2], [-9, 12], atol=0.1)
@@ -0,0 +1,74 @@
+import numpy as np
+from src.analysis.flow_direction import (D8_COL_OFFSETS, D8_ROW_OFFSETS, NO_FLOW, FlowIndex,
+                                         compute_flow_accumulation, compute_flow_directions, trace_paths)
+from src.analysis.postprocessing import analyze_landslides
+
+def _cone(size=41):
+    """A cone with its peak in the center: every ascent path ends there."""
+    rows, cols = np.mgrid[:size, :size]
+    return -np.hypot(rows - size // 2, cols - size // 2)
+
+def test_chunked_directions_match_single_pass():
+    dtm = np.random.default_rng(0).random((57, 33))
+    full = compute_flow_directions(dtm, chunk_rows=1000)
+    chunked = compute_flow_directions(dtm, chunk_rows=5)
+    np.testing.assert_array_equal(full[0], chunked[0])
+    np.testing.assert_array_equal(full[1], chunked[1])
+
+    # Every descent step must go to a strictly lower neighbour.
+    descent = full[0]
+    rows, cols = np.nonzero(descent != NO_FLOW)
+    d = descent[rows, cols]
+    assert len(rows) > dtm.size // 2
+    assert (dtm[rows + D8_ROW_OFFSETS[d], cols + D8_COL_OFFSETS[d]] < dtm[rows, cols]).all()
+
+def test_batch_ascent_reaches_peak_and_accumulation_counts_cells():
+    dtm = _cone()
+    descent, ascent = compute_flow_directions(dtm)
+    starts = np.argwhere(np.ones_like(dtm, dtype=bool))
+
+    result = trace_paths(ascent, starts[:, 0], starts[:, 1], return_paths=True)
+
+    assert (result['end_rows'] == 20).all() and (result['end_cols'] == 20).all()
+    assert result['path_rows'].shape[1] == len(starts)
+    # Every cell of the cone drains to one of the border cells, none through the peak.
+    accumulation = compute_flow_accumulation(descent)
+    assert accumulation[20, 20] == 1
+    assert accumulation[descent == NO_FLOW].sum() == dtm.size
+
+def test_flow_index_is_cached_on_disk(tmp_path):
+    dtm = _cone()
+    first = FlowIndex.build(dtm, pixel_scale=2.0, cache_dir=str(tmp_path))
+    second = FlowIndex.build(dtm, pixel_scale=2.0, cache_dir=str(tmp_path))
+
+    assert isinstance(second.descent, np.memmap)
+    np.testing.assert_array_equal(first.accumulation, second.accumulation)
+    assert second.trace_ascent([20], [0])['length'][0] == 40.0
+
+def test_analyze_landslides_traces_scarp_with_flow_index():
+    dtm = np.tile(np.arange(30.0)[:, None], (1, 10))
+    mask = np.zeros_like(dtm, dtype=np.uint8)
+    mask[5:15, 4] = 1
+
+    result = analyze_landslides(mask, dtm, pixel_scale=0.5, flow_index=FlowIndex.build(dtm, cache_dir=None))
+
+    assert (result['source_row'][0], result['scarp_row'][0]) == (14, 29)
+    assert result['scarp_elevation'][0] == 29.0
+    assert result['flow_path_length'][0] == 4.5
+
+def test_chunked_accumulation_matches_upslope_counts():
+    """
+    Accumulation over many row chunks equals the number of cells whose descent path passes through each cell.
+    """
+    dtm = np.random.default_rng(1).random((23, 17)) + np.arange(23)[:, None] * 0.3
+    descent, _ = compute_flow_directions(dtm)
+    starts = np.argwhere(np.ones_like(dtm, dtype=bool))
+    paths = trace_paths(descent, starts[:, 0], starts[:, 1], return_paths=True)
+    expected = np.zeros(dtm.shape, dtype=np.int64)
+    for n in range(len(starts)):
+        visited = set(zip(paths['path_rows'][:, n].tolist(), paths['path_cols'][:, n].tolist()))
+        for r, c in visited:
+            expected[r, c] += 1
+
+    for chunk_rows in (1, 4, 100):
+        np.testing.assert_array_equal(compute_flow_accumulation(descent, chunk_rows=chunk_rows), expected)
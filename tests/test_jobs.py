@@ -0,0 +1,62 @@
+import threading
+
+from src.inference.jobs import JobQueue
+
+def test_jobs_run_in_background_and_report_progress():
+    release = threading.Event()
+    calls = []
+
+    def analyse(value, progress):
+        calls.append(value)
+        progress(0.5, "Halfway")
+        release.wait(5)
+        return value * 2
+
+    queue = JobQueue(num_workers=1)
+    job = queue.submit('upload-a', analyse, 21)
+    # The same key while the job is running returns the same job instead of recomputing.
+    assert queue.submit('upload-a', analyse, 21) is job
+    release.set()
+    job.future.result(timeout=5)
+
+    assert job.status == 'done' and job.result == 42 and job.progress == 1.0
+    assert queue.submit('upload-a', analyse, 21) is job
+    assert calls == [21]
+    queue.shutdown()
+
+def test_failed_jobs_are_reported_and_can_be_resubmitted():
+    def failing(progress):
+        raise ValueError("bad image")
+
+    queue = JobQueue(num_workers=1)
+    job = queue.submit('upload-b', failing)
+    job.future.result(timeout=5)
+    assert job.status == 'failed' and isinstance(job.error, ValueError)
+
+    retry = queue.submit('upload-b', lambda progress: 'ok')
+    retry.future.result(timeout=5)
+    assert retry is not job and retry.result == 'ok'
+    queue.shutdown()
+
+def test_finished_results_are_bounded():
+    queue = JobQueue(num_workers=1, max_results=2)
+    for i in range(4):
+        queue.submit(i, lambda progress: None).future.result(timeout=5)
+    queue.submit('last', lambda progress: None).future.result(timeout=5)
+
+    assert queue.get(0) is None and queue.get(1) is None
+    assert queue.stats()['done'] == queue.max_results
+    queue.shutdown()
+
+def test_jobs_publish_partial_results_as_they_finish():
+    def per_file(names, progress):
+        for i, name in enumerate(names):
+            progress((i + 1) / len(names), item=name.upper())
+        return len(names)
+
+    queue = JobQueue(num_workers=1)
+    job = queue.submit('batch', per_file, ['a.tif', 'b.png'])
+    job.future.result(timeout=5)
+
+    assert job.partial == ['A.TIF', 'B.PNG'] and job.result == 2
+    queue.shutdown()
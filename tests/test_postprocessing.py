@@ -0,0 +1,86 @@
+import numpy as np
+from scipy import ndimage
+from src.analysis.postprocessing import (analyze_landslides, estimate_boulder_heights, find_landslide_source,
+                                         measure_shadow_lengths)
+
+def test_analyze_landslides_matches_per_object_source_search():
+    """
+    The vectorized pass must agree with running `find_landslide_source` on each object.
+    """
+    rng = np.random.default_rng(0)
+    dtm = rng.random((120, 150)) * 100
+    mask = ndimage.binary_opening(rng.random((120, 150)) > 0.6)
+    labels, count = ndimage.label(mask, structure=np.ones((3, 3)))
+
+    result = analyze_landslides(mask, dtm, pixel_scale=2.0)
+
+    assert len(result['label']) == count
+    for i, label in enumerate(result['label']):
+        component = labels == label
+        rows, cols = np.nonzero(component)
+        assert (result['source_row'][i], result['source_col'][i]) == find_landslide_source(component, dtm)
+        assert result['area_px'][i] == component.sum()
+        assert result['area_m2'][i] == 4.0 * component.sum()
+        assert result['elevation_drop'][i] == dtm[component].max() - dtm[component].min()
+        assert (result['bbox_min_row'][i], result['bbox_max_row'][i]) == (rows.min(), rows.max())
+        assert (result['bbox_min_col'][i], result['bbox_max_col'][i]) == (cols.min(), cols.max())
+
+def test_analyze_landslides_runout_and_empty_mask():
+    dtm = np.tile(np.arange(10.0)[:, None], (1, 10))
+    mask = np.zeros((10, 10), dtype=np.uint8)
+    mask[2:8, 4] = 1
+
+    result = analyze_landslides(mask, dtm, pixel_scale=0.5)
+    empty = analyze_landslides(np.zeros_like(mask), dtm)
+
+    assert (result['source_row'][0], result['toe_row'][0]) == (7, 2)
+    assert result['runout_length'][0] == 2.5
+    assert len(empty['label']) == 0
+
+def test_analyze_landslides_handles_unsigned_dtms():
+    dtm = np.tile(np.arange(10, dtype=np.uint16)[:, None] * 100, (1, 10))
+    mask = np.zeros((10, 10), dtype=np.uint8)
+    mask[2:8, 4] = 1
+
+    result = analyze_landslides(mask, dtm)
+
+    assert (result['source_row'][0], result['toe_row'][0]) == (7, 2)
+    assert result['elevation_drop'][0] == 500.0
+
+def test_analyze_landslides_skips_nodata_pixels():
+    dtm = np.tile(np.arange(10.0)[:, None], (1, 10))
+    dtm[2, 4] = dtm[7, 4] = np.nan
+    mask = np.zeros((10, 10), dtype=np.uint8)
+    mask[2:8, 4] = 1
+
+    result = analyze_landslides(mask, dtm)
+
+    assert (result['source_row'][0], result['toe_row'][0]) == (6, 3)
+    assert result['elevation_drop'][0] == 3.0
+
+def test_estimate_boulder_heights_measures_shadows_in_batch():
+    image = np.full((200, 200), 0.9, dtype=np.float32)
+    image[20:40, 40:52] = 0.0    # 12 px shadow east of the first box
+    image[100:112, 60:80] = 0.0  # 12 px shadow south of the second box, partly hidden under it
+    boxes = np.array([[20, 20, 40, 40], [60, 80, 80, 104], [150, 150, 170, 170]], dtype=np.float32)
+
+    east = estimate_boulder_heights(boxes[:1], image, sun_azimuth_deg=270, sun_elevation_deg=45, pixel_scale=0.5)
+    south = measure_shadow_lengths(boxes[1:], image, sun_azimuth_deg=0)
+
+    np.testing.assert_allclose(east['shadow_length_px'], [12])
+    np.testing.assert_allclose(east['height_m'], [6.0])
+    np.testing.assert_array_equal(south, [8, 0])
+
+def test_shadow_measurement_normalizes_by_the_data_range():
+    """
+    A 12-bit image stored as uint16 finds the same shadow as its 8-bit version.
+    """
+    image = np.full((100, 100), 200, dtype=np.uint8)
+    image[20:40, 40:52] = 5
+    boxes = np.array([[20, 20, 40, 40]], dtype=np.float32)
+
+    expected = measure_shadow_lengths(boxes, image, sun_azimuth_deg=270)
+    actual = measure_shadow_lengths(boxes, image.astype(np.uint16) * 16, sun_azimuth_deg=270)
+
+    np.testing.assert_array_equal(expected, [12])
+    np.testing.assert_array_equal(actual, expected)
@@ -0,0 +1,58 @@
+import numpy as np
+import pytest
+import pandas as pd
+from PIL import Image
+from src.inference.predict import iter_batches, prefetch_images, run_batch_inference
+
+class FixedDetector:
+    """A detector stub that returns one box per image."""
+    def __init__(self):
+        self.batch_sizes = []
+
+    def predict(self, images, conf=0.25, iou=0.45):
+        self.batch_sizes.append(len(images))
+        return [{'boxes': np.array([[1, 2, 3, 4]], dtype=np.float32),
+                 'scores': np.array([0.5], dtype=np.float32),
+                 'class_ids': np.array([0], dtype=np.int32)} for _ in images]
+
+def test_prefetch_images_preserves_order(tmp_path):
+    """
+    Images decoded in the thread pool must come back in input order.
+    """
+    paths = []
+    for i in range(10):
+        path = tmp_path / f"{i}.png"
+        Image.fromarray(np.full((4, 4), i, dtype=np.uint8)).save(path)
+        paths.append(str(path))
+
+    decoded = list(prefetch_images(paths, num_workers=3, max_pending=2))
+
+    assert [p for p, _ in decoded] == paths
+    assert [int(image[0, 0]) for _, image in decoded] == list(range(10))
+
+def test_iter_batches_yields_fixed_size_batches():
+    assert [len(b) for b in iter_batches(range(7), 3)] == [3, 3, 1]
+
+def test_run_batch_inference_writes_columnar_results(tmp_path):
+    """
+    Every detection ends up in the Parquet results file, and the model sees fixed-size batches.
+    """
+    image_dir = tmp_path / "images"
+    image_dir.mkdir()
+    for i in range(5):
+        Image.fromarray(np.zeros((20, 30, 3), dtype=np.uint8)).save(image_dir / f"{i}.png")
+    detector = FixedDetector()
+    output_path = str(tmp_path / "detections.parquet")
+
+    stats = run_batch_inference(None, str(image_dir), output_path, batch_size=2, detector=detector)
+    results = pd.read_parquet(output_path)
+
+    assert stats == {'images': 5, 'failed': 0, 'detections': 5}
+    assert detector.batch_sizes == [2, 2, 1]
+    assert results['image_width'].tolist() == [30] * 5
+    assert results[['xmin', 'ymin', 'xmax', 'ymax']].iloc[0].tolist() == [1, 2, 3, 4]
+
+def test_run_batch_inference_cache_requires_model_path(tmp_path):
+    with pytest.raises(ValueError, match="model_path"):
+        run_batch_inference(None, str(tmp_path), str(tmp_path / "out.parquet"), detector=FixedDetector(),
+                            cache_dir=str(tmp_path / "cache"))
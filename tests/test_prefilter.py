@@ -0,0 +1,69 @@
+import pytest
+import numpy as np
+from src.inference.prefilter import (TilePrefilter, compute_tile_statistics, evaluate_prefilter,
+                                     label_tiles_from_boxes)
+
+def make_tiles(rng, count, textured):
+    """Flat grey tiles, or flat tiles with a bright boulder and its shadow."""
+    tiles = np.full((count, 32, 32), 120, dtype=np.uint8) + rng.integers(0, 3, (count, 32, 32), dtype=np.uint8)
+    if textured:
+        for tile in tiles:
+            y, x = rng.integers(4, 24, 2)
+            tile[y:y + 4, x:x + 4] = 250
+            tile[y:y + 4, x + 4:x + 8] = 5
+    return tiles
+
+def test_compute_tile_statistics_is_vectorized_over_shapes():
+    tiles = [np.zeros((8, 8), dtype=np.uint8), np.full((4, 6, 3), 255, dtype=np.uint8), np.zeros((8, 8), dtype=np.uint8)]
+    dtms = [np.zeros((8, 8)), np.tile(np.arange(6.0), (4, 1)), np.zeros((8, 8))]
+
+    features = compute_tile_statistics(tiles, dtms)
+
+    assert features.shape == (3, 4)
+    assert features[0, 2] == 1.0 and features[1, 2] == 0.0  # shadow fraction
+    assert np.isclose(features[1, 3], 45.0)  # unit elevation step per pixel
+    assert features[0, 3] == 0.0
+
+def test_calibrated_prefilter_meets_recall_target():
+    """
+    Featureless tiles are skipped while the requested recall of event tiles is kept.
+    """
+    rng = np.random.default_rng(0)
+    tiles = np.concatenate([make_tiles(rng, 200, False), make_tiles(rng, 50, True)])
+    labels = np.array([False] * 200 + [True] * 50)
+    features = compute_tile_statistics(tiles)
+
+    prefilter = TilePrefilter().calibrate(features, labels, target_recall=0.98)
+    report = evaluate_prefilter(prefilter, features, labels)
+    keep = prefilter.select(tiles)
+
+    assert report['recall'] >= 0.98
+    assert report['skip_rate'] > 0.7
+    assert prefilter.skip_rate == report['skip_rate'] and keep.sum() == prefilter.kept
+
+def test_uncalibrated_prefilter_keeps_everything(tmp_path):
+    prefilter = TilePrefilter()
+    path = str(tmp_path / "prefilter.json")
+    prefilter.save(path)
+
+    assert TilePrefilter.load(path).select([np.zeros((8, 8), dtype=np.uint8)]).all()
+
+def test_label_tiles_from_boxes_uses_box_centers():
+    windows = [(0, 0, 10, 10), (0, 10, 10, 10)]
+
+    assert label_tiles_from_boxes(windows, [[8, 2, 14, 4]]).tolist() == [False, True]
+    assert label_tiles_from_boxes(windows, [[1, 1, 3, 3]]).tolist() == [True, False]
+
+def test_tile_statistics_do_not_depend_on_bit_depth():
+    """
+    A 12-bit tile normalized by its scene stretch gives the statistics of the same tile in 8 bits.
+    """
+    tile8 = make_tiles(np.random.default_rng(0), 1, True)[0]
+    tile12 = tile8.astype(np.uint16) * 16
+
+    expected = compute_tile_statistics([tile8])
+    actual = compute_tile_statistics([tile12], input_range=(0, 255 * 16))
+
+    assert np.allclose(actual, expected, atol=1e-6)
+    with pytest.raises(ValueError, match="input_range"):
+        compute_tile_statistics([tile12])
@@ -46,4 +46,101 @@ def test_convert_bbox_to_yolo_format_at_edge():
     assert x_center == pytest.approx(expected_x_center)
     assert y_center == pytest.approx(expected_y_center)
     assert width == pytest.approx(expected_width)
-    assert height == pytest.approx(expected_height) 
\ No newline at end of file
+    assert height == pytest.approx(expected_height) 
+
+def _make_dataset(tmp_path):
+    from PIL import Image
+
+    image_dir = tmp_path / 'images'
+    image_dir.mkdir()
+    Image.new('RGB', (100, 50), 'white').save(image_dir / 'a.jpg', 'jpeg')
+    for name in ('b.png', 'c.png', 'd.png', 'e.png'):
+        Image.new('L', (100, 50), 128).save(image_dir / name)
+    label_csv = tmp_path / 'labels.csv'
+    label_csv.write_text("a.jpg,10,10,30,20,rockfall\na.jpg,50,0,100,50,rockfall\nb.png,0,0,100,50,rockfall\n"
+                         "c.png,0,0,50,50,rockfall\nd.png,0,0,10,10,rockfall\ne.png,0,0,20,20,rockfall\n")
+    return image_dir, label_csv
+
+
+def test_create_yolo_dataset_links_and_converts(tmp_path):
+    """
+    RGB JPEGs are hard-linked, other images are re-encoded, and labels are converted.
+    """
+    from PIL import Image
+    from src.data.prepare_yolo_data import create_yolo_dataset
+
+    image_dir, label_csv = _make_dataset(tmp_path)
+    output_dir = tmp_path / 'yolo'
+    counts = create_yolo_dataset(str(image_dir), str(label_csv), str(output_dir), num_workers=1)
+
+    assert counts['linked'] == 1 and counts['converted'] == 4 and counts['labels_written'] == 5
+    linked = list(output_dir.glob('images/*/a.jpg'))[0]
+    assert linked.stat().st_ino == (image_dir / 'a.jpg').stat().st_ino
+    with Image.open(list(output_dir.glob('images/*/b.jpg'))[0]) as img:
+        assert img.format == 'JPEG' and img.mode == 'RGB'
+    lines = list(output_dir.glob('labels/*/a.txt'))[0].read_text().splitlines()
+    assert [float(v) for v in lines[0].split()] == pytest.approx([0, 0.2, 0.3, 0.2, 0.2])
+    assert len(lines) == 2
+
+
+def test_create_yolo_dataset_is_incremental(tmp_path):
+    """
+    A second run only rewrites the images and labels that changed.
+    """
+    from PIL import Image
+    from src.data.prepare_yolo_data import create_yolo_dataset
+
+    image_dir, label_csv = _make_dataset(tmp_path)
+    output_dir = tmp_path / 'yolo'
+    create_yolo_dataset(str(image_dir), str(label_csv), str(output_dir), num_workers=1)
+
+    counts = create_yolo_dataset(str(image_dir), str(label_csv), str(output_dir), num_workers=1)
+    assert counts['unchanged'] == 5 and counts['converted'] == 0 and counts['labels_written'] == 0
+
+    Image.new('L', (200, 100), 0).save(image_dir / 'b.png')
+    label_csv.write_text(label_csv.read_text().replace('c.png,0,0,50,50', 'c.png,0,0,25,50'))
+    counts = create_yolo_dataset(str(image_dir), str(label_csv), str(output_dir), num_workers=1)
+    assert counts['converted'] == 1 and counts['labels_written'] == 2 and counts['unchanged'] == 3
+    # The new image size is used for its labels.
+    assert list(output_dir.glob('labels/*/b.txt'))[0].read_text().split()[1:] == ['0.25', '0.25', '0.5', '0.5']
+    assert list(output_dir.glob('labels/*/c.txt'))[0].read_text().split()[3] == '0.25'
+
+
+def test_splits_are_stable_and_moved_outputs_are_not_rewritten(tmp_path):
+    """
+    Adding an image leaves the others in place; a new train_size moves outputs instead of re-encoding them.
+    """
+    from PIL import Image
+    from src.data.prepare_yolo_data import create_yolo_dataset
+
+    image_dir, label_csv = _make_dataset(tmp_path)
+    output_dir = tmp_path / 'yolo'
+    create_yolo_dataset(str(image_dir), str(label_csv), str(output_dir), num_workers=1)
+    splits = {path.name: path.parent.name for path in output_dir.glob('images/*/*.jpg')}
+
+    Image.new('L', (100, 50), 64).save(image_dir / 'f.png')
+    label_csv.write_text(label_csv.read_text() + "f.png,0,0,10,10,rockfall\n")
+    counts = create_yolo_dataset(str(image_dir), str(label_csv), str(output_dir), num_workers=1)
+    assert counts['converted'] == 1 and counts['unchanged'] == 5 and counts['moved'] == 0
+    assert splits == {path.name: path.parent.name for path in output_dir.glob('images/*/*.jpg') if path.name != 'f.jpg'}
+
+    inode = list(output_dir.glob('images/*/b.jpg'))[0].stat().st_ino
+    counts = create_yolo_dataset(str(image_dir), str(label_csv), str(output_dir), train_size=0.0, num_workers=1)
+    assert counts['converted'] == 0 and counts['labels_written'] == 0 and counts['unchanged'] == 6
+    assert not list(output_dir.glob('*/train/*'))
+    assert (output_dir / 'images/val/b.jpg').stat().st_ino == inode
+    assert len(list(output_dir.glob('labels/val/*.txt'))) == 6
+
+
+def test_unreadable_images_lose_their_old_outputs(tmp_path):
+    from src.data.prepare_yolo_data import create_yolo_dataset
+
+    image_dir, label_csv = _make_dataset(tmp_path)
+    output_dir = tmp_path / 'yolo'
+    create_yolo_dataset(str(image_dir), str(label_csv), str(output_dir), num_workers=1)
+
+    (image_dir / 'c.png').write_bytes(b'not an image')
+    create_yolo_dataset(str(image_dir), str(label_csv), str(output_dir), num_workers=1)
+
+    assert not list(output_dir.glob('*/*/c.*'))
+    assert len(list(output_dir.glob('images/*/*.jpg'))) == 4
@@ -0,0 +1,45 @@
+import torch
+from torch.utils.data import Dataset
+from src.models.unet import UNet, UNET_VARIANTS
+from src.models.quantization import fuse_unet, make_calibration_loader, quantize_unet
+
+class RandomTiles(Dataset):
+    """A stand-in for LunarDataset with random tiles."""
+    def __len__(self):
+        return 8
+
+    def __getitem__(self, idx):
+        generator = torch.Generator().manual_seed(idx)
+        return {'data': torch.rand(3, 64, 64, generator=generator),
+                'mask': torch.randint(0, 3, (64, 64), generator=generator)}
+
+def test_fuse_unet_preserves_outputs():
+    """
+    Folding BatchNorm into the convolutions must not change the logits.
+    """
+    for variant in ('tiny', 'tiny-separable'):
+        model = UNet(n_channels=3, n_classes=3, **UNET_VARIANTS[variant]).eval()
+        inputs = torch.rand(1, 3, 64, 64)
+
+        with torch.no_grad():
+            expected = model(inputs)
+            fused = fuse_unet(model)(inputs)
+
+        assert torch.allclose(expected, fused, atol=1e-5)
+
+def test_quantize_unet_returns_float_logits():
+    """
+    The int8 model should keep float inputs/outputs and stay close to the float model.
+    """
+    model = UNet(n_channels=3, n_classes=3, bilinear=False, **UNET_VARIANTS['tiny']).eval()
+    loader = make_calibration_loader(RandomTiles(), num_samples=4, batch_size=2)
+    quantized = quantize_unet(model, loader)
+    inputs = torch.rand(1, 3, 64, 64)
+
+    with torch.no_grad():
+        expected = model(inputs)
+        output = quantized(inputs)
+
+    assert output.dtype == torch.float32
+    assert output.shape == expected.shape
+    assert (output - expected).abs().max() < 0.1 * expected.abs().max() + 1e-3
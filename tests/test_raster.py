@@ -0,0 +1,69 @@
+import io
+
+import numpy as np
+import pytest
+from PIL import Image
+
+from src.inference.backends import prepare_image
+from src.inference.predict import draw_detections
+from src.inference.raster import decode_image_bytes
+
+def test_decode_keeps_16_bit_pngs():
+    image = (np.arange(32 * 48) * 40).reshape(32, 48).astype(np.uint16)
+    buffer = io.BytesIO()
+    Image.fromarray(image).save(buffer, format='PNG')
+
+    decoded, transform, crs = decode_image_bytes(memoryview(buffer.getvalue()), 'scene.png')
+
+    assert decoded.dtype == np.uint16 and np.array_equal(decoded, image)
+    assert transform is None and crs is None
+
+def test_decode_keeps_geotiff_bands_and_georeferencing():
+    rasterio = pytest.importorskip("rasterio")
+    from rasterio.io import MemoryFile
+    from rasterio.transform import from_origin
+
+    image = np.random.default_rng(0).integers(0, 4096, (2, 20, 30)).astype(np.uint16)
+    with MemoryFile() as memfile:
+        with memfile.open(driver='GTiff', height=20, width=30, count=2, dtype='uint16',
+                          crs='+proj=eqc +R=1737400 +units=m +no_defs', transform=from_origin(100, 200, 0.5, 0.5)) as dst:
+            dst.write(image)
+        data = memfile.read()
+
+    # No file name: TIFFs are recognised by their header.
+    decoded, transform, crs = decode_image_bytes(data)
+
+    assert decoded.shape == (20, 30, 2) and decoded.dtype == np.uint16
+    assert np.array_equal(decoded.transpose(2, 0, 1), image)
+    assert transform.a == 0.5 and transform.c == 100 and crs is not None
+
+def _encode(img, format='PNG'):
+    buffer = io.BytesIO()
+    img.save(buffer, format=format)
+    return buffer.getvalue()
+
+def test_decode_converts_palette_alpha_and_cmyk_modes():
+    grey = (np.arange(16 * 24) % 200 + 40).reshape(16, 24).astype(np.uint8)
+    rgb = np.stack([grey, 255 - grey, grey // 2], axis=2)
+    palette = Image.fromarray(rgb).quantize(16)
+
+    decoded_palette = decode_image_bytes(_encode(palette))[0]
+    decoded_la = decode_image_bytes(_encode(Image.fromarray(grey).convert('LA')))[0]
+    decoded_cmyk = decode_image_bytes(_encode(Image.fromarray(rgb).convert('CMYK'), 'JPEG'))[0]
+
+    assert np.array_equal(decoded_palette, np.asarray(palette.convert('RGB')))
+    assert decoded_palette.max() > 15
+    assert decoded_la.shape == grey.shape and np.array_equal(decoded_la, grey)
+    assert decoded_cmyk.shape == rgb.shape
+    assert decode_image_bytes(_encode(Image.fromarray(grey)))[0].dtype == np.uint8
+
+@pytest.mark.parametrize('channels', [1, 2, 4])
+def test_prepared_images_can_be_drawn_on(channels):
+    image = np.random.default_rng(0).integers(0, 4096, (40, 50, channels)).astype(np.uint16)
+    detections = {'boxes': np.array([[5, 5, 20, 20]], dtype=np.float32), 'scores': np.array([0.9], dtype=np.float32),
+                  'class_ids': np.zeros(1, dtype=np.int32)}
+
+    prepared = prepare_image(image)
+
+    assert prepared.shape == (40, 50, 3) and prepared.dtype == np.uint8
+    assert draw_detections(prepared, detections).shape == (40, 50, 3)
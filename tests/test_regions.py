@@ -0,0 +1,40 @@
+import numpy as np
+import pytest
+from scipy import ndimage
+from src.analysis.regions import measure_regions
+
+regionprops = pytest.importorskip("skimage.measure").regionprops
+
+@pytest.mark.parametrize("connectivity", [1, 2])
+def test_banded_regions_match_regionprops(connectivity):
+    rng = np.random.default_rng(0)
+    mask = ndimage.binary_opening(rng.random((300, 200)) > 0.55)
+    dtm = rng.random((300, 200))
+    dtm[5, 5] = np.nan
+    labels, count = ndimage.label(mask, structure=ndimage.generate_binary_structure(2, connectivity))
+
+    result = measure_regions(mask, {'dtm': dtm}, pixel_scale=0.5, connectivity=connectivity, band_rows=7)
+
+    assert len(result['label']) == count
+    for i, props in enumerate(regionprops(labels)):
+        assert result['area_px'][i] == props.area
+        assert result['area_m2'][i] == 0.25 * props.area
+        np.testing.assert_allclose((result['centroid_row'][i], result['centroid_col'][i]), props.centroid)
+        assert (result['bbox_min_row'][i], result['bbox_min_col'][i],
+                result['bbox_max_row'][i] + 1, result['bbox_max_col'][i] + 1) == props.bbox
+        np.testing.assert_allclose(result['orientation'][i], props.orientation, atol=1e-6)
+        np.testing.assert_allclose(result['major_axis_length'][i], props.axis_major_length, atol=1e-6)
+        np.testing.assert_allclose(result['mean_dtm'][i], np.nanmean(dtm[labels == props.label]))
+
+def test_region_spanning_every_band_is_one_object():
+    mask = np.zeros((50, 10), dtype=bool)
+    mask[:, 4] = True
+    mask[10:12, 0:10] = True
+
+    result = measure_regions(mask, {'slope': np.full(mask.shape, 30.0)}, band_rows=3)
+    empty = measure_regions(np.zeros((5, 5)), {'slope': np.zeros((5, 5))})
+
+    assert len(result['label']) == 1 and result['area_px'][0] == mask.sum()
+    assert (result['bbox_min_row'][0], result['bbox_max_row'][0]) == (0, 49)
+    assert result['mean_slope'][0] == 30.0 and result['std_slope'][0] == 0.0
+    assert len(empty['label']) == 0 and 'mean_slope' in empty
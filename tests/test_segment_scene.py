@@ -0,0 +1,46 @@
+import numpy as np
+import pytest
+from src.inference.segment_scene import blending_window, load_class_mask, segment_scene
+
+rasterio = pytest.importorskip("rasterio")
+
+class ChannelSegmenter:
+    """A segmenter stub whose logits are the input channels themselves."""
+    def __init__(self):
+        self.batch_shapes = []
+
+    def predict(self, batch):
+        self.batch_shapes.append(batch.shape)
+        return batch * 10
+
+def test_blending_window_is_positive_and_peaks_in_center():
+    weights = blending_window(8)
+
+    assert weights.min() > 0
+    assert weights[3:5, 3:5].min() == weights.max()
+
+def test_segment_scene_matches_direct_prediction(tmp_path):
+    """
+    Blended sliding-window output must equal a single whole-scene prediction.
+    """
+    rng = np.random.default_rng(0)
+    scene = rng.random((3, 150, 200)).astype(np.float32)
+    transform = rasterio.transform.from_origin(1000, 2000, 5, 5)
+    scene_path = str(tmp_path / "fused.tif")
+    with rasterio.open(scene_path, 'w', driver='GTiff', height=150, width=200, count=3,
+                       dtype='float32', transform=transform) as dst:
+        dst.write(scene)
+    segmenter = ChannelSegmenter()
+    output_path = str(tmp_path / "classes.tif")
+
+    counts = segment_scene(segmenter, scene_path, output_path, probabilities_path=str(tmp_path / "probs.tif"),
+                           tile_size=64, overlap=16, batch_size=3)
+
+    with rasterio.open(output_path) as src:
+        classes = src.read(1)
+        assert src.transform == transform
+        assert src.profile['tiled']
+    assert np.array_equal(classes, scene.argmax(axis=0))
+    assert counts.sum() == 150 * 200
+    assert all(shape[1:] == (3, 64, 64) for shape in segmenter.batch_shapes)
+    assert np.array_equal(load_class_mask(output_path, class_id=1), (scene.argmax(axis=0) == 1).astype(np.uint8))
@@ -0,0 +1,85 @@
+import threading
+import numpy as np
+from src.inference.server import DynamicBatcher, InferenceClient, InferenceService, create_server
+
+class CountingDetector:
+    """A detector stub that records its batch sizes and boxes the whole image."""
+    def __init__(self):
+        self.batch_sizes = []
+
+    def predict(self, images, conf=0.25, iou=0.45):
+        self.batch_sizes.append(len(images))
+        return [{'boxes': np.array([[0, 0, image.shape[1], image.shape[0]]], dtype=np.float32),
+                 'scores': np.array([conf], dtype=np.float32),
+                 'class_ids': np.array([0], dtype=np.int32)} for image in images]
+
+class ArgmaxSegmenter:
+    def predict(self, batch):
+        return batch
+
+def test_dynamic_batcher_coalesces_concurrent_requests():
+    """
+    Requests submitted together are served in a few batches, each with its own result.
+    """
+    calls = []
+    batcher = DynamicBatcher(lambda items: calls.append(len(items)) or [i * 2 for i in items],
+                             max_batch_size=8, max_latency_ms=200)
+    futures = [batcher.submit(i) for i in range(20)]
+
+    results = [f.result(timeout=5) for f in futures]
+    metrics = batcher.metrics()
+    batcher.stop()
+
+    assert results == [i * 2 for i in range(20)]
+    assert max(calls) == 8 and sum(calls) == 20
+    assert metrics['requests'] == 20 and metrics['queue_depth'] == 0
+
+def test_dynamic_batcher_propagates_errors():
+    def failing(items):
+        raise ValueError("bad batch")
+
+    batcher = DynamicBatcher(failing, max_latency_ms=1)
+    future = batcher.submit(1)
+
+    try:
+        future.result(timeout=5)
+        raised = False
+    except ValueError:
+        raised = True
+    batcher.stop()
+
+    assert raised
+    assert batcher.metrics()['errors'] == 1
+
+def test_server_round_trip_offline():
+    """
+    The HTTP endpoints serve detections, masks and metrics on a local port.
+    """
+    detector = CountingDetector()
+    service = InferenceService(detector, ArgmaxSegmenter(), max_batch_size=4, max_latency_ms=50)
+    server = create_server(service, port=0)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    client = InferenceClient(f"http://127.0.0.1:{server.server_address[1]}")
+    try:
+        outputs = [None] * 6
+        def request(i):
+            outputs[i] = client.detect(np.zeros((10 + i, 20, 3), dtype=np.uint16))
+        threads = [threading.Thread(target=request, args=(i,)) for i in range(6)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        window = np.zeros((3, 8, 8), dtype=np.float32)
+        window[2] = 1
+        mask = client.segment(window)
+        metrics = client.metrics()
+    finally:
+        server.shutdown()
+        server.server_close()
+        service.stop()
+
+    assert [o['boxes'][0, 3] for o in outputs] == [10 + i for i in range(6)]
+    assert sum(detector.batch_sizes) == 6 and max(detector.batch_sizes) > 1
+    assert mask.dtype == np.uint8 and (mask == 2).all()
+    assert metrics['detect']['requests'] == 6
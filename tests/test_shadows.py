@@ -0,0 +1,66 @@
+import numpy as np
+from src.analysis.shadows import compute_cast_shadows, compute_hillshade, simulate_illumination
+
+def _wall():
+    dtm = np.zeros((20, 40))
+    dtm[:, 10:13] = 9.5
+    return dtm
+
+def test_wall_casts_shadow_of_expected_length():
+    # Sun in the west at 45 degrees: a 9.5 m wall shades the next 9 cells to the east.
+    shadow = compute_cast_shadows(_wall(), sun_azimuth_deg=270, sun_elevation_deg=45, chunk_rows=3)
+
+    np.testing.assert_array_equal(np.flatnonzero(shadow[5]), np.arange(13, 22))
+    assert not compute_cast_shadows(_wall(), sun_azimuth_deg=90, sun_elevation_deg=45)[:, 13:].any()
+
+def test_hillshade_of_flat_and_facing_slopes():
+    flat = compute_hillshade(np.zeros((8, 8)), 0, 30)
+    np.testing.assert_allclose(flat, 0.5, atol=1e-6)
+
+    # A slope rising to the east faces west; the western sun lights it better than flat ground.
+    ramp = np.tile(np.arange(8.0), (8, 1))
+    assert compute_hillshade(ramp, 270, 30, chunk_rows=3)[4, 4] > 0.5 > compute_hillshade(ramp, 90, 30)[4, 4]
+
+def test_simulate_illumination_is_cached_per_sun_geometry(tmp_path):
+    first = simulate_illumination(_wall(), 270, 45, cache_dir=str(tmp_path))
+    again = simulate_illumination(_wall(), 270, 45, cache_dir=str(tmp_path))
+    simulate_illumination(_wall(), 270, 30, cache_dir=str(tmp_path))
+
+    assert isinstance(again['cast_shadow'], np.memmap)
+    np.testing.assert_array_equal(first['illumination'], again['illumination'])
+    assert (np.asarray(again['illumination'])[again['cast_shadow']] == 0).all()
+    assert len(list(tmp_path.iterdir())) == 2
+
+def _ray_cast_shadows(dtm, sun_azimuth_deg, sun_elevation_deg):
+    """Reference: walks from every cell towards the sun, one nearest cell per row or column."""
+    from src.analysis.postprocessing import shadow_direction
+
+    dx, dy = shadow_direction(sun_azimuth_deg)
+    major = max(abs(dx), abs(dy))
+    step_x, step_y = -dx / major, -dy / major
+    drop = np.hypot(step_x, step_y) * np.tan(np.deg2rad(sun_elevation_deg))
+    height, width = dtm.shape
+    shadow = np.zeros(dtm.shape, dtype=bool)
+    for r in range(height):
+        for c in range(width):
+            k = 1
+            while True:
+                rr, cc = int(np.floor(r + k * step_y + 0.5)), int(np.floor(c + k * step_x + 0.5))
+                if not (0 <= rr < height and 0 <= cc < width) or shadow[r, c]:
+                    break
+                shadow[r, c] = dtm[rr, cc] - k * drop > dtm[r, c]
+                k += 1
+    return shadow
+
+def test_cast_shadows_match_ray_casting_at_oblique_azimuths():
+    rng = np.random.default_rng(0)
+    rows, cols = np.mgrid[:60, :60]
+    dtm = np.zeros((60, 60))
+    for _ in range(6):
+        r, c, sigma, peak = rng.uniform(0, 60), rng.uniform(0, 60), rng.uniform(2, 5), rng.uniform(3, 10)
+        dtm += peak * np.exp(-((rows - r) ** 2 + (cols - c) ** 2) / (2 * sigma ** 2))
+
+    for azimuth in (110, 200, 290):
+        expected = _ray_cast_shadows(dtm, azimuth, 20)
+        assert expected.sum() > 300
+        np.testing.assert_array_equal(compute_cast_shadows(dtm, azimuth, 20, chunk_rows=7), expected)
@@ -0,0 +1,123 @@
+import cv2
+import numpy as np
+from skimage.metrics import structural_similarity as ssim
+from src.analysis.temporal_analysis import (ReferenceFeatures, compute_change_mask, detect_changes_against_reference,
+                                           detect_temporal_changes, otsu_threshold_from_histogram)
+from src.inference.raster import SceneReader
+
+def _pair():
+    rng = np.random.default_rng(0)
+    before = cv2.GaussianBlur((rng.random((300, 257)) * 255).astype(np.uint8), (7, 7), 2)
+    after = before.copy()
+    cv2.rectangle(after, (50, 60), (150, 160), 200, -1)
+    return before, after
+
+def test_banded_change_mask_matches_full_image_ssim():
+    before, after = _pair()
+    score, ssim_map = ssim(before, after, full=True)
+    diff = (np.clip(ssim_map, 0, 1) * 255).astype(np.uint8)
+    threshold, expected = cv2.threshold(diff, 0, 255, cv2.THRESH_BINARY_INV | cv2.THRESH_OTSU)
+    expected = cv2.morphologyEx(expected, cv2.MORPH_OPEN, np.ones((5, 5), np.uint8))
+
+    mask, mean_ssim = compute_change_mask(SceneReader(before), SceneReader(after), band_rows=41, num_threads=3)
+
+    assert otsu_threshold_from_histogram(np.bincount(diff.ravel(), minlength=256)) == threshold
+    np.testing.assert_array_equal(mask, expected)
+    assert abs(mean_ssim - score) < 1e-5
+
+def test_detect_temporal_changes_writes_mask_to_disk(tmp_path):
+    before, after = _pair()
+    np.save(tmp_path / 'before.npy', before)
+    np.save(tmp_path / 'after.npy', after)
+
+    mask = detect_temporal_changes(str(tmp_path / 'before.npy'), str(tmp_path / 'after.npy'),
+                                   output_path=str(tmp_path / 'mask.npy'), band_rows=64)
+
+    np.testing.assert_array_equal(np.load(tmp_path / 'mask.npy'), mask)
+    assert mask[100:150, 60:140].mean() > mask[200:, 180:].mean()
+
+def test_pairs_of_different_sizes_are_coregistered(tmp_path):
+    rng = np.random.default_rng(3)
+    scene = cv2.GaussianBlur((rng.random((700, 700)) * 255).astype(np.uint8), (0, 0), 2)
+    before, after = scene[20:620, 10:660].copy(), scene[40:560, 30:590].copy()
+    cv2.rectangle(after, (100, 100), (200, 180), 255, -1)
+    cv2.imwrite(str(tmp_path / 'before.png'), before)
+    cv2.imwrite(str(tmp_path / 'after.png'), after)
+
+    mask = detect_temporal_changes(str(tmp_path / 'before.png'), str(tmp_path / 'after.png'),
+                                   coregistration_cache_dir=str(tmp_path / 'cache'))
+
+    assert mask.shape == after.shape
+    assert mask[110:170, 110:190].mean() > 200
+    assert mask[300:, 300:].mean() < 5
+
+def test_reference_features_give_identical_masks_and_are_cached(tmp_path):
+    before, after = _pair()
+    expected, expected_ssim = compute_change_mask(SceneReader(before), SceneReader(after), band_rows=50)
+
+    features = ReferenceFeatures.build(before, cache_dir=str(tmp_path / 'reference'), band_rows=50)
+    reloaded = ReferenceFeatures.build(before, cache_dir=str(tmp_path / 'reference'))
+    mask, mean_ssim = detect_changes_against_reference(reloaded, after, band_rows=50)
+
+    assert isinstance(reloaded.mean, np.memmap) and reloaded.key == features.key
+    assert len(list((tmp_path / 'reference').iterdir())) == 1
+    np.testing.assert_array_equal(mask, expected)
+    assert abs(mean_ssim - expected_ssim) < 1e-6
+
+def _write_geotiff(path, array):
+    import rasterio
+
+    profile = {'driver': 'GTiff', 'height': array.shape[0], 'width': array.shape[1], 'count': 1,
+               'dtype': array.dtype.name, 'tiled': True, 'blockxsize': 64, 'blockysize': 64,
+               'compress': 'deflate'}
+    with rasterio.open(path, 'w', **profile) as dst:
+        dst.write(array, 1)
+
+def test_compressed_geotiffs_are_read_safely_from_several_threads(tmp_path):
+    before, after = _pair()
+    _write_geotiff(tmp_path / 'before.tif', before)
+    _write_geotiff(tmp_path / 'after.tif', after)
+    expected, _ = compute_change_mask(SceneReader(before), SceneReader(after), band_rows=16, num_threads=1)
+
+    for _ in range(3):
+        mask = detect_temporal_changes(str(tmp_path / 'before.tif'), str(tmp_path / 'after.tif'),
+                                       output_path=str(tmp_path / 'mask.npy'), band_rows=16, num_threads=8)
+        np.testing.assert_array_equal(mask, expected)
+    assert isinstance(mask, np.memmap)
+
+def test_floating_point_scenes_get_a_data_range(tmp_path):
+    before, after = _pair()
+    _write_geotiff(tmp_path / 'before.tif', before.astype(np.float32) / 255)
+    _write_geotiff(tmp_path / 'after.tif', after.astype(np.float32) / 255)
+
+    mask = detect_temporal_changes(str(tmp_path / 'before.tif'), str(tmp_path / 'after.tif'), band_rows=64)
+
+    assert mask is not None
+    assert mask[100:150, 60:140].mean() > mask[200:, 180:].mean()
+
+def test_float_baselines_work_in_monitoring_mode(tmp_path):
+    before, after = _pair()
+    before, after = before.astype(np.float32) / 255, after.astype(np.float32) / 255
+    expected, expected_ssim = compute_change_mask(SceneReader(before), SceneReader(after), data_range=1.0, band_rows=50)
+
+    features = ReferenceFeatures.build(before, cache_dir=str(tmp_path / 'reference'), band_rows=50)
+    reloaded = ReferenceFeatures.build(before, cache_dir=str(tmp_path / 'reference'))
+    mask, mean_ssim = detect_changes_against_reference(reloaded, after, band_rows=50)
+
+    assert features.value_range == reloaded.value_range == (float(before.min()), float(before.max()))
+    assert np.mean(mask != expected) < 0.01
+    assert abs(mean_ssim - expected_ssim) < 0.05
+
+def test_float_baselines_are_coregistered_without_rounding(tmp_path):
+    rng = np.random.default_rng(3)
+    scene = cv2.GaussianBlur(rng.random((700, 700)).astype(np.float32), (0, 0), 2)
+    before, after = scene[40:560, 30:590].copy(), scene[20:620, 10:660].copy()
+    cv2.rectangle(after, (120, 120), (220, 200), 1.0, -1)
+
+    reference = ReferenceFeatures.build(before, cache_dir=str(tmp_path / 'reference'))
+    mask, _ = detect_changes_against_reference(reference, after,
+                                               coregistration_cache_dir=str(tmp_path / 'coregistration'))
+
+    assert mask.shape == before.shape
+    assert mask[110:170, 110:190].mean() > 200
+    assert mask[300:, 300:].mean() < 5
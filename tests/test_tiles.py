@@ -0,0 +1,87 @@
+import io
+import json
+import threading
+import urllib.request
+
+import numpy as np
+import pytest
+from PIL import Image
+
+from src.inference.raster import SceneReader
+from src.inference.tiles import MAX_TILE_BOXES, TILE_SIZE, TiledScene, create_tile_server
+
+def _scene():
+    scene = np.zeros((1000, 600), dtype=np.uint16)
+    scene[:, 300:] = 4000
+    mask = np.zeros(scene.shape, dtype=np.uint8)
+    mask[100:200, 100:200] = 1
+    detections = {'boxes': np.array([[10, 10, 30, 30], [500, 900, 520, 950]], dtype=np.float32),
+                  'scores': np.array([0.9, 0.8], dtype=np.float32), 'class_ids': np.zeros(2, dtype=np.int32)}
+    return TiledScene(scene, mask=mask, detections=detections, cache_tiles=4)
+
+def _decode(png):
+    return np.array(Image.open(io.BytesIO(png)))
+
+def test_read_resampled_samples_arrays_to_the_requested_shape():
+    array = np.arange(100 * 80).reshape(100, 80)
+    sampled = SceneReader(array).read_resampled(0, 0, 100, 80, 10, 8)
+    assert sampled.shape == (10, 8)
+    assert sampled[0, 0] == array[5, 5] and sampled[-1, -1] == array[95, 75]
+
+def test_tiles_cover_the_pyramid_with_a_shared_stretch():
+    scene = _scene()
+    assert scene.max_zoom == 2
+
+    overview = _decode(scene.tile('image', 0, 0, 0))
+    assert overview.shape == (TILE_SIZE, TILE_SIZE, 4)
+    # 1000 rows fit in 250 px at zoom 0; the rest of the tile is transparent.
+    assert overview[249, 0, 3] == 255 and overview[250, 0, 3] == 0
+    assert overview[0, 10, 0] == 0 and overview[0, 140, 0] == 255
+
+    full = _decode(scene.tile('image', 2, 1, 0))
+    assert full[0, 43, 0] == 0 and full[0, 44, 0] == 255
+
+    mask = _decode(scene.tile('mask', 2, 0, 0))
+    assert mask[150, 150, 3] > 0 and mask[50, 50, 3] == 0
+    with pytest.raises(KeyError):
+        scene.tile('image', 2, 5, 0)
+
+def test_detections_and_cache_are_per_viewport():
+    scene = _scene()
+    assert scene.detections_in(0, 0, 100, 100).tolist() == [0]
+    assert scene.detections_in(920, 490, 1000, 600).tolist() == [1]
+
+    boxes = _decode(scene.tile('detections', 2, 0, 0))
+    assert boxes[10, 20, 3] == 255 and boxes[200, 200, 3] == 0
+    scene.tile('detections', 2, 0, 0)
+    assert scene.stats == {'hits': 1, 'misses': 1}
+
+def test_tile_server_serves_tiles_and_viewport_detections():
+    server = create_tile_server({'demo': _scene()}, port=0)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    url = f"http://127.0.0.1:{server.server_address[1]}"
+    try:
+        info = json.loads(urllib.request.urlopen(f"{url}/scenes/demo").read())
+        png = urllib.request.urlopen(f"{url}/tiles/demo/image/1/0/0.png").read()
+        viewport = json.loads(urllib.request.urlopen(f"{url}/detections/demo?bbox=0,0,100,100").read())
+    finally:
+        server.shutdown()
+        server.server_close()
+
+    assert info['layers'] == ['image', 'mask', 'detections'] and info['max_zoom'] == 2
+    assert _decode(png).shape == (TILE_SIZE, TILE_SIZE, 4)
+    assert viewport['boxes'] == [[10.0, 10.0, 30.0, 30.0]]
+
+def test_dense_detections_are_drawn_as_density():
+    rng = np.random.default_rng(0)
+    corners = rng.uniform(0, 400, (MAX_TILE_BOXES + 1, 2)).astype(np.float32)
+    boxes = np.concatenate([corners, corners + 4], axis=1)
+    boxes = boxes[np.argsort(boxes[:, 1])]
+    detections = {'boxes': boxes, 'scores': np.ones(len(boxes), np.float32), 'class_ids': np.zeros(len(boxes), np.int32)}
+    scene = TiledScene(np.zeros((1000, 600), dtype=np.uint8), detections=detections)
+
+    zoomed_out = _decode(scene.tile('detections', 0, 0, 0))
+    # Every box center is one shaded pixel at 1000 / 256 scene pixels per tile pixel.
+    assert 0 < np.count_nonzero(zoomed_out[..., 3]) <= len(boxes)
+    assert not zoomed_out[120:, :, 3].any()
+    assert np.count_nonzero(_decode(scene.tile('detections', 2, 0, 0))[..., 3]) > 0
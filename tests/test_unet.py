@@ -0,0 +1,27 @@
+import pytest
+import torch
+from src.models.unet import UNet, UNET_VARIANTS
+
+def test_classic_unet_matches_original_architecture():
+    """
+    The default configuration must stay compatible with existing checkpoints.
+    """
+    model = UNet(n_channels=3, n_classes=3)
+    num_params = sum(p.numel() for p in model.parameters())
+
+    assert num_params == 17267523
+    assert 'down4.maxpool_conv.1.double_conv.0.weight' in model.state_dict()
+
+@pytest.mark.parametrize("variant", sorted(UNET_VARIANTS))
+@pytest.mark.parametrize("bilinear", [True, False])
+def test_unet_variants_preserve_output_shape(variant, bilinear):
+    """
+    Every preset should produce a logit map with the input's spatial size.
+    """
+    model = UNet(n_channels=3, n_classes=3, bilinear=bilinear, **UNET_VARIANTS[variant]).eval()
+
+    with torch.no_grad():
+        output = model(torch.randn(2, 3, 64, 96))
+
+    assert output.shape == (2, 3, 64, 96)
+    assert UNet(**model.get_config()).state_dict().keys() == model.state_dict().keys()
@@ -0,0 +1,83 @@
+import json
+
+import numpy as np
+import pyarrow as pa
+import pyarrow.parquet as pq
+import pytest
+
+rasterio = pytest.importorskip("rasterio")
+shapely = pytest.importorskip("shapely")
+from rasterio.transform import from_origin
+from scipy import ndimage
+
+from src.inference.vector_export import export_detections, export_mask_polygons, iter_mask_polygons
+
+MOON_EQC = '+proj=eqc +R=1737400 +units=m +no_defs'
+
+def _write_raster(path, pixels):
+    profile = {'driver': 'GTiff', 'height': pixels.shape[0], 'width': pixels.shape[1], 'count': 1,
+               'dtype': 'uint8', 'crs': MOON_EQC, 'transform': from_origin(1000.0, 2000.0, 10.0, 10.0)}
+    with rasterio.open(path, 'w', **profile) as dst:
+        dst.write(pixels, 1)
+    return str(path)
+
+def test_banded_vectorization_matches_whole_mask_labelling():
+    rng = np.random.default_rng(0)
+    mask = ndimage.binary_opening(rng.random((120, 90)) > 0.45).astype(np.uint8)
+    # A U shape whose arms only join two bands further down.
+    mask[:5] = 0
+    mask[5:60, 10:13] = mask[5:60, 20:23] = mask[57:60, 10:23] = 1
+
+    polygons = np.concatenate(list(iter_mask_polygons(mask, band_rows=16)))
+    labels, count = ndimage.label(mask)
+
+    assert len(polygons) == count
+    assert sorted(np.rint(shapely.area(polygons)).astype(int)) == sorted(np.bincount(labels.ravel())[1:])
+    assert all(polygon.geom_type == 'Polygon' for polygon in polygons)
+
+def test_mask_export_writes_geoparquet_with_lunar_crs(tmp_path):
+    mask = np.zeros((64, 64), dtype=np.uint8)
+    mask[10:20, 10:30] = 1
+    mask[40:60, 40:50] = 1
+    output = tmp_path / 'landslides.parquet'
+
+    assert export_mask_polygons(_write_raster(tmp_path / 'mask.tif', mask), str(output), band_rows=15) == 2
+
+    table = pq.read_table(output)
+    geo = json.loads(table.schema.metadata[b'geo'])
+    assert geo['columns']['geometry']['crs']['name'].startswith('Moon (2015)')
+    assert sorted(table['area_m2'].to_pylist()) == [20000.0, 20000.0]
+    bounds = shapely.bounds(shapely.from_wkb(table['geometry'].to_numpy(zero_copy_only=False)))
+    # Geographic degrees on the lunar sphere, not projected meters.
+    assert np.all(np.abs(bounds) < 1.0)
+
+def test_mask_areas_of_geographic_rasters_are_in_square_meters(tmp_path):
+    # 10 m pixels at the equator, expressed in degrees.
+    deg = 10.0 / np.radians(1737400.0)
+    mask = np.zeros((64, 64), dtype=np.uint8)
+    mask[10:20, 10:30] = 1
+    profile = {'driver': 'GTiff', 'height': 64, 'width': 64, 'count': 1, 'dtype': 'uint8',
+               'crs': 'IAU_2015:30100', 'transform': from_origin(0.0, 32 * deg, deg, deg)}
+    with rasterio.open(tmp_path / 'mask.tif', 'w', **profile) as dst:
+        dst.write(mask, 1)
+
+    export_mask_polygons(str(tmp_path / 'mask.tif'), str(tmp_path / 'landslides.parquet'))
+
+    assert pq.read_table(tmp_path / 'landslides.parquet')['area_m2'].to_pylist() == pytest.approx([20000.0], rel=1e-3)
+
+def test_detections_export_partitions_by_scene_and_writes_geopackage(tmp_path):
+    scene = _write_raster(tmp_path / 'scene.tif', np.zeros((100, 100), dtype=np.uint8))
+    results = tmp_path / 'detections.parquet'
+    pq.write_table(pa.table({
+        'image_path': [scene, scene, str(tmp_path / 'plain.png')],
+        'xmin': [0.0, 50.0, 0.0], 'ymin': [0.0, 50.0, 0.0], 'xmax': [10.0, 60.0, 5.0], 'ymax': [10.0, 60.0, 5.0],
+        'score': [0.9, 0.8, 0.7], 'class_id': [0, 0, 0],
+    }), results)
+
+    assert export_detections(str(results), str(tmp_path / 'export')) == 2
+    assert pq.read_table(tmp_path / 'export' / 'scene=scene' / 'part-0.parquet').num_rows == 2
+
+    pyogrio = pytest.importorskip("pyogrio")
+    assert export_detections(str(results), str(tmp_path / 'detections.gpkg'), batch_rows=1) == 2
+    info = pyogrio.read_info(str(tmp_path / 'detections.gpkg'))
+    assert info['features'] == 2 and info['geometry_type'] == 'Polygon'